@@ -0,0 +1,458 @@
+"""
+OCR用のHTTP API（ASGIアプリケーション）
+ブラウザを介さずに画像を送信して文字起こし結果をJSONで受け取るためのエンドポイント
+
+起動方法:
+    uvicorn api.ocr:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import base64
+import binascii
+import io
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+from PIL import Image
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+# 現在のディレクトリをPythonパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import (
+    APP_NAME,
+    APP_VERSION,
+    DUPLICATE_DETECTION_ENABLED,
+    DUPLICATE_REUSE_RESULT,
+    GEMINI_API_KEY,
+    JOB_POLL_INTERVAL,
+    MAX_FILE_SIZE,
+    MODEL_WARM_UP,
+    OCR_API_TOKEN,
+    OCR_ENGINES,
+    SUPPORTED_LANGUAGES,
+)
+from document_processor import DocumentOCRProcessor, is_multipage_document, render_first_page, stitch_pages
+from structured_ocr import merge_page_results
+from duplicate_index import perceptual_hash
+from job_queue import FINISHED_STATUSES, get_job_queue, start_job_workers
+from metrics import render_metrics
+from model_pool import warm_up_in_background
+from ocr_processor import OCRProcessor
+from uploads import detect_format
+from utils import find_similar_history, save_to_history
+
+logger = logging.getLogger(__name__)
+
+
+# リクエスト本文の上限のうち、画像以外（オプションやmultipartの区切りなど）の分
+_BODY_OVERHEAD = 64 * 1024
+
+
+class APIError(Exception):
+    """HTTPステータス付きのエラー"""
+    
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def _parse_bool(value, default: bool) -> bool:
+    if value is None or value == "":
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes", "on")
+
+
+def _resolve_language(value) -> str:
+    """言語の表示名（"日本語"）またはコード（"japanese"）を言語コードに変換"""
+    if not value:
+        return SUPPORTED_LANGUAGES["自動検出"]
+    if value in SUPPORTED_LANGUAGES:
+        return SUPPORTED_LANGUAGES[value]
+    if value in SUPPORTED_LANGUAGES.values():
+        return value
+    raise APIError(400, f"サポートされていない言語です: {value}")
+
+
+def _resolve_engine(value) -> str:
+    """エンジンの表示名またはモデル名をモデル名に変換"""
+    if not value:
+        return next(iter(OCR_ENGINES.values()))
+    if value in OCR_ENGINES:
+        return OCR_ENGINES[value]
+    if value in OCR_ENGINES.values():
+        return value
+    raise APIError(400, f"サポートされていないエンジンです: {value}")
+
+
+def _too_large() -> APIError:
+    return APIError(413, f"ファイルサイズが上限（{MAX_FILE_SIZE}バイト）を超えています")
+
+
+def _max_body_size(content_type: str) -> int:
+    """リクエスト本文の上限（JSONは画像をbase64にした分、どちらもオプションや区切りの分の余裕を含む）"""
+    image_size = -(-MAX_FILE_SIZE // 3) * 4 if content_type.startswith("application/json") else MAX_FILE_SIZE
+    return image_size + _BODY_OVERHEAD
+
+
+async def _read_body(request: Request, limit: int) -> bytes:
+    """本文を上限まで読み込む（Content-Lengthのない送信も、上限を超えた時点で読むのをやめる）"""
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise _too_large()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def _read_request(request: Request):
+    """multipart/form-data または JSON から画像とオプションを取得"""
+    content_type = request.headers.get("content-type", "")
+    # 大きすぎる本文は読み込む前（base64のデコードやフォームの解析の前）に断る
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > _max_body_size(content_type):
+        raise _too_large()
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise APIError(400, "fileフィールドに画像ファイルを指定してください")
+        image_data = await upload.read()
+        image_name = upload.filename or "upload"
+        options = dict(form)
+    elif content_type.startswith("application/json"):
+        body = await _read_body(request, _max_body_size(content_type))
+        try:
+            options = json.loads(body)
+        except ValueError:
+            raise APIError(400, "JSONとして解析できません")
+        if not isinstance(options, dict):
+            raise APIError(400, "JSONのオブジェクトで送信してください")
+        if not isinstance(options.get("image"), str):
+            raise APIError(400, "imageにはbase64エンコードされた画像を文字列で指定してください")
+        if len(options["image"]) // 4 * 3 > MAX_FILE_SIZE:
+            raise _too_large()
+        try:
+            image_data = base64.b64decode(options["image"], validate=True)
+        except (ValueError, binascii.Error):
+            raise APIError(400, "imageにはbase64エンコードされた画像を指定してください")
+        image_name = options.get("image_name") or "upload"
+        if not isinstance(image_name, str):
+            raise APIError(400, "image_nameには文字列を指定してください")
+    else:
+        raise APIError(415, "multipart/form-data または application/json で送信してください")
+    
+    if not image_data:
+        raise APIError(400, "画像が空です")
+    if len(image_data) > MAX_FILE_SIZE:
+        raise _too_large()
+    if detect_format(image_data) is None:
+        raise APIError(415, "画像ファイルとして認識できません（対応形式: JPEG, PNG, GIF, BMP, TIFF, WEBP, PDF）")
+    return image_name, image_data, options
+
+
+def _run_ocr(image_name: str, image_data: bytes, model_name: str, language_hint: str,
+             auto_rotate: bool, table_recognition: bool, save_history: bool,
+             reuse_duplicate: bool = False, structured: bool = False) -> dict:
+    """
+    OCR処理を実行して結果を辞書で返す（スレッドプールで実行）
+    
+    reuse_duplicate が有効で、似た画像（同じ文書の再スキャンなど）が履歴にある場合は
+    Gemini APIを呼び出さずにその結果を返す。structured が有効な場合は構造化出力（ブロック・行・
+    位置・信頼度・表のセル）を structured に含める（複数ページ文書では文書全体をまとめたものと、
+    pages にページごとのもの）
+    """
+    started = time.perf_counter()
+    image_phash = None
+    
+    if is_multipage_document(image_name, image_data):
+        results = list(DocumentOCRProcessor(model_name, structured=structured).process(
+            image_data,
+            language_hint=language_hint,
+            auto_rotate=auto_rotate,
+            table_recognition=table_recognition
+        ))
+        text, confidence = stitch_pages(results)
+        body = {
+            "text": text,
+            "confidence": confidence,
+            "pages": sorted(results, key=lambda result: result["page"])
+        }
+        if structured:
+            body["structured"] = merge_page_results(results)
+        history_image = render_first_page(image_data) if save_history else b""
+    else:
+        try:
+            image = Image.open(io.BytesIO(image_data))
+            image.load()
+        except OSError:
+            raise APIError(415, "画像ファイルとして読み込めませんでした")
+        
+        duplicate = None
+        if DUPLICATE_DETECTION_ENABLED:
+            image_phash = perceptual_hash(image)
+            similar = find_similar_history(image_phash)
+            duplicate = similar[0] if similar else None
+        
+        if reuse_duplicate and duplicate:
+            text, confidence = duplicate["ocr_result"], duplicate.get("confidence", 0.0)
+            body = {"text": text, "confidence": confidence, "reused_duplicate": True}
+        else:
+            processor = OCRProcessor(model_name, structured=structured)
+            text, confidence = processor.process_image_bytes(
+                image_data,
+                language_hint=language_hint,
+                auto_rotate=auto_rotate,
+                table_recognition=table_recognition,
+                image=image
+            )
+            body = {
+                "text": text,
+                "confidence": confidence,
+                "cache_hit": processor.last_run_info.get("cache_hit", False),
+                "no_text": processor.last_run_info.get("no_text", False),
+                "preprocess": processor.last_run_info.get("preprocess")
+            }
+            if structured:
+                body["structured"] = processor.last_run_info.get("structured")
+            if processor.last_run_info.get("tiles"):
+                body["tiles"] = processor.last_run_info["tiles"]
+                body["tile_errors"] = processor.last_run_info["tile_errors"]
+        if duplicate:
+            body["duplicate_of"] = {
+                "id": duplicate["id"],
+                "image_name": duplicate["image_name"],
+                "timestamp": duplicate["timestamp"],
+                "distance": duplicate["distance"]
+            }
+        history_image = image_data
+    
+    if save_history:
+        body["saved_to_history"] = save_to_history(image_name, history_image, text, confidence,
+                                                   perceptual_hash=image_phash)
+    
+    body.update({
+        "image_name": image_name,
+        "model": model_name,
+        "language": language_hint,
+        "elapsed_ms": (time.perf_counter() - started) * 1000
+    })
+    return body
+
+
+def _parse_options(options: dict) -> dict:
+    """リクエストのオプションをOCR処理の引数に変換"""
+    return {
+        "model_name": _resolve_engine(options.get("engine")),
+        "language_hint": _resolve_language(options.get("language")),
+        "auto_rotate": _parse_bool(options.get("auto_rotate"), True),
+        "table_recognition": _parse_bool(options.get("table_recognition"), False),
+        "save_history": _parse_bool(options.get("save_history"), False)
+    }
+
+
+def _check_auth(request: Request):
+    if OCR_API_TOKEN and request.headers.get("authorization") != f"Bearer {OCR_API_TOKEN}":
+        raise APIError(401, "認証に失敗しました")
+
+
+async def ocr(request: Request) -> JSONResponse:
+    """画像をOCR処理（POST /api/ocr）"""
+    try:
+        _check_auth(request)
+        image_name, image_data, options = await _read_request(request)
+        body = await run_in_threadpool(
+            _run_ocr, image_name, image_data, **_parse_options(options),
+            reuse_duplicate=_parse_bool(options.get("reuse_duplicate"), DUPLICATE_REUSE_RESULT),
+            structured=_parse_bool(options.get("structured"), False)
+        )
+        return JSONResponse(body)
+    except APIError as e:
+        return JSONResponse({"error": e.message}, status_code=e.status_code)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=502)
+
+
+def _job_store_error(e: Exception) -> JSONResponse:
+    """ジョブの保存先（SQLite）の読み書きに失敗した場合の応答（"database is locked" など）"""
+    logger.warning("ジョブの保存先へのアクセスに失敗しました: %s", e)
+    return JSONResponse({"error": f"ジョブの保存先へのアクセスに失敗しました: {e}"}, status_code=500)
+
+
+async def submit_job(request: Request) -> JSONResponse:
+    """OCRジョブを登録（POST /api/jobs）結果は GET /api/jobs/{job_id} で取得する"""
+    try:
+        _check_auth(request)
+        image_name, image_data, options = await _read_request(request)
+        parsed = _parse_options(options)
+        # バックグラウンド処理では結果を履歴に残すのが既定
+        parsed["save_history"] = _parse_bool(options.get("save_history"), True)
+        job_id = await run_in_threadpool(get_job_queue().submit, image_name, image_data,
+                                         batch_id=options.get("batch_id"), **parsed)
+        return JSONResponse(
+            {"job_id": job_id, "status": "queued", "url": f"/api/jobs/{job_id}"},
+            status_code=202
+        )
+    except APIError as e:
+        return JSONResponse({"error": e.message}, status_code=e.status_code)
+    except Exception as e:
+        return _job_store_error(e)
+
+
+async def list_jobs(request: Request) -> JSONResponse:
+    """ジョブの一覧（GET /api/jobs?batch_id=&status=&limit=）"""
+    try:
+        _check_auth(request)
+        limit = min(int(request.query_params.get("limit", 50)), 500)
+    except APIError as e:
+        return JSONResponse({"error": e.message}, status_code=e.status_code)
+    except ValueError:
+        return JSONResponse({"error": "limitには数値を指定してください"}, status_code=400)
+    try:
+        jobs = await run_in_threadpool(
+            get_job_queue().list_jobs,
+            limit=limit,
+            batch_id=request.query_params.get("batch_id"),
+            status=request.query_params.get("status")
+        )
+    except Exception as e:
+        return _job_store_error(e)
+    return JSONResponse({"jobs": jobs})
+
+
+async def get_job(request: Request) -> JSONResponse:
+    """
+    ジョブの状態と結果（GET /api/jobs/{job_id}）
+
+    ?wait=秒数 を指定すると、ジョブが終了するかその秒数（最大60秒）が経過するまで応答を待つ
+    """
+    try:
+        _check_auth(request)
+        wait = min(float(request.query_params.get("wait", 0)), 60.0)
+    except APIError as e:
+        return JSONResponse({"error": e.message}, status_code=e.status_code)
+    except ValueError:
+        return JSONResponse({"error": "waitには秒数を指定してください"}, status_code=400)
+    
+    job_id = request.path_params["job_id"]
+    deadline = time.monotonic() + wait
+    try:
+        queue = get_job_queue()
+        while True:
+            job = await run_in_threadpool(queue.get, job_id)
+            if job is None:
+                return JSONResponse({"error": "ジョブが見つかりません"}, status_code=404)
+            remaining = deadline - time.monotonic()
+            if job["status"] in FINISHED_STATUSES or remaining <= 0:
+                return JSONResponse(job)
+            await asyncio.sleep(min(JOB_POLL_INTERVAL, remaining))
+    except Exception as e:
+        return _job_store_error(e)
+
+
+async def cancel_job(request: Request) -> JSONResponse:
+    """ジョブをキャンセル（DELETE /api/jobs/{job_id}）"""
+    try:
+        _check_auth(request)
+    except APIError as e:
+        return JSONResponse({"error": e.message}, status_code=e.status_code)
+    job_id = request.path_params["job_id"]
+    try:
+        queue = get_job_queue()
+        if not await run_in_threadpool(queue.cancel, job_id):
+            job = await run_in_threadpool(queue.get, job_id)
+            if job is None:
+                return JSONResponse({"error": "ジョブが見つかりません"}, status_code=404)
+            return JSONResponse({"error": f"終了済みのジョブはキャンセルできません（{job['status']}）"},
+                                status_code=409)
+    except Exception as e:
+        return _job_store_error(e)
+    return JSONResponse({"job_id": job_id, "status": "cancelled"})
+
+
+async def index(request: Request) -> JSONResponse:
+    """APIの概要（GET /）"""
+    return JSONResponse({
+        "app": APP_NAME,
+        "version": APP_VERSION,
+        "endpoints": [
+            "POST /api/ocr",
+            "POST /api/jobs",
+            "GET /api/jobs",
+            "GET /api/jobs/{job_id}",
+            "DELETE /api/jobs/{job_id}",
+            "GET /api/health",
+            "GET /api/engines",
+            "GET /api/languages",
+            "GET /metrics"
+        ]
+    })
+
+
+async def health(request: Request) -> JSONResponse:
+    """稼働確認（GET /api/health）"""
+    return JSONResponse({
+        "status": "ok",
+        "app": APP_NAME,
+        "version": APP_VERSION,
+        "api_key_configured": bool(GEMINI_API_KEY)
+    })
+
+
+async def metrics(request: Request) -> PlainTextResponse:
+    """メトリクス（GET /metrics, /api/metrics）Prometheusのテキスト形式"""
+    try:
+        _check_auth(request)
+    except APIError as e:
+        return PlainTextResponse(e.message, status_code=e.status_code)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+async def engines(request: Request) -> JSONResponse:
+    """利用可能なOCRエンジン（GET /api/engines）"""
+    return JSONResponse(OCR_ENGINES)
+
+
+async def languages(request: Request) -> JSONResponse:
+    """サポートされている言語（GET /api/languages）"""
+    return JSONResponse(SUPPORTED_LANGUAGES)
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    """起動時にモデルとAPIクライアントの準備（バックグラウンド）とジョブのワーカーを開始"""
+    if GEMINI_API_KEY:
+        if MODEL_WARM_UP:
+            warm_up_in_background(OCR_ENGINES.values())
+        await run_in_threadpool(start_job_workers)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/", index, methods=["GET"]),
+        Route("/api/ocr", ocr, methods=["POST"]),
+        Route("/api/jobs", submit_job, methods=["POST"]),
+        Route("/api/jobs", list_jobs, methods=["GET"]),
+        Route("/api/jobs/{job_id}", get_job, methods=["GET"]),
+        Route("/api/jobs/{job_id}", cancel_job, methods=["DELETE"]),
+        Route("/api/health", health, methods=["GET"]),
+        Route("/api/metrics", metrics, methods=["GET"]),
+        Route("/metrics", metrics, methods=["GET"]),
+        Route("/api/engines", engines, methods=["GET"]),
+        Route("/api/languages", languages, methods=["GET"]),
+    ],
+    lifespan=lifespan
+)
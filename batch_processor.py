@@ -0,0 +1,146 @@
+"""
+一括OCR処理
+複数画像（ZIPを含む）を並列数を制限したワーカープールでGemini APIに送信する
+"""
+import io
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from config import BATCH_MAX_FILES, BATCH_MAX_WORKERS, MAX_FILE_SIZE, SUPPORTED_FORMATS
+from ocr_processor import OCRProcessor
+from uploads import detect_format
+
+
+def _is_supported_image(name: str) -> bool:
+    """拡張子がサポート対象の画像形式か判定"""
+    extension = os.path.splitext(name)[1].lower().lstrip(".")
+    return extension in SUPPORTED_FORMATS
+
+
+def expand_uploads(files: Iterable[Tuple[str, bytes]]) -> Tuple[List[Tuple[str, bytes]], List[str]]:
+    """
+    アップロードされたファイルを画像単位に展開（ZIPは中の画像を取り出す）
+    
+    Args:
+        files: (ファイル名, バイト列) のリスト
+    
+    Returns:
+        Tuple[List[Tuple[str, bytes]], List[str]]: (画像の一覧, スキップしたファイルの警告)
+    """
+    images = []
+    warnings = []
+    
+    for name, data in files:
+        if name.lower().endswith(".zip"):
+            try:
+                with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir() or os.path.basename(info.filename).startswith("."):
+                            continue
+                        if not _is_supported_image(info.filename):
+                            warnings.append(f"{name}/{info.filename}: サポートされていないファイル形式です")
+                            continue
+                        if info.file_size > MAX_FILE_SIZE:
+                            warnings.append(f"{name}/{info.filename}: ファイルサイズが上限を超えています")
+                            continue
+                        data = archive.read(info)
+                        if detect_format(data) is None:
+                            warnings.append(f"{name}/{info.filename}: 画像ファイルとして認識できません")
+                            continue
+                        images.append((f"{name}/{info.filename}", data))
+            except zipfile.BadZipFile:
+                warnings.append(f"{name}: ZIPファイルを読み込めませんでした")
+        elif not _is_supported_image(name):
+            warnings.append(f"{name}: サポートされていないファイル形式です")
+        elif len(data) > MAX_FILE_SIZE:
+            warnings.append(f"{name}: ファイルサイズが上限を超えています")
+        elif detect_format(data) is None:
+            # 拡張子だけでなく先頭のバイト列でも形式を確認する
+            warnings.append(f"{name}: 画像ファイルとして認識できません")
+        else:
+            images.append((name, data))
+    
+    if len(images) > BATCH_MAX_FILES:
+        warnings.append(f"画像が多すぎるため先頭の{BATCH_MAX_FILES}件のみ処理します")
+        images = images[:BATCH_MAX_FILES]
+    
+    return images, warnings
+
+
+class BatchOCRProcessor:
+    """複数画像を並列にOCR処理するクラス"""
+    
+    def __init__(self, model_name: str = None, max_workers: int = BATCH_MAX_WORKERS):
+        self.model_name = model_name
+        self.max_workers = max(1, max_workers)
+        # ワーカースレッドごとにOCRProcessorを再利用する
+        self._local = threading.local()
+    
+    def _get_processor(self) -> OCRProcessor:
+        processor = getattr(self._local, "processor", None)
+        if processor is None:
+            processor = OCRProcessor(self.model_name)
+            self._local.processor = processor
+        return processor
+    
+    def _process_one(self, index: int, name: str, image_data: bytes, language_hint: str,
+                     auto_rotate: bool, table_recognition: bool) -> Dict:
+        """1枚の画像を処理して結果を辞書で返す（例外は結果に格納）"""
+        started = time.perf_counter()
+        result = {
+            "index": index,
+            "name": name,
+            "ocr_result": "",
+            "confidence": 0.0,
+            "cache_hit": False,
+            "no_text": False,
+            "error": None
+        }
+        try:
+            processor = self._get_processor()
+            ocr_result, confidence = processor.process_image_bytes(
+                image_data,
+                language_hint=language_hint,
+                auto_rotate=auto_rotate,
+                table_recognition=table_recognition
+            )
+            result["ocr_result"] = ocr_result
+            result["confidence"] = confidence
+            result["cache_hit"] = processor.last_run_info.get("cache_hit", False)
+            result["no_text"] = processor.last_run_info.get("no_text", False)
+        except Exception as e:
+            result["error"] = str(e)
+        result["elapsed"] = time.perf_counter() - started
+        return result
+    
+    def process(self, images: List[Tuple[str, bytes]], language_hint: str = "日本語",
+                auto_rotate: bool = True, table_recognition: bool = False) -> Iterator[Dict]:
+        """
+        画像を並列に処理し、完了した順に結果を返す
+        
+        Args:
+            images: (ファイル名, バイト列) のリスト
+            language_hint: 言語ヒント
+            auto_rotate: 自動回転の有効/無効
+            table_recognition: テーブル認識の有効/無効
+        
+        Yields:
+            Dict: index, name, ocr_result, confidence, cache_hit, no_text, error, elapsed を含む結果
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch-ocr") as executor:
+            futures = [
+                executor.submit(self._process_one, index, name, data,
+                                language_hint, auto_rotate, table_recognition)
+                for index, (name, data) in enumerate(images)
+            ]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                # 途中で中断された場合は未着手のリクエストを送らない
+                for future in futures:
+                    future.cancel()
@@ -0,0 +1,125 @@
+"""
+Gemini APIの代替（ベンチマーク用）
+google.generativeai.GenerativeModel と同じ呼び出し方で、遅延・エラー・ストリーミングを再現する
+"""
+import random
+import threading
+import time
+from typing import Iterator, List, Optional
+
+from google.api_core import exceptions as api_exceptions
+from google.generativeai.types import BlockedPromptException
+
+from prompts import estimate_tokens
+
+DEFAULT_TEXT = (
+    "請求書\n"
+    "株式会社サンプル 御中\n"
+    "品目: 画像OCRサービス利用料 数量: 1 単価: 12,000円\n"
+    "合計金額: 13,200円（税込）\n"
+    "[信頼度: 高]"
+)
+
+
+class FakeResponse:
+    """generate_content() の応答（text属性のみ）"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeCountTokensResponse:
+    """count_tokens() の応答（total_tokens属性のみ）"""
+
+    def __init__(self, total_tokens: int):
+        self.total_tokens = total_tokens
+
+
+class FakeStreamResponse:
+    """stream=True の応答（チャンクを一定間隔で返す）"""
+
+    def __init__(self, chunks: List[str], chunk_interval: float):
+        self._chunks = chunks
+        self._chunk_interval = chunk_interval
+
+    def __iter__(self) -> Iterator[FakeResponse]:
+        for chunk in self._chunks:
+            time.sleep(self._chunk_interval)
+            yield FakeResponse(chunk)
+
+
+class FakeGenerativeModel:
+    """
+    ネットワークを使わずに応答するGenerativeModelの代替
+
+    Args:
+        latency: 応答までの平均遅延（秒）
+        jitter: 遅延のばらつき（latencyに対する割合、0.2なら±20%）
+        error_rate: エラーを返す確率（0〜1）
+        error_kind: 返すエラーの種類（"429" / "500" / "blocked"）
+        text: 応答する文字列
+        stream_chunks: ストリーミング時の分割数
+        token_latency: 入力トークン（画像以外の文字列）1つあたりの追加の遅延（秒、プロンプトの長さの影響を再現）
+        seed: 乱数のシード
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, error_rate: float = 0.0,
+                 error_kind: str = "429", text: str = DEFAULT_TEXT, stream_chunks: int = 8,
+                 token_latency: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.text = text
+        self.stream_chunks = max(1, stream_chunks)
+        self.token_latency = token_latency
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _count_text_tokens(contents) -> int:
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        return sum(estimate_tokens(part) for part in parts if isinstance(part, str))
+
+    def count_tokens(self, contents) -> FakeCountTokensResponse:
+        """入力の文字列部分のトークン数（目安）を返す"""
+        return FakeCountTokensResponse(self._count_text_tokens(contents))
+
+    def _next_delay_and_error(self, contents=None):
+        input_delay = self.token_latency * self._count_text_tokens(contents) if self.token_latency else 0.0
+        with self._lock:
+            self.calls += 1
+            delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter)) + input_delay
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return max(0.0, delay), failed
+
+    def _make_error(self) -> Exception:
+        if self.error_kind == "blocked":
+            return BlockedPromptException("The prompt was blocked due to safety reasons")
+        if self.error_kind == "500":
+            return api_exceptions.InternalServerError("Internal error encountered.")
+        return api_exceptions.TooManyRequests("Resource has been exhausted (e.g. check quota).")
+
+    def _split(self) -> List[str]:
+        size = max(1, -(-len(self.text) // self.stream_chunks))
+        return [self.text[i:i + size] for i in range(0, len(self.text), size)]
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        """応答を生成（遅延後に文字列を返すか、エラーを送出）"""
+        delay, failed = self._next_delay_and_error(contents)
+        if not stream:
+            time.sleep(delay)
+            if failed:
+                raise self._make_error()
+            return FakeResponse(self.text)
+
+        # ストリーミングでは最初のチャンクまでに遅延の半分、残りをチャンク間で消費する
+        time.sleep(delay / 2)
+        if failed:
+            raise self._make_error()
+        chunks = self._split()
+        return FakeStreamResponse(chunks, delay / 2 / len(chunks))
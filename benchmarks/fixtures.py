@@ -0,0 +1,130 @@
+"""
+ベンチマーク用の合成データ
+文書風の画像（サイズ・形式違い）と、件数を指定した履歴データを生成する
+"""
+import base64
+import hashlib
+import io
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+# (ラベル, 幅, 高さ)
+IMAGE_SIZES = [
+    ("small", 640, 480),
+    ("medium", 1600, 1200),
+    ("large", 4000, 3000),
+]
+IMAGE_FORMATS = ["PNG", "JPEG", "WEBP"]
+
+_SAMPLE_WORDS = [
+    "請求書", "領収書", "合計", "金額", "株式会社", "品目", "数量", "単価", "税込", "お問い合わせ",
+    "invoice", "total", "amount", "date", "発行日", "支払期限", "備考", "東京都", "電話番号", "OCR",
+]
+
+
+def _sample_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_SAMPLE_WORDS) for _ in range(words))
+
+
+def make_document_image(width: int, height: int, seed: int = 0,
+                        lines: Optional[List[str]] = None) -> Image.Image:
+    """文字行と罫線を描いた文書風の画像を生成（linesを渡すと描いた文字行を追加する）"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (250, 250, 248))
+    draw = ImageDraw.Draw(image)
+    font_size = max(12, height // 40)
+    font = ImageFont.load_default(size=font_size)
+
+    y = font_size
+    while y < height - font_size * 2:
+        if rng.random() < 0.15:
+            # 表の罫線
+            draw.rectangle([font_size, y, width - font_size, y + font_size * 3], outline=(40, 40, 40))
+            y += font_size * 4
+            continue
+        text = _sample_text(rng, rng.randint(4, 12))
+        draw.text((font_size, y), text, fill=(20, 20, 20), font=font)
+        if lines is not None:
+            lines.append(text)
+        y += int(font_size * 1.6)
+
+    # スキャン画像のような軽いノイズ
+    for _ in range(width * height // 2000):
+        draw.point((rng.randrange(width), rng.randrange(height)), fill=(rng.randint(150, 220),) * 3)
+    return image
+
+
+def make_image_corpus(sizes: List[str] = None, formats: List[str] = None,
+                      seed: int = 0) -> List[Tuple[str, bytes]]:
+    """
+    サイズ・形式の組み合わせごとに画像を1枚ずつ生成
+
+    Returns:
+        List[Tuple[str, bytes]]: (ラベル, 画像ファイルのバイト列) のリスト（例: "medium.jpeg"）
+    """
+    corpus = []
+    for label, width, height in IMAGE_SIZES:
+        if sizes and label not in sizes:
+            continue
+        image = make_document_image(width, height, seed)
+        for image_format in formats or IMAGE_FORMATS:
+            buffered = io.BytesIO()
+            options = {"quality": 90} if image_format in ("JPEG", "WEBP") else {}
+            image.save(buffered, format=image_format, **options)
+            corpus.append((f"{label}.{image_format.lower()}", buffered.getvalue()))
+        image.close()
+    return corpus
+
+
+def make_text_corpus(sizes: List[str] = None, image_format: str = "PNG",
+                     seed: int = 0) -> List[Tuple[str, bytes, str]]:
+    """
+    OCR結果の正確さを比べるため、描いた文字列（正解）付きで画像を生成
+
+    Returns:
+        List[Tuple[str, bytes, str]]: (ラベル, 画像ファイルのバイト列, 正解の文字列) のリスト
+    """
+    corpus = []
+    for label, width, height in IMAGE_SIZES:
+        if sizes and label not in sizes:
+            continue
+        lines: List[str] = []
+        image = make_document_image(width, height, seed, lines)
+        buffered = io.BytesIO()
+        image.save(buffered, format=image_format)
+        image.close()
+        corpus.append((label, buffered.getvalue(), "\n".join(lines)))
+    return corpus
+
+
+def _thumbnail_sources(count: int = 16) -> List[bytes]:
+    """履歴データ用の小さな画像（同じ画像を複数の履歴で共有する）"""
+    sources = []
+    for i in range(count):
+        buffered = io.BytesIO()
+        make_document_image(320, 240, seed=i).save(buffered, format="JPEG", quality=80)
+        sources.append(buffered.getvalue())
+    return sources
+
+
+def iter_history_items(count: int, seed: int = 0) -> Iterator[Dict]:
+    """履歴項目を古い順に生成（画像はbase64で埋め込み、取り込み時にblobストアへ移される）"""
+    rng = random.Random(seed)
+    sources = _thumbnail_sources()
+    images = [base64.b64encode(data).decode() for data in sources]
+    hashes = [hashlib.sha256(data).hexdigest() for data in sources]
+    started = datetime(2024, 1, 1)
+    for i in range(count):
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "timestamp": (started + timedelta(seconds=i * 30)).isoformat(),
+            "image_name": f"scan_{i:06d}.jpg",
+            "image_data": images[i % len(images)],
+            "image_hash": hashes[i % len(hashes)],
+            "ocr_result": _sample_text(rng, rng.randint(20, 80)),
+            "confidence": rng.choice([0.3, 0.6, 0.7, 0.8, 0.9])
+        }
@@ -0,0 +1,145 @@
+"""
+起動時間（モジュールの読み込み時間）の計測
+新しいPythonプロセスで `python -X importtime` を実行し、エントリーポイントごとの読み込み時間と
+時間のかかっているパッケージを表示する（Vercelのコールドスタート・Streamlitの初回表示の目安）
+
+使い方:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --modules main --repeat 10 --top 15 --output import.json
+    python benchmarks/import_time.py --baseline import.json   # 前回の結果と比較
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+
+DEFAULT_MODULES = ["main", "api.ocr", "api.index"]
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """-X importtime の出力を (モジュール名, 自身の時間, 累積時間, 階層) のリストに変換"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # 見出し行
+        modules.append({
+            "module": name.strip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+            # 階層はモジュール名の前の空白2つごとに1段
+            "depth": (len(name) - len(name.lstrip(" ")) - 1) // 2
+        })
+    return modules
+
+
+def profile_module(module: str) -> Dict:
+    """新しいプロセスでモジュールを1回読み込み、プロセス全体の時間と読み込み時間の内訳を取得"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="0")
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise Exception(f"{module} の読み込みに失敗しました: {completed.stderr.strip().splitlines()[-1:]}")
+    modules = parse_importtime(completed.stderr)
+    target = next((m for m in reversed(modules) if m["module"] == module), None)
+    return {
+        "wall_ms": wall * 1000,
+        "import_ms": target["cumulative_ms"] if target else 0.0,
+        "modules": modules
+    }
+
+
+def top_packages(modules: List[Dict], top: int) -> List[Dict]:
+    """最上位のパッケージ（依存関係として最初に読み込まれたもの）を累積時間の長い順に取得"""
+    packages: Dict[str, float] = {}
+    for module in modules:
+        name = module["module"].split(".")[0]
+        if module["module"] == name:
+            packages[name] = max(packages.get(name, 0.0), module["cumulative_ms"])
+    ordered = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+    return [{"package": name, "cumulative_ms": ms} for name, ms in ordered[:top]]
+
+
+def run(module: str, repeat: int, top: int) -> Dict:
+    """読み込みをrepeat回繰り返して中央値を求める（内訳は中央値に最も近い回のもの）"""
+    # 1回目はバイトコードの作成などを含むため計測から除く
+    profile_module(module)
+    runs = [profile_module(module) for _ in range(repeat)]
+    import_median = statistics.median(r["import_ms"] for r in runs)
+    representative = min(runs, key=lambda r: abs(r["import_ms"] - import_median))
+    return {
+        "module": module,
+        "repeat": repeat,
+        "wall_p50_ms": statistics.median(r["wall_ms"] for r in runs),
+        "import_p50_ms": import_median,
+        "import_min_ms": min(r["import_ms"] for r in runs),
+        "top_packages": top_packages(representative["modules"], top)
+    }
+
+
+def print_result(result: Dict):
+    print(f"\n{result['module']}: 読み込み {result['import_p50_ms']:.0f}ms（最小 {result['import_min_ms']:.0f}ms）"
+          f" / プロセス全体 {result['wall_p50_ms']:.0f}ms（{result['repeat']}回の中央値）")
+    for package in result["top_packages"]:
+        print(f"  {package['package']:<32} {package['cumulative_ms']:>9.1f}ms")
+
+
+def compare_with_baseline(results: List[Dict], baseline_file: str):
+    """前回の結果との差分を表示"""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = {r["module"]: r for r in json.load(f)["results"]}
+
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "-"
+
+    print("\n前回の結果との比較:")
+    print(f"{'module':<20} {'import':>9} {'wall':>9}")
+    for result in results:
+        old = baseline.get(result["module"])
+        if old is None:
+            continue
+        print(f"{result['module']:<20} {change(result['import_p50_ms'], old['import_p50_ms']):>9} "
+              f"{change(result['wall_p50_ms'], old['wall_p50_ms']):>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="起動時間（モジュールの読み込み時間）の計測")
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES),
+                        help="計測するモジュール（カンマ区切り）")
+    parser.add_argument("--repeat", type=int, default=5, help="モジュールごとの計測回数")
+    parser.add_argument("--top", type=int, default=10, help="表示するパッケージ数")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比較する前回の結果（JSONファイル）")
+    args = parser.parse_args(argv)
+
+    modules = [module.strip() for module in args.modules.split(",") if module.strip()]
+    results = []
+    for module in modules:
+        result = run(module, max(1, args.repeat), args.top)
+        print_result(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n結果を保存しました: {args.output}")
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,550 @@
+"""
+OCRパイプラインのベンチマーク
+Gemini APIの代替（fake_gemini）と合成データ（fixtures）を使い、ネットワークなしで
+各処理段階のレイテンシ（p50/p95/p99）・スループット・ピークメモリを計測する
+
+使い方:
+    python benchmarks/run.py
+    python benchmarks/run.py --stages process,history --history-sizes 100,10000 --output result.json
+    python benchmarks/run.py --baseline result.json   # 前回の結果と比較
+
+計測段階:
+    preprocess      画像の前処理（縮小・再エンコード）
+    process         OCRProcessor.process_image_bytes（キャッシュなし）
+    stream          OCRProcessor.stream_image_bytes（最初のチャンクまでの時間も計測）
+    history         save_to_history / 履歴ページの読み込み / 全文検索（履歴件数ごと）
+    render          履歴ページの描画（streamlit.testing の AppTest を使用）
+    prompt          プロンプトの種類ごとの入力トークン数・レイテンシ・正確さ（A/Bテスト）
+
+プロンプトのA/Bテスト:
+    python benchmarks/run.py --stages prompt --token-latency 0.002
+    python benchmarks/run.py --stages prompt --gemini --count-tokens --iterations 3   # 実際のGemini APIで比較
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path[:0] = [ROOT_DIR, BENCH_DIR]
+
+ALL_STAGES = ["preprocess", "process", "stream", "history", "render", "prompt"]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """最近順位法によるパーセンタイル"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(stage: str, label: str, samples: List[float], wall: float, errors: int = 0,
+              peak_bytes: Optional[int] = None) -> Dict:
+    """計測結果（秒のリスト）を集計"""
+    return {
+        "stage": stage,
+        "label": label,
+        "n": len(samples),
+        "errors": errors,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "mean_ms": sum(samples) / len(samples) * 1000 if samples else 0.0,
+        "throughput": len(samples) / wall if wall > 0 else 0.0,
+        "peak_kib": peak_bytes / 1024 if peak_bytes is not None else None
+    }
+
+
+def measure(stage: str, label: str, func: Callable[[int], None], iterations: int,
+            concurrency: int = 1, warmup: int = 1, memory_iterations: int = 3) -> Dict:
+    """
+    処理を繰り返し実行して計測
+
+    Args:
+        func: 1回分の処理（引数は繰り返し番号）
+        iterations: 計測する回数
+        concurrency: 同時実行数（スループットの計測用）
+        warmup: 計測前に実行する回数
+        memory_iterations: tracemallocでピークメモリを計測する回数（時間計測とは別に実行）
+    """
+    # 計測中は処理内のデバッグ出力を表示しない
+    with contextlib.redirect_stdout(io.StringIO()):
+        samples, wall, errors, peak = _run_measurement(func, iterations, concurrency, warmup,
+                                                       memory_iterations)
+    result = summarize(stage, label, samples, wall, errors, peak)
+    _print_result(result)
+    return result
+
+
+def _run_measurement(func: Callable[[int], None], iterations: int, concurrency: int, warmup: int,
+                     memory_iterations: int):
+    for i in range(warmup):
+        try:
+            func(i)
+        except Exception:
+            pass
+
+    def timed(i: int) -> Tuple[float, bool]:
+        """1回分の処理時間と失敗したかどうか（失敗数は結果から数え、スレッド間で共有しない）"""
+        started = time.perf_counter()
+        try:
+            func(i)
+            failed = False
+        except Exception:
+            failed = True
+        return time.perf_counter() - started, failed
+
+    wall_started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(timed, range(iterations)))
+    else:
+        results = [timed(i) for i in range(iterations)]
+    wall = time.perf_counter() - wall_started
+    samples = [elapsed for elapsed, _ in results]
+    errors = sum(1 for _, failed in results if failed)
+
+    # tracemallocは処理を遅くするため、時間計測とは別に実行する
+    peak = None
+    if memory_iterations > 0:
+        tracemalloc.start()
+        try:
+            for i in range(memory_iterations):
+                try:
+                    func(i)
+                except Exception:
+                    pass
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return samples, wall, errors, peak
+
+
+def _print_header():
+    print(f"{'stage':<20} {'label':<18} {'n':>6} {'err':>5} {'p50 ms':>10} {'p95 ms':>10} "
+          f"{'p99 ms':>10} {'ops/s':>10} {'peak KiB':>10}")
+
+
+def _print_result(result: Dict):
+    peak = f"{result['peak_kib']:.0f}" if result["peak_kib"] is not None else "-"
+    print(f"{result['stage']:<20} {result['label']:<18} {result['n']:>6} {result['errors']:>5} "
+          f"{result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['p99_ms']:>10.2f} "
+          f"{result['throughput']:>10.1f} {peak:>10}")
+
+
+def _configure_environment(args):
+    """プロジェクトのモジュールを読み込む前に設定を環境変数で上書き"""
+    if args.gemini:
+        if not os.getenv("GEMINI_API_KEY"):
+            raise SystemExit("--gemini を指定する場合は GEMINI_API_KEY を設定してください")
+        # 実際のAPIを呼び出すためレート制限は設定どおりにする
+        args.rate_limit = True
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ["HISTORY_BACKEND"] = args.history_backend
+    os.environ["OCR_CACHE_BACKEND"] = "memory"
+    os.environ.setdefault("GEMINI_RETRY_BASE_DELAY", "0.01")
+    os.environ.setdefault("GEMINI_RETRY_MAX_DELAY", "0.1")
+    if not args.rate_limit:
+        # レート制限による待ち時間を計測に含めない
+        os.environ["GEMINI_RATE_LIMIT_RPM"] = "100000000"
+        os.environ["GEMINI_RATE_LIMIT_BURST"] = "100000"
+
+
+def _install_fake_model(args):
+    """全エンジンをGemini APIの代替に差し替え"""
+    from config import GEMINI_MODEL, OCR_ENGINES
+    from fake_gemini import FakeGenerativeModel
+    import model_pool
+
+    model = FakeGenerativeModel(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_kind=args.error_kind,
+        stream_chunks=args.stream_chunks,
+        token_latency=args.token_latency,
+        seed=args.seed
+    )
+    for model_name in set(OCR_ENGINES.values()) | {GEMINI_MODEL}:
+        model_pool.register_model(model_name, model)
+    return model
+
+
+def _use_history_dir(path: str, max_items: int):
+    """履歴・画像・検索インデックス・サムネイルの保存先を切り替える（相対パスのため作業ディレクトリを移動）"""
+    import blob_store
+    import duplicate_index
+    import history_store
+    import search_index
+    import thumbnails
+
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+    blob_store._store = None
+    history_store._store = None
+    search_index._index = None
+    duplicate_index._index = None
+    thumbnails._cache = None
+    history_store.get_history_store().max_items = max_items
+
+
+def _load_history_fixture(size: int, seed: int):
+    """指定件数の履歴と検索インデックス・似た画像のインデックスを作成"""
+    import duplicate_index
+    from fixtures import iter_history_items
+    from history_store import JSONHistoryStore, get_history_store
+    from search_index import get_search_index
+
+    store = get_history_store()
+    items = list(iter_history_items(size, seed))
+    if isinstance(store, JSONHistoryStore):
+        store.clear()
+    store.import_items(items)
+    index = get_search_index()
+    index.max_items = size
+    if index.count() == 0:
+        index.rebuild(items)
+    duplicates = duplicate_index.ImageDuplicateIndex(max_items=size)
+    if duplicates.count() == 0:
+        duplicates.rebuild(duplicate_index.iter_history_hashes(items))
+    duplicate_index._index = duplicates
+
+
+def run_preprocess(args, corpus) -> List[Dict]:
+    from PIL import Image
+    from image_preprocessor import ImagePreprocessor
+
+    results = []
+    preprocessor = ImagePreprocessor()
+    for label, data in corpus:
+        def run(i, data=data):
+            with Image.open(io.BytesIO(data)) as image:
+                preprocessor.process(image, data)
+        results.append(measure("preprocess", label, run, args.iterations,
+                               memory_iterations=args.memory_iterations))
+    return results
+
+
+def run_process(args, corpus) -> List[Dict]:
+    from ocr_processor import OCRProcessor
+
+    results = []
+    for label, data in corpus:
+        def run(i, data=data):
+            OCRProcessor().process_image_bytes(data, language_hint="japanese", use_cache=False,
+                                               tiling=args.tiling)
+        results.append(measure("process_image", label, run, args.iterations,
+                               concurrency=args.concurrency, memory_iterations=args.memory_iterations))
+    return results
+
+
+def run_stream(args, corpus) -> List[Dict]:
+    from ocr_processor import OCRProcessor
+
+    results = []
+    for label, data in corpus:
+        first_chunk = []
+
+        def run(i, data=data):
+            started = time.perf_counter()
+            for n, _ in enumerate(OCRProcessor().stream_image_bytes(data, language_hint="japanese",
+                                                                  use_cache=False, tiling=args.tiling)):
+                if n == 0:
+                    first_chunk.append(time.perf_counter() - started)
+
+        results.append(measure("stream_total", label, run, args.iterations,
+                               concurrency=args.concurrency, memory_iterations=0))
+        # 最初のチャンクまでの時間（ストリーミング表示の体感速度）
+        samples = first_chunk[-results[-1]["n"]:]
+        result = summarize("stream_first_chunk", label, samples, 0.0)
+        _print_result(result)
+        results.append(result)
+    return results
+
+
+def run_history(args, workdir: str, corpus) -> List[Dict]:
+    from config import HISTORY_PAGE_SIZE
+    from duplicate_index import get_duplicate_index, perceptual_hash_bytes
+    from utils import (get_history_items, get_history_thumbnail, load_history_page, count_history,
+                       save_to_history, search_history)
+
+    rng = random.Random(args.seed)
+    small_images = [data for label, data in corpus if label.startswith("small")]
+    small_images = small_images or [corpus[0][1]]
+    results = []
+    for size in args.history_sizes:
+        _use_history_dir(os.path.join(workdir, f"history_{args.history_backend}_{size}"), size)
+        started = time.perf_counter()
+        _load_history_fixture(size, args.seed)
+        print(f"  (履歴 {size}件の準備: {time.perf_counter() - started:.1f}秒)")
+        label = f"{args.history_backend}/{size}"
+
+        def save(i):
+            if not save_to_history(f"bench_{i}.jpg", small_images[i % len(small_images)],
+                                   "ベンチマーク 請求書 合計金額", 0.9):
+                raise Exception("履歴の保存に失敗しました")
+
+        # 画面と同じく前のページの最後の項目から次のページを読み込む（最後のページの次は先頭に戻る）
+        cursor = {"after": None}
+
+        def page(i):
+            count_history()
+            items = load_history_page(0, HISTORY_PAGE_SIZE, include_images=False, after=cursor["after"])
+            cursor["after"] = items[-1] if len(items) == HISTORY_PAGE_SIZE else None
+            for item in items:
+                get_history_thumbnail(item)
+
+        def search(i):
+            search_history(rng.choice(["請求書", "合計 金額", "invoice", "東京都", "税"]),
+                           limit=HISTORY_PAGE_SIZE)
+
+        # 似た画像の検索（保存済みの画像と一致するものと、一致しない乱数のハッシュを交互に）
+        known_hash = perceptual_hash_bytes(small_images[0])
+
+        def duplicate(i):
+            get_duplicate_index().find(known_hash if i % 2 == 0 else rng.getrandbits(64))
+
+        results.append(measure("history_save", label, save, args.iterations,
+                               memory_iterations=args.memory_iterations))
+        if args.concurrency > 1:
+            # 同時保存で履歴が失われないこと（保存した全件が読み出せること）も確認する
+            saved_ids = [f"bench-{size}-{i}" for i in range(args.iterations)]
+
+            def concurrent_save(i):
+                if not save_to_history(f"bench_{i}.jpg", small_images[i % len(small_images)],
+                                       "ベンチマーク 請求書 合計金額", 0.9, item_id=saved_ids[i]):
+                    raise Exception("履歴の保存に失敗しました")
+
+            results.append(measure("history_save_mt", f"{label} x{args.concurrency}", concurrent_save,
+                                   args.iterations, concurrency=args.concurrency, warmup=0,
+                                   memory_iterations=0))
+            found = len(get_history_items(saved_ids, include_images=False))
+            lost = min(len(saved_ids), size) - found
+            print(f"  (同時保存: {found}件を確認、欠落 {lost}件)")
+            results[-1]["lost"] = lost
+        results.append(measure("history_page", label, page, args.iterations,
+                               memory_iterations=args.memory_iterations))
+        results.append(measure("history_search", label, search, args.iterations,
+                               memory_iterations=args.memory_iterations))
+        results.append(measure("history_duplicate", label, duplicate, args.iterations,
+                               memory_iterations=args.memory_iterations))
+    return results
+
+
+def text_accuracy(expected: str, actual: str) -> float:
+    """正解との文字単位の一致率（空白の違いは無視する）"""
+    expected = "".join(expected.split())
+    actual = "".join(actual.split())
+    if not expected:
+        return 1.0 if not actual else 0.0
+    return SequenceMatcher(None, expected, actual, autojunk=False).ratio()
+
+
+def run_prompt(args) -> List[Dict]:
+    """プロンプトの種類ごとに同じ画像を処理し、入力トークン数・レイテンシ・正確さを比較"""
+    from config import GEMINI_MODEL
+    from fixtures import make_text_corpus
+    from ocr_processor import OCRProcessor
+    from prompts import count_prompt_tokens
+
+    corpus = make_text_corpus(args.sizes, seed=args.seed)
+    results = []
+    for variant in args.prompt_variants:
+        for table_recognition in (False, True):
+            tokens = count_prompt_tokens(variant, "japanese", table_recognition, GEMINI_MODEL,
+                                         use_api=args.count_tokens)
+            for label, data, expected in corpus:
+                scores = []
+
+                def run(i, data=data, expected=expected):
+                    text, _ = OCRProcessor(prompt_variant=variant).process_image_bytes(
+                        data, language_hint="japanese", table_recognition=table_recognition,
+                        use_cache=False, tiling=args.tiling, precheck=False
+                    )
+                    scores.append(text_accuracy(expected, text))
+
+                name = f"{variant}{'+tbl' if table_recognition else ''}/{label}"
+                results.append(measure("prompt", name, run, args.iterations,
+                                       concurrency=args.concurrency, memory_iterations=0))
+                results[-1]["prompt_tokens"] = tokens
+                results[-1]["accuracy"] = sum(scores) / len(scores) if scores else 0.0
+                print(f"  (入力トークン {tokens} / 正確さ {results[-1]['accuracy'] * 100:.1f}%)")
+    return results
+
+
+def _render_history_page(root_dir: str):
+    """AppTestで実行するスクリプト（履歴ページのみを描画）"""
+    import sys
+    if root_dir not in sys.path:
+        sys.path.insert(0, root_dir)
+    import main
+    main.show_history_page()
+
+
+def run_render(args, workdir: str) -> List[Dict]:
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("  streamlit.testing が利用できないため render をスキップします")
+        return []
+
+    results = []
+    for size in args.history_sizes:
+        _use_history_dir(os.path.join(workdir, f"history_{args.history_backend}_{size}"), size)
+        _load_history_fixture(size, args.seed)
+
+        def render(i):
+            app = AppTest.from_function(_render_history_page, args=(ROOT_DIR,))
+            app.run(timeout=120)
+            if app.exception:
+                raise Exception(app.exception[0].message)
+
+        # 描画のたびに出る非推奨APIの警告などを表示しない
+        logging.disable(logging.WARNING)
+        try:
+            results.append(measure("history_render", f"{args.history_backend}/{size}", render,
+                                   args.iterations, memory_iterations=0))
+        finally:
+            logging.disable(logging.NOTSET)
+    return results
+
+
+def compare_with_baseline(results: List[Dict], baseline_file: str):
+    """前回の結果との差分を表示（p50/p95は増加、スループットは減少が悪化）"""
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = {(r["stage"], r["label"]): r for r in json.load(f)["results"]}
+
+    def change(new: float, old: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "-"
+
+    print("\n前回の結果との比較:")
+    print(f"{'stage':<20} {'label':<18} {'p50':>9} {'p95':>9} {'ops/s':>9}")
+    for result in results:
+        old = baseline.get((result["stage"], result["label"]))
+        if old is None:
+            continue
+        print(f"{result['stage']:<20} {result['label']:<18} "
+              f"{change(result['p50_ms'], old['p50_ms']):>9} {change(result['p95_ms'], old['p95_ms']):>9} "
+              f"{change(result['throughput'], old['throughput']):>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="OCRパイプラインのベンチマーク")
+    parser.add_argument("--stages", default="preprocess,process,stream,history",
+                        help=f"計測する段階（カンマ区切り: {','.join(ALL_STAGES)}）")
+    parser.add_argument("--iterations", type=int, default=20, help="段階ごとの計測回数")
+    parser.add_argument("--memory-iterations", type=int, default=3, help="ピークメモリの計測回数（0で無効）")
+    parser.add_argument("--concurrency", type=int, default=1, help="process/streamの同時実行数")
+    parser.add_argument("--tiling", default="auto", choices=["auto", "on", "off"],
+                        help="process/streamでのタイル分割（autoは画像の大きさで判断）")
+    parser.add_argument("--sizes", default="small,medium,large", help="画像サイズ（small,medium,large）")
+    parser.add_argument("--formats", default="PNG,JPEG,WEBP", help="画像形式")
+    parser.add_argument("--history-sizes", default="100,10000,100000", help="履歴の件数（カンマ区切り）")
+    parser.add_argument("--history-backend", default="sqlite", choices=["json", "jsonl", "sqlite"])
+    parser.add_argument("--latency", type=float, default=0.5, help="Gemini代替の応答遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="応答遅延のばらつき（割合）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラーを返す確率")
+    parser.add_argument("--error-kind", default="429", choices=["429", "500", "blocked"])
+    parser.add_argument("--stream-chunks", type=int, default=8, help="ストリーミング時のチャンク数")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="Gemini代替での入力トークン1つあたりの追加の遅延（秒）")
+    parser.add_argument("--prompt-variants", default="standard,compact", help="promptで比較するプロンプトの種類")
+    parser.add_argument("--count-tokens", action="store_true",
+                        help="promptでのトークン数をモデルのcount_tokensで数える（省略時は目安）")
+    parser.add_argument("--gemini", action="store_true",
+                        help="Gemini APIの代替を使わず実際のAPIを呼び出す（GEMINI_API_KEYが必要）")
+    parser.add_argument("--rate-limit", action="store_true", help="設定どおりのレート制限を有効にする")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="履歴などを作成するディレクトリ（省略時は一時ディレクトリ）")
+    parser.add_argument("--output", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比較する前回の結果（JSONファイル）")
+    args = parser.parse_args(argv)
+
+    args.stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(args.stages) - set(ALL_STAGES)
+    if unknown:
+        parser.error(f"不明な段階です: {', '.join(sorted(unknown))}")
+    args.tiling = {"auto": None, "on": True, "off": False}[args.tiling]
+    args.sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    args.formats = [image_format.strip().upper() for image_format in args.formats.split(",") if image_format.strip()]
+    args.history_sizes = [int(size) for size in args.history_sizes.split(",") if size.strip()]
+    args.prompt_variants = [variant.strip() for variant in args.prompt_variants.split(",") if variant.strip()]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    _configure_environment(args)
+
+    # 出力ファイルのパスは作業ディレクトリを移動する前に解決しておく
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="ocr-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    original_dir = os.getcwd()
+    os.chdir(workdir)
+
+    from fixtures import make_image_corpus
+
+    model = None if args.gemini else _install_fake_model(args)
+    corpus = make_image_corpus(args.sizes, args.formats, args.seed)
+    print(f"画像: {', '.join(f'{label}({len(data) // 1024}KiB)' for label, data in corpus)}")
+    if model is None:
+        print(f"実際のGemini APIを使用 / 同時実行数{args.concurrency}\n")
+    else:
+        print(f"Gemini代替: 遅延{args.latency}秒 ±{args.jitter * 100:.0f}% / エラー率{args.error_rate * 100:.0f}%"
+              f"（{args.error_kind}）/ 同時実行数{args.concurrency}\n")
+
+    results = []
+    _print_header()
+    try:
+        if "preprocess" in args.stages:
+            results += run_preprocess(args, corpus)
+        if "process" in args.stages:
+            results += run_process(args, corpus)
+        if "stream" in args.stages:
+            results += run_stream(args, corpus)
+        if "history" in args.stages:
+            results += run_history(args, workdir, corpus)
+        if "render" in args.stages:
+            results += run_render(args, workdir)
+        if "prompt" in args.stages:
+            results += run_prompt(args)
+    finally:
+        os.chdir(original_dir)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    from rate_limiter import get_retry_stats
+    if model is not None:
+        print(f"\nGemini代替の呼び出し: {model.calls}回（エラー {model.errors}回） / リトライ統計: {get_retry_stats()}")
+    else:
+        print(f"\nリトライ統計: {get_retry_stats()}")
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({"args": {key: value for key, value in vars(args).items()}, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"結果を保存しました: {output}")
+
+    if baseline:
+        compare_with_baseline(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
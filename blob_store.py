@@ -0,0 +1,219 @@
+"""
+画像のblobストア
+画像のバイト列を内容ハッシュ（SHA-256）をキーに1回だけ保存し、参照数がなくなったら削除する
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, Optional
+
+from config import BLOB_DIR, BLOB_GC_GRACE_SECONDS
+
+
+def hash_bytes(data: bytes) -> str:
+    """バイト列の内容ハッシュ（blobのキー）を計算"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """
+    内容ハッシュをキーにしたファイルのストア
+
+    本体は <blob_dir>/<ハッシュの先頭2文字>/<ハッシュ> に保存し、参照数とサイズは
+    同じディレクトリのSQLite（index.db）で管理する。同じ画像を何度保存しても
+    ファイルは1つだけで、参照数が増えるだけになる。
+    on_remove を指定すると、blobを削除したときに内容ハッシュを渡して呼び出す
+    （同じハッシュで保存したサムネイルなどの派生ファイルを一緒に消すため）。
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        refs INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, blob_dir: str = BLOB_DIR, on_remove: Optional[Callable[[str], None]] = None):
+        self.blob_dir = blob_dir
+        self.on_remove = on_remove
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self.index_file = os.path.join(self.blob_dir, "index.db")
+        self._local = threading.local()
+        self._connect().executescript(self._SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_file, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _path(self, blob_hash: str) -> str:
+        return os.path.join(self.blob_dir, blob_hash[:2], blob_hash)
+
+    def _write_file(self, blob_hash: str, data: bytes):
+        path = self._path(blob_hash)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _remove_file(self, blob_hash: str):
+        try:
+            os.remove(self._path(blob_hash))
+        except OSError:
+            pass
+        if self.on_remove is not None:
+            self.on_remove(blob_hash)
+
+    def put(self, data: bytes, refs: int = 1) -> str:
+        """
+        バイト列を保存して参照を追加（同じ内容が保存済みなら参照数だけを増やす）
+
+        Args:
+            data: 保存するバイト列
+            refs: 追加する参照数
+
+        Returns:
+            str: 内容ハッシュ
+        """
+        blob_hash = hash_bytes(data)
+        conn = self._connect()
+        # 先に参照を登録してからファイルを書く（同時に参照が0になった側がファイルを消しても書き直される）
+        with conn:
+            conn.execute(
+                "INSERT INTO blobs (hash, size, refs, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(hash) DO UPDATE SET refs = refs + excluded.refs, updated_at = excluded.updated_at",
+                (blob_hash, len(data), refs, time.time())
+            )
+        try:
+            self._write_file(blob_hash, data)
+        except Exception:
+            self.release(blob_hash, refs)
+            raise
+        return blob_hash
+
+    def acquire(self, blob_hash: str, refs: int = 1) -> bool:
+        """保存済みのblobに参照を追加（存在しない場合はFalse）"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE blobs SET refs = refs + ?, updated_at = ? WHERE hash = ?",
+                (refs, time.time(), blob_hash)
+            )
+        return cursor.rowcount > 0
+
+    def release(self, blob_hash: Optional[str], refs: int = 1):
+        """参照を外し、参照がなくなったblobを削除"""
+        if blob_hash:
+            self.release_many([blob_hash] * refs)
+
+    def release_many(self, blob_hashes: Iterable[Optional[str]]):
+        """複数の参照をまとめて外す（同じハッシュが複数回含まれてもよい）"""
+        counts = Counter(blob_hash for blob_hash in blob_hashes if blob_hash)
+        if not counts:
+            return
+        conn = self._connect()
+        with conn:
+            for blob_hash, refs in counts.items():
+                # RETURNING（SQLite 3.35以降）は使わず、同じトランザクション内で更新後の値を読む
+                conn.execute("UPDATE blobs SET refs = refs - ? WHERE hash = ?", (refs, blob_hash))
+                row = conn.execute("SELECT refs FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+                if row is not None and row["refs"] <= 0:
+                    conn.execute("DELETE FROM blobs WHERE hash = ?", (blob_hash,))
+                    # 書き込みロックを持ったまま消すため、同時に同じ内容をputした側と競合しない
+                    self._remove_file(blob_hash)
+
+    def get(self, blob_hash: Optional[str]) -> Optional[bytes]:
+        """blobを取得（存在しない場合はNone）"""
+        if not blob_hash:
+            return None
+        try:
+            with open(self._path(blob_hash), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def stats(self) -> Dict:
+        """保存中のblob数・合計サイズ（バイト）・参照数"""
+        row = self._connect().execute(
+            "SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS bytes, COALESCE(SUM(refs), 0) AS refs FROM blobs"
+        ).fetchone()
+        return {"blobs": row["blobs"], "bytes": row["bytes"], "refs": row["refs"]}
+
+    def collect_garbage(self, references: Dict[str, int],
+                        grace_seconds: float = BLOB_GC_GRACE_SECONDS) -> int:
+        """
+        参照数を実際の参照元に合わせて修正し、参照されていないblobを削除
+
+        保存処理の中断などで参照数がずれた場合の修復用。保存中の履歴と競合しないよう、
+        直近grace_seconds秒以内に参照が追加されたblobと書き込み中のファイルは対象外とする。
+
+        Args:
+            references: 内容ハッシュごとの参照数（履歴ストアの image_references()）
+            grace_seconds: 対象外とする直近の秒数
+
+        Returns:
+            int: 削除したblob・ファイルの数
+        """
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT hash, refs FROM blobs WHERE updated_at < ?", (cutoff,)
+            ).fetchall()
+            for row in rows:
+                refs = references.get(row["hash"], 0)
+                if refs <= 0:
+                    conn.execute("DELETE FROM blobs WHERE hash = ?", (row["hash"],))
+                    self._remove_file(row["hash"])
+                    removed += 1
+                elif refs != row["refs"]:
+                    conn.execute("UPDATE blobs SET refs = ? WHERE hash = ?", (refs, row["hash"]))
+            known = {row["hash"] for row in conn.execute("SELECT hash FROM blobs")}
+
+        # 参照数の管理外になったファイル（書き込み途中で中断した一時ファイルなど）
+        for entry in os.scandir(self.blob_dir):
+            if not entry.is_dir() or len(entry.name) != 2:
+                continue
+            for blob_file in os.scandir(entry.path):
+                if blob_file.name in known:
+                    continue
+                try:
+                    if blob_file.stat().st_mtime < cutoff:
+                        os.remove(blob_file.path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+_store: Optional[BlobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """プロセス共通のblobストアを取得"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from thumbnails import get_thumbnail_cache
+
+                # 履歴画像のサムネイルは内容ハッシュをキーにしているため、画像と一緒に削除する
+                _store = BlobStore(on_remove=lambda blob_hash: get_thumbnail_cache().remove(blob_hash))
+    return _store
@@ -7,10 +7,13 @@ load_dotenv()
 # Google Gemini API設定
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+# 起動時にバックグラウンドでモデルとAPIクライアントを準備する（falseの場合は最初のOCR処理時に準備）
+MODEL_WARM_UP = os.getenv("MODEL_WARM_UP", "true").lower() == "true"
 
 # アプリケーション設定
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", 10485760))  # 10MB in bytes
 SUPPORTED_FORMATS = os.getenv("SUPPORTED_FORMATS", "jpg,jpeg,png,gif,bmp,tiff").split(",")
+SESSION_MAX_RESULTS = int(os.getenv("SESSION_MAX_RESULTS", 20))  # セッションに保持するOCR結果の件数（再実行時に再表示）
 
 # OCR設定
 SUPPORTED_LANGUAGES = {
@@ -44,5 +47,104 @@ APP_VERSION = "1.0.0"
 APP_DESCRIPTION = "画像内の文字列をGoogle Gemini APIで文字起こしするWebアプリケーション"
 
 # 履歴保存設定
-HISTORY_FILE = "ocr_history.json"
-MAX_HISTORY_ITEMS = 100
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite")  # sqlite / jsonl / json
+HISTORY_FILE = os.getenv("HISTORY_FILE", "ocr_history.json")
+HISTORY_JOURNAL_FILE = os.getenv("HISTORY_JOURNAL_FILE", "ocr_history.jsonl")
+HISTORY_JOURNAL_COMPACT_RATIO = float(os.getenv("HISTORY_JOURNAL_COMPACT_RATIO", 2.0))  # 行数が上限件数の何倍で書き直すか
+HISTORY_DB_FILE = os.getenv("HISTORY_DB_FILE", "ocr_history.db")
+MAX_HISTORY_ITEMS = int(os.getenv("MAX_HISTORY_ITEMS", 100))
+SEARCH_INDEX_FILE = os.getenv("SEARCH_INDEX_FILE", "ocr_search.db")
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 20))
+
+# 画像のblobストア設定（履歴の画像を内容ハッシュごとに1回だけ保存）
+BLOB_DIR = os.getenv("BLOB_DIR", "blobs")
+BLOB_GC_GRACE_SECONDS = int(os.getenv("BLOB_GC_GRACE_SECONDS", 10 * 60))  # 直近に追加された画像は整理の対象外
+
+# 似た画像（同じ文書の再スキャン・再撮影）の検出設定
+DUPLICATE_DETECTION_ENABLED = os.getenv("DUPLICATE_DETECTION_ENABLED", "true").lower() == "true"
+DUPLICATE_INDEX_FILE = os.getenv("DUPLICATE_INDEX_FILE", "ocr_duplicates.db")
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", 10))  # 64ビットの知覚ハッシュで似た画像とみなす距離
+DUPLICATE_REUSE_RESULT = os.getenv("DUPLICATE_REUSE_RESULT", "false").lower() == "true"  # 前回の結果を既定で再利用
+
+# サムネイル設定（履歴ページ用）
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "thumbnails")
+THUMBNAIL_MAX_SIDE = int(os.getenv("THUMBNAIL_MAX_SIDE", 256))
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "WEBP")  # WEBP / JPEG
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", 75))
+
+# OCR結果キャッシュ設定
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+OCR_CACHE_BACKEND = os.getenv("OCR_CACHE_BACKEND", "disk")  # disk / memory
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "ocr_cache")
+OCR_CACHE_MAX_ITEMS = int(os.getenv("OCR_CACHE_MAX_ITEMS", 1000))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", 7 * 24 * 60 * 60))  # 秒（デフォルト7日）
+
+# 一括処理設定
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", 4))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 500))
+
+# 画像前処理設定（Gemini APIへの送信前に縮小・再エンコード）
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_ENABLED", "true").lower() == "true"
+PREPROCESS_MAX_SIDE = int(os.getenv("PREPROCESS_MAX_SIDE", 2048))  # 長辺の最大ピクセル数
+PREPROCESS_MAX_DPI = int(os.getenv("PREPROCESS_MAX_DPI", 300))  # 解像度情報がある場合の上限
+PREPROCESS_GRAYSCALE = os.getenv("PREPROCESS_GRAYSCALE", "false").lower() == "true"
+PREPROCESS_FORMAT = os.getenv("PREPROCESS_FORMAT", "JPEG")  # JPEG / WEBP / PNG
+PREPROCESS_QUALITY = int(os.getenv("PREPROCESS_QUALITY", 85))
+
+# 白紙ページの事前判定（白紙・ほぼ白紙・単色の画像ではGemini APIを呼び出さない。文字のない写真は判定の対象外）
+TEXT_PRECHECK_ENABLED = os.getenv("TEXT_PRECHECK_ENABLED", "true").lower() == "true"
+TEXT_PRECHECK_MAX_SIDE = int(os.getenv("TEXT_PRECHECK_MAX_SIDE", 1024))  # 判定用に縮小する長辺のピクセル数
+TEXT_PRECHECK_EDGE_THRESHOLD = int(os.getenv("TEXT_PRECHECK_EDGE_THRESHOLD", 16))  # 輪郭とみなす隣接画素の明るさの差
+TEXT_PRECHECK_MIN_EDGE_PIXELS = int(os.getenv("TEXT_PRECHECK_MIN_EDGE_PIXELS", 20))  # これ未満なら文字なしと判定
+
+# 大きな画像のタイル分割OCR設定
+TILE_ENABLED = os.getenv("TILE_ENABLED", "true").lower() == "true"
+TILE_TRIGGER_SIDE = int(os.getenv("TILE_TRIGGER_SIDE", 4096))  # 長辺がこれを超える画像を分割する
+TILE_SIZE = int(os.getenv("TILE_SIZE", 1536))  # タイル1枚の最大辺（ピクセル）
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", 160))  # 隣り合うタイルの重なり（ピクセル、1行分以上）
+TILE_MAX_WORKERS = int(os.getenv("TILE_MAX_WORKERS", 4))  # 同時に処理するタイル数
+TILE_MAX_TILES = int(os.getenv("TILE_MAX_TILES", 48))  # 超える場合は画像全体を縮小してから分割
+
+# Gemini API呼び出しのリトライ・レート制限設定
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", 3))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", 1.0))  # 秒
+GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", 30.0))  # 秒
+GEMINI_RATE_LIMIT_RPM = int(os.getenv("GEMINI_RATE_LIMIT_RPM", 60))  # モデルごとの1分あたりのリクエスト数
+GEMINI_RATE_LIMIT_BURST = int(os.getenv("GEMINI_RATE_LIMIT_BURST", 5))
+GEMINI_RATE_LIMIT_MAX_WAIT = float(os.getenv("GEMINI_RATE_LIMIT_MAX_WAIT", 120.0))  # 秒
+
+# モデル別のレート制限（例: GEMINI_RATE_LIMITS="gemini-1.5-pro=30,gemini-2.0-flash=120"）
+MODEL_RATE_LIMITS = {model: GEMINI_RATE_LIMIT_RPM for model in OCR_ENGINES.values()}
+for _entry in filter(None, os.getenv("GEMINI_RATE_LIMITS", "").split(",")):
+    _model, _, _rpm = _entry.partition("=")
+    MODEL_RATE_LIMITS[_model.strip()] = int(_rpm)
+
+# OCRプロンプト設定（standard: 詳しい指示 / compact: 入力トークンを減らした簡潔な指示）
+OCR_PROMPT_VARIANT = os.getenv("OCR_PROMPT_VARIANT", "standard")
+
+# モデル別のプロンプト（例: OCR_PROMPT_VARIANTS="gemini-2.0-flash=compact,gemini-1.5-pro=standard"）
+MODEL_PROMPT_VARIANTS = {model: OCR_PROMPT_VARIANT for model in OCR_ENGINES.values()}
+for _entry in filter(None, os.getenv("OCR_PROMPT_VARIANTS", "").split(",")):
+    _model, _, _variant = _entry.partition("=")
+    MODEL_PROMPT_VARIANTS[_model.strip()] = _variant.strip()
+
+# 複数ページ文書（PDF / マルチフレームTIFF・GIF）設定
+DOCUMENT_MAX_WORKERS = int(os.getenv("DOCUMENT_MAX_WORKERS", 4))
+DOCUMENT_MAX_PAGES = int(os.getenv("DOCUMENT_MAX_PAGES", 200))
+DOCUMENT_RENDER_DPI = int(os.getenv("DOCUMENT_RENDER_DPI", 200))  # PDFをラスタライズする解像度
+
+# HTTP API設定
+OCR_API_TOKEN = os.getenv("OCR_API_TOKEN", "")  # 設定時はAuthorization: Bearer <token>を要求
+
+# バックグラウンドジョブ設定（永続キューとワーカープール）
+JOB_DB_FILE = os.getenv("JOB_DB_FILE", "ocr_jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))  # 0の場合はこのプロセスではジョブを処理しない
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))  # 秒
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 600))  # 秒（これを過ぎた実行中ジョブは再投入）
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", 7 * 24 * 60 * 60))  # 秒（完了済みジョブの保持期間）
+
+# メトリクス設定（処理段階ごとの所要時間など）
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_EXPORT_FILE = os.getenv("METRICS_EXPORT_FILE", "")  # 設定時は定期的にPrometheus形式で書き出す
+METRICS_EXPORT_INTERVAL = float(os.getenv("METRICS_EXPORT_INTERVAL", 15))  # 秒
@@ -0,0 +1,219 @@
+"""
+複数ページ文書のOCR処理
+PDFやマルチフレームTIFF/GIFを1ページずつ読み込み、並列数を制限してOCR処理した後、
+ページ順に結果を結合する
+"""
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Tuple
+
+from PIL import Image, ImageSequence
+
+from config import (
+    DOCUMENT_MAX_PAGES,
+    DOCUMENT_MAX_WORKERS,
+    DOCUMENT_RENDER_DPI,
+    OCR_CACHE_ENABLED,
+    PREPROCESS_ENABLED,
+    PREPROCESS_MAX_SIDE,
+)
+from ocr_cache import get_ocr_cache, make_cache_key
+from ocr_processor import OCRProcessor
+
+
+def is_pdf(data: bytes) -> bool:
+    """PDFファイルか判定"""
+    return data[:5] == b"%PDF-"
+
+
+def _open_pdf(data: bytes):
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise Exception("PDFを処理するにはpypdfium2をインストールしてください（pip install pypdfium2）")
+    return pdfium.PdfDocument(data)
+
+
+def count_pages(data: bytes) -> int:
+    """文書のページ数（フレーム数）を取得"""
+    if is_pdf(data):
+        document = _open_pdf(data)
+        try:
+            return len(document)
+        finally:
+            document.close()
+    with Image.open(io.BytesIO(data)) as image:
+        return getattr(image, "n_frames", 1)
+
+
+def is_multipage_document(file_name: str, data: bytes) -> bool:
+    """ページ単位で処理すべき文書（PDF・複数フレームの画像）か判定"""
+    if is_pdf(data):
+        return True
+    if os.path.splitext(file_name)[1].lower() not in (".tif", ".tiff", ".gif"):
+        return False
+    try:
+        return count_pages(data) > 1
+    except Exception:
+        return False
+
+
+def iter_document_pages(data: bytes, max_pages: int = DOCUMENT_MAX_PAGES) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    文書のページを1枚ずつ画像として返す（全ページを同時にメモリへ展開しない）
+    
+    Yields:
+        Tuple[int, Image.Image]: (0始まりのページ番号, ページ画像)
+    """
+    if is_pdf(data):
+        document = _open_pdf(data)
+        try:
+            for index in range(min(len(document), max_pages)):
+                page = document[index]
+                try:
+                    # 前処理で縮小される解像度を超えないよう、はじめから必要な大きさで描画する
+                    scale = DOCUMENT_RENDER_DPI / 72
+                    if PREPROCESS_ENABLED and PREPROCESS_MAX_SIDE > 0:
+                        scale = min(scale, PREPROCESS_MAX_SIDE / max(page.get_size()))
+                    bitmap = page.render(scale=scale)
+                    yield index, bitmap.to_pil()
+                finally:
+                    page.close()
+        finally:
+            document.close()
+        return
+    
+    with Image.open(io.BytesIO(data)) as image:
+        for index, frame in enumerate(ImageSequence.Iterator(image)):
+            if index >= max_pages:
+                break
+            # 次のフレームへ移動すると内容が変わるため、ここで複製する
+            yield index, frame.convert("RGB") if frame.mode == "P" else frame.copy()
+
+
+def render_first_page(data: bytes) -> bytes:
+    """先頭ページをPNGとして取得（プレビュー・履歴用）"""
+    for _, page_image in iter_document_pages(data, max_pages=1):
+        buffered = io.BytesIO()
+        page_image.save(buffered, format="PNG")
+        return buffered.getvalue()
+    return b""
+
+
+class DocumentOCRProcessor:
+    """複数ページ文書をページ並列でOCR処理するクラス"""
+    
+    def __init__(self, model_name: str = None, max_workers: int = DOCUMENT_MAX_WORKERS,
+                 structured: bool = False):
+        self.model_name = model_name
+        self.max_workers = max(1, max_workers)
+        # 構造化出力（JSON）モードではページごとの結果に structured を含める
+        self.structured = structured
+        self._local = threading.local()
+    
+    def _get_processor(self) -> OCRProcessor:
+        processor = getattr(self._local, "processor", None)
+        if processor is None:
+            processor = OCRProcessor(self.model_name, structured=self.structured)
+            self._local.processor = processor
+        return processor
+    
+    def _process_page(self, index: int, page_image: Image.Image, document_hash: str,
+                      language_hint: str, auto_rotate: bool, table_recognition: bool) -> Dict:
+        """1ページを処理して結果を辞書で返す（例外は結果に格納）"""
+        result = {"page": index + 1, "ocr_result": "", "confidence": 0.0, "cache_hit": False,
+                  "no_text": False, "error": None}
+        if self.structured:
+            result["structured"] = None
+        try:
+            processor = self._get_processor()
+            cache = get_ocr_cache() if OCR_CACHE_ENABLED else None
+            cache_key = None
+            if cache is not None:
+                # 文書のハッシュとページ番号をキーにページ単位でキャッシュする
+                page_key = f"{document_hash}#page={index}".encode()
+                cache_key = make_cache_key(page_key, processor.model_name, language_hint,
+                                           auto_rotate, table_recognition, processor.cache_variant(False))
+                cached = cache.get_entry(cache_key)
+                if cached is not None:
+                    result["ocr_result"], result["confidence"] = cached["ocr_result"], cached["confidence"]
+                    result["cache_hit"] = True
+                    if self.structured:
+                        result["structured"] = cached.get("structured")
+                    return result
+            
+            ocr_result, confidence = processor.process_image(
+                page_image,
+                language_hint=language_hint,
+                auto_rotate=auto_rotate,
+                table_recognition=table_recognition
+            )
+            result["ocr_result"] = ocr_result
+            result["confidence"] = confidence
+            # 白紙のページはGemini APIを呼び出さずに空として扱う（キャッシュもしない）
+            result["no_text"] = processor.last_run_info.get("no_text", False)
+            if self.structured:
+                result["structured"] = processor.last_run_info.get("structured")
+            if cache is not None and not result["no_text"]:
+                cache.set(cache_key, ocr_result, confidence, processor.model_name,
+                          structured=processor.last_run_info.get("structured"))
+        except Exception as e:
+            result["error"] = str(e)
+        finally:
+            page_image.close()
+        return result
+    
+    def process(self, data: bytes, language_hint: str = "日本語", auto_rotate: bool = True,
+                table_recognition: bool = False) -> Iterator[Dict]:
+        """
+        文書の各ページを並列に処理し、完了した順に結果を返す
+        
+        読み込み済みで未完了のページ数をワーカー数の2倍までに抑え、
+        大きな文書でもメモリ使用量が一定に保たれるようにする
+        
+        Yields:
+            Dict: page（1始まり）, ocr_result, confidence, cache_hit, no_text, error
+                  （構造化出力モードでは structured も）を含む結果
+        """
+        document_hash = hashlib.sha256(data).hexdigest()
+        max_pending = self.max_workers * 2
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="document-ocr") as executor:
+            pending = set()
+            try:
+                for index, page_image in iter_document_pages(data):
+                    pending.add(executor.submit(self._process_page, index, page_image, document_hash,
+                                                language_hint, auto_rotate, table_recognition))
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+
+def stitch_pages(results: List[Dict]) -> Tuple[str, float]:
+    """ページごとの結果をページ順に結合し、(全文, 平均信頼度) を返す"""
+    ordered = sorted(results, key=lambda result: result["page"])
+    sections = []
+    confidences = []
+    for result in ordered:
+        if result["error"]:
+            sections.append(f"--- ページ {result['page']} ---\n[エラー: {result['error']}]")
+            continue
+        sections.append(f"--- ページ {result['page']} ---\n{result['ocr_result']}")
+        # 白紙のページは平均信頼度に含めない
+        if not result.get("no_text"):
+            confidences.append(result["confidence"])
+    
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return "\n\n".join(sections), confidence
@@ -0,0 +1,299 @@
+"""
+似た画像（同じ文書の再スキャン・再撮影）の検出
+画像の知覚ハッシュ（pHash）を履歴ごとにSQLiteへ保存し、メモリ上に展開したハッシュの配列と
+ハミング距離で比較して、圧縮率の違いやわずかな切り抜きだけが異なる画像を見つける
+"""
+import io
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from blob_store import get_blob_store
+from config import DUPLICATE_INDEX_FILE, DUPLICATE_MAX_DISTANCE
+from history_store import get_history_store
+
+# 知覚ハッシュの計算に使う縮小サイズと、ハッシュに使う低周波成分の大きさ（8×8 = 64ビット）
+_DCT_SIZE = 32
+_HASH_SIZE = 8
+_k = np.arange(_DCT_SIZE)
+_DCT_MATRIX = np.cos(np.pi * (2 * _k[None, :] + 1) * _k[:, None] / (2 * _DCT_SIZE))
+
+# 0〜255の各バイト値の立っているビット数
+_BYTE_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+def _popcount_bytes(values: np.ndarray) -> np.ndarray:
+    """uint64配列の各要素の立っているビット数を、8バイトに分けて表引きで数える"""
+    return _BYTE_POPCOUNT[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+# NumPy 2.0以降は bitwise_count（CPUのpopcount命令）、それより前は表引き
+_popcount = getattr(np, "bitwise_count", _popcount_bytes)
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """
+    画像の知覚ハッシュ（64ビットのpHash）を計算
+
+    縮小したグレースケール画像の離散コサイン変換のうち低周波成分が中央値より大きいかを
+    ビットにしたもの。再圧縮・拡大縮小・明るさの違いではほとんど変わらない。
+    """
+    gray = image.convert("L")
+    # 大きな画像は先に画素の平均で縮小してから（リサンプリングの計算量を抑える）
+    factor = min(gray.size) // (_DCT_SIZE * 4)
+    if factor > 1:
+        gray = gray.reduce(factor)
+    pixels = np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.float64)
+    coefficients = (_DCT_MATRIX @ pixels @ _DCT_MATRIX.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    # 直流成分（画像全体の明るさ）は中央値の計算から除く
+    bits = coefficients > np.median(coefficients[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def perceptual_hash_bytes(image_data: bytes) -> Optional[int]:
+    """画像のバイト列から知覚ハッシュを計算（画像として読み込めない場合はNone）"""
+    try:
+        with Image.open(io.BytesIO(image_data)) as image:
+            return perceptual_hash(image)
+    except Exception:
+        return None
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """2つのハッシュの異なるビット数"""
+    return bin(a ^ b).count("1")
+
+
+class HammingIndex:
+    """
+    64ビットハッシュのハミング距離検索
+
+    ハッシュを連続したNumPy配列に保持し、全件とのXORとビット数の計算を一括で行う
+    （10万件でも1ミリ秒未満）。削除は末尾の要素で穴を埋める。
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._hashes = np.zeros(max(1, capacity), dtype=np.uint64)
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, item_id: str, value: int):
+        """ハッシュを追加（同じIDが登録済みなら置き換える）"""
+        position = self._positions.get(item_id)
+        if position is None:
+            position = len(self._ids)
+            if position == len(self._hashes):
+                self._hashes = np.concatenate([self._hashes, np.zeros(len(self._hashes), dtype=np.uint64)])
+            self._ids.append(item_id)
+            self._positions[item_id] = position
+        self._hashes[position] = value
+
+    def remove(self, item_id: str):
+        """ハッシュを削除（登録されていない場合は何もしない）"""
+        position = self._positions.pop(item_id, None)
+        if position is None:
+            return
+        last_id = self._ids.pop()
+        if last_id != item_id:
+            self._ids[position] = last_id
+            self._positions[last_id] = position
+            self._hashes[position] = self._hashes[len(self._ids)]
+
+    def search(self, value: int, max_distance: int, limit: int) -> List[Tuple[str, int]]:
+        """ハミング距離がmax_distance以下のものを距離の近い順に最大limit件取得"""
+        if not self._ids:
+            return []
+        distances = _popcount(self._hashes[:len(self._ids)] ^ np.uint64(value))
+        matched = np.flatnonzero(distances <= max_distance)
+        if len(matched) > limit:
+            matched = matched[np.argpartition(distances[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(distances[matched], kind="stable")]
+        return [(self._ids[position], int(distances[position])) for position in matched]
+
+
+class ImageDuplicateIndex:
+    """
+    履歴の画像の知覚ハッシュのインデックス
+
+    ハッシュはSQLiteに保存し、検索はメモリ上の HammingIndex で行う。別のプロセスが
+    更新した場合はバージョン番号の違いで検出し、次の検索時にSQLiteから読み直す。
+    件数の上限は持たず、履歴ストアが上限を超えて削除した項目を remove_many で取り除く。
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS hashes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        phash TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+    """
+
+    def __init__(self, db_file: str = DUPLICATE_INDEX_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # メモリ上のインデックスと、それが反映しているバージョン（Noneの場合は次の検索時に読み込む）
+        self._memory: Optional[HammingIndex] = None
+        self._version: Optional[int] = None
+        self._connect().executescript(self._SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection) -> int:
+        # RETURNING（SQLite 3.35以降）は使わず、同じトランザクション内で更新後の値を読む
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    @staticmethod
+    def _read_version(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def _apply(self, version: int, added: Iterable[Tuple[str, int]] = (), removed: Iterable[str] = ()):
+        """自分の更新をメモリ上のインデックスに反映（間に別プロセスの更新があれば読み直しにする）"""
+        if self._memory is None or self._version is None or version != self._version + 1:
+            self._memory = None
+            return
+        for item_id in removed:
+            self._memory.remove(item_id)
+        for item_id, value in added:
+            self._memory.add(item_id, value)
+        self._version = version
+
+    def _load(self, conn: sqlite3.Connection):
+        """SQLiteからメモリ上のインデックスを作り直す"""
+        with conn:
+            conn.execute("BEGIN")
+            version = self._read_version(conn)
+            rows = conn.execute("SELECT id, phash FROM hashes ORDER BY seq").fetchall()
+        memory = HammingIndex(len(rows))
+        for row in rows:
+            memory.add(row["id"], int(row["phash"], 16))
+        self._memory = memory
+        self._version = version
+
+    def add(self, item_id: str, value: int):
+        """履歴項目の画像のハッシュを追加"""
+        conn = self._connect()
+        with self._lock:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO hashes (id, phash) VALUES (?, ?)", (item_id, f"{value:016x}")
+                )
+                version = self._bump_version(conn)
+            self._apply(version, added=[(item_id, value)])
+
+    def remove(self, item_id: str):
+        """履歴項目のハッシュを削除"""
+        self.remove_many([item_id])
+
+    def remove_many(self, item_ids: List[str]):
+        """複数の履歴項目のハッシュを削除（履歴ストアが上限を超えて削除した項目など）"""
+        if not item_ids:
+            return
+        conn = self._connect()
+        with self._lock:
+            with conn:
+                conn.executemany("DELETE FROM hashes WHERE id = ?", ((item_id,) for item_id in item_ids))
+                version = self._bump_version(conn)
+            self._apply(version, removed=item_ids)
+
+    def rebuild(self, entries: Iterable[Tuple[str, int]]):
+        """(履歴項目のID, ハッシュ) の組（古い順）からインデックスを作り直す"""
+        conn = self._connect()
+        with self._lock:
+            with conn:
+                conn.execute("DELETE FROM hashes")
+                conn.executemany(
+                    "INSERT OR REPLACE INTO hashes (id, phash) VALUES (?, ?)",
+                    ((item_id, f"{value:016x}") for item_id, value in entries)
+                )
+                self._bump_version(conn)
+            self._memory = None
+
+    def clear(self):
+        """インデックスを空にする"""
+        self.rebuild([])
+
+    def count(self) -> int:
+        """登録済みのハッシュ数を取得"""
+        return self._connect().execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def find(self, value: int, max_distance: int = DUPLICATE_MAX_DISTANCE,
+             limit: int = 5) -> List[Tuple[str, int]]:
+        """
+        ハッシュが近い履歴項目を検索
+
+        Args:
+            value: 検索する画像の知覚ハッシュ
+            max_distance: 似た画像とみなすハミング距離の上限（64ビット中）
+            limit: 取得件数
+
+        Returns:
+            List[Tuple[str, int]]: 距離の近い順の (履歴項目のID, ハミング距離)
+        """
+        conn = self._connect()
+        version = self._read_version(conn)
+        with self._lock:
+            if self._memory is None or self._version != version:
+                self._load(conn)
+            return self._memory.search(value, max_distance, limit)
+
+
+def iter_history_hashes(items: Iterable[Dict]) -> Iterator[Tuple[str, int]]:
+    """履歴項目の画像の (ID, 知覚ハッシュ) を順に計算（同じ画像は1回だけ計算する）"""
+    blobs = get_blob_store()
+    store = get_history_store()
+    computed: Dict[str, Optional[int]] = {}
+    for item in items:
+        image_hash = item.get("image_hash")
+        if image_hash and image_hash in computed:
+            value = computed[image_hash]
+        else:
+            data = blobs.get(image_hash) if image_hash else None
+            if data is None:
+                data = store.load_image(item["id"])
+            value = perceptual_hash_bytes(data) if data else None
+            if image_hash:
+                computed[image_hash] = value
+        if value is not None:
+            yield item["id"], value
+
+
+_index: Optional[ImageDuplicateIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index() -> ImageDuplicateIndex:
+    """プロセス共通の知覚ハッシュのインデックスを取得（初回は既存履歴の画像から構築）"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = ImageDuplicateIndex()
+                store = get_history_store()
+                if index.count() == 0 and store.count() > 0:
+                    items = sorted(store.load_all(), key=lambda item: item["timestamp"])
+                    index.rebuild(iter_history_hashes(items))
+                _index = index
+    return _index
@@ -0,0 +1,744 @@
+"""
+履歴ストア
+OCR履歴の保存先（JSONファイル / SQLite）を切り替えるためのバックエンド
+"""
+import base64
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windowsではプロセス間のロックなし（同じプロセス内のスレッドのみ排他）
+    fcntl = None
+
+from blob_store import BlobStore, get_blob_store, hash_bytes
+from config import (
+    HISTORY_BACKEND,
+    HISTORY_DB_FILE,
+    HISTORY_FILE,
+    HISTORY_JOURNAL_COMPACT_RATIO,
+    HISTORY_JOURNAL_FILE,
+    MAX_HISTORY_ITEMS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _take_image_refs(items: List[Dict], blobs: BlobStore, inline_only: bool = False):
+    """
+    履歴項目の画像の参照をblobストアに登録
+
+    base64で埋め込まれた画像（旧形式）はblobストアに移して内容ハッシュだけを残す。
+    同じ画像は1回だけ保存する。
+
+    Args:
+        items: 履歴項目のリスト（その場で書き換える）
+        blobs: blobストア
+        inline_only: Trueの場合は埋め込み画像だけを移す（内容ハッシュのみの項目は参照済みとみなす）
+    """
+    refs = Counter()
+    if not inline_only:
+        refs.update(item["image_hash"] for item in items
+                    if item.get("image_hash") and not item.get("image_data"))
+        for blob_hash, count in refs.items():
+            blobs.acquire(blob_hash, count)
+
+    hashes: Dict[str, str] = {}
+    images: Dict[str, bytes] = {}
+    refs.clear()
+    for item in items:
+        image_data = item.pop("image_data", None)
+        if not image_data:
+            continue
+        blob_hash = hashes.get(image_data)
+        if blob_hash is None:
+            image_bytes = base64.b64decode(image_data)
+            blob_hash = hashes[image_data] = hash_bytes(image_bytes)
+            images[blob_hash] = image_bytes
+        item["image_hash"] = blob_hash
+        refs[blob_hash] += 1
+    for blob_hash, count in refs.items():
+        blobs.put(images[blob_hash], refs=count)
+
+
+class JSONHistoryStore:
+    """
+    単一のJSONファイルに全履歴を保存するバックエンド（従来形式）
+
+    画像はblobストアに保存し、履歴には内容ハッシュだけを記録する。
+    旧形式（base64の埋め込み）の履歴は次に書き込むときにblobストアへ移す。
+
+    複数のセッション・プロセスから同時に書き込めるよう、読み込み〜書き込みの間は
+    ロックファイル（<履歴ファイル>.lock）で排他し、書き込みは一時ファイルからの
+    置き換えで行う（読み込み側が書きかけのファイルを見ることはない）。
+    """
+
+    def __init__(self, history_file: str = HISTORY_FILE, max_items: int = MAX_HISTORY_ITEMS,
+                 blob_store: Optional[BlobStore] = None):
+        self.history_file = history_file
+        self.lock_file = f"{history_file}.lock"
+        self.max_items = max_items
+        self.blobs = blob_store or get_blob_store()
+        self._lock = threading.Lock()
+        self._cache = None
+
+    @contextmanager
+    def _locked(self):
+        """履歴ファイルの読み込み〜書き込みを排他（プロセス内はスレッドロック、プロセス間はflock）"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_file, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self) -> List[Dict]:
+        """
+        全履歴を読み込む（呼び出し側で書き換えないこと）
+
+        書き込みは一時ファイルからの置き換えで行うため、ファイルの (inode, 更新時刻, サイズ) が
+        前回と同じであれば解析済みの履歴をそのまま返す（再表示のたびにJSON全体を解析しない）
+        """
+        try:
+            stat = os.stat(self.history_file)
+        except FileNotFoundError:
+            return []
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self._cache
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                history = json.load(f)
+        except ValueError as e:
+            # 壊れたファイルを空の履歴として扱うと、次の書き込みで全履歴が失われる
+            raise Exception(f"履歴ファイルを読み込めません（{self.history_file}）: {e}")
+        self._cache = (key, history)
+        return history
+
+    def _read_for_update(self) -> List[Dict]:
+        """書き換え用に全履歴を読み込む（ロック内で呼び出す）"""
+        return [dict(item) for item in self._read()]
+
+    def _write(self, history: List[Dict]):
+        tmp_path = f"{self.history_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(history, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.history_file)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _save(self, history: List[Dict]) -> List[str]:
+        """
+        履歴を書き込み、上限を超えた古い履歴の画像の参照を外す（ロック内で呼び出す）
+
+        Returns:
+            List[str]: 上限を超えたため削除した履歴項目のID
+        """
+        _take_image_refs(history, self.blobs, inline_only=True)
+
+        # 履歴の最大数を制限
+        removed = []
+        if len(history) > self.max_items:
+            removed = history[:-self.max_items]
+            history = history[-self.max_items:]
+
+        self._write(history)
+        self.blobs.release_many(item.get("image_hash") for item in removed)
+        return [item["id"] for item in removed]
+
+    def add(self, item: Dict, image: Optional[bytes] = None) -> List[str]:
+        """
+        履歴項目を追加
+
+        Args:
+            item: 履歴項目
+            image: 画像のバイト列（blobストアに保存し、履歴には内容ハッシュを記録）
+
+        Returns:
+            List[str]: 上限を超えたため削除した履歴項目のID（検索インデックスなどから取り除く）
+        """
+        item = dict(item)
+        if image:
+            item["image_hash"] = self.blobs.put(image)
+        try:
+            with self._locked():
+                history = self._read_for_update()
+                history.append(item)
+                return self._save(history)
+        except Exception:
+            if image:
+                self.blobs.release(item["image_hash"])
+            raise
+
+    def import_items(self, items: List[Dict]):
+        """既存の履歴をまとめて取り込む"""
+        items = [dict(item) for item in items]
+        _take_image_refs(items, self.blobs)
+        try:
+            with self._locked():
+                self._save(self._read_for_update() + items)
+        except Exception:
+            self.blobs.release_many(item.get("image_hash") for item in items)
+            raise
+
+    def load_all(self) -> List[Dict]:
+        """全履歴を古い順に取得（画像は含まない。旧形式の履歴はbase64の画像を含む）"""
+        return [dict(item) for item in self._read()]
+
+    def _with_image(self, item: Dict) -> Dict:
+        if item.get("image_data") or not item.get("image_hash"):
+            return dict(item)
+        image = self.blobs.get(item["image_hash"])
+        return dict(item, image_data=base64.b64encode(image).decode() if image else "")
+
+    @staticmethod
+    def _without_image(item: Dict) -> Dict:
+        return {key: value for key, value in item.items() if key != "image_data"}
+
+    def load_page(self, offset: int = 0, limit: int = 20, newest_first: bool = True,
+                  include_images: bool = True, after: Optional[Dict] = None) -> List[Dict]:
+        """履歴を1ページ分取得（afterの意味は SQLiteHistoryStore.load_page と同じ）"""
+        history = sorted(self._read(), key=lambda x: x["timestamp"], reverse=newest_first)
+        if after is not None:
+            ids = [item["id"] for item in history]
+            if after["id"] in ids:
+                offset += ids.index(after["id"]) + 1
+            else:
+                # 削除済みの項目の場合は同じ時刻の項目をすべて前のページ側とみなす
+                offset += sum(1 for item in history if item["timestamp"] == after["timestamp"]
+                              or (item["timestamp"] > after["timestamp"]) == newest_first)
+        page = history[offset:offset + limit]
+        return [self._with_image(item) if include_images else self._without_image(item) for item in page]
+
+    def get_items(self, item_ids: List[str], include_images: bool = True) -> List[Dict]:
+        """指定したIDの履歴項目を指定順で取得"""
+        items = {item["id"]: item for item in self._read()}
+        found = [items[item_id] for item_id in item_ids if item_id in items]
+        return [self._with_image(item) if include_images else self._without_image(item) for item in found]
+
+    def load_image(self, item_id: str) -> Optional[bytes]:
+        """履歴項目の画像を取得"""
+        for item in self._read():
+            if item["id"] == item_id:
+                if item.get("image_data"):
+                    return base64.b64decode(item["image_data"])
+                return self.blobs.get(item.get("image_hash"))
+        return None
+
+    def image_references(self) -> Dict[str, int]:
+        """画像の内容ハッシュごとの参照数（blobストアの整理用）"""
+        return dict(Counter(item["image_hash"] for item in self._read()
+                            if item.get("image_hash") and not item.get("image_data")))
+
+    def count(self) -> int:
+        """履歴の件数を取得"""
+        return len(self._read())
+
+    def delete(self, item_id: str):
+        """履歴項目を削除"""
+        with self._locked():
+            history = self._read_for_update()
+            removed = [item for item in history if item["id"] == item_id]
+            if not removed:
+                return
+            _take_image_refs(history, self.blobs, inline_only=True)
+            self._write([item for item in history if item["id"] != item_id])
+        self.blobs.release_many(item.get("image_hash") for item in removed)
+
+    def clear(self):
+        """全履歴を削除"""
+        with self._locked():
+            if not os.path.exists(self.history_file):
+                return
+            references = self.image_references()
+            os.remove(self.history_file)
+        self.blobs.release_many(Counter(references).elements())
+
+
+class JournalHistoryStore(JSONHistoryStore):
+    """
+    1行1件のJSONL（追記専用のジャーナル）に履歴を保存するバックエンド
+
+    追加は1行の追記、削除は削除済みの印（tombstone）の追記だけで行うため、
+    書き込みのコストは履歴件数に比例しない。行数が上限件数の
+    HISTORY_JOURNAL_COMPACT_RATIO 倍に達したら、最新の上限件数だけを残して
+    ファイルを書き直す（コンパクション）。読み込みはファイルを先頭から1行ずつ
+    処理し、前回読んだ位置以降の追記分だけを読み足す。
+    """
+
+    def __init__(self, history_file: str = HISTORY_JOURNAL_FILE, max_items: int = MAX_HISTORY_ITEMS,
+                 blob_store: Optional[BlobStore] = None,
+                 compact_ratio: float = HISTORY_JOURNAL_COMPACT_RATIO):
+        super().__init__(history_file, max_items, blob_store)
+        self.compact_ratio = compact_ratio
+        self._cache_lock = threading.Lock()
+        self._file = None
+        self._reset_cache(None)
+
+    def _reset_cache(self, journal_file):
+        # 読み込み中のファイルを開いたままにしておくことで、置き換え後の新しいファイルと
+        # inode番号が重複せず、置き換えを確実に検出できる
+        if self._file is not None:
+            self._file.close()
+        self._file = journal_file
+        self._offset = 0
+        self._lines = 0
+        self._items: Dict[str, Dict] = {}
+
+    @staticmethod
+    def _encode(record: Dict) -> bytes:
+        return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def _apply(self, line: bytes):
+        """ジャーナルの1行を読み込み済みの履歴に反映"""
+        try:
+            record = json.loads(line)
+        except ValueError:
+            logger.warning("履歴ジャーナルの壊れた行を読み飛ばしました: %r", line[:80])
+            return
+        if record.get("deleted"):
+            self._items.pop(record["id"], None)
+        else:
+            self._items[record["id"]] = record
+
+    def _load(self) -> List[Dict]:
+        """有効な履歴（削除済みを除く、古い順、上限超過分を含む）を取得"""
+        with self._cache_lock:
+            try:
+                stat = os.stat(self.history_file)
+            except FileNotFoundError:
+                self._reset_cache(None)
+                return []
+            # コンパクション・削除でファイルが置き換わった場合は先頭から読み直す
+            current = os.fstat(self._file.fileno()) if self._file is not None else None
+            if current is None or (current.st_dev, current.st_ino) != (stat.st_dev, stat.st_ino) \
+                    or stat.st_size < self._offset:
+                self._reset_cache(open(self.history_file, 'rb'))
+            if stat.st_size > self._offset:
+                self._file.seek(self._offset)
+                for line in self._file:
+                    if not line.endswith(b"\n"):
+                        break  # 書き込み途中の行
+                    self._offset += len(line)
+                    self._lines += 1
+                    if line.strip():
+                        self._apply(line)
+            return list(self._items.values())
+
+    def _read(self) -> List[Dict]:
+        items = self._load()
+        return items[-self.max_items:] if len(items) > self.max_items else items
+
+    def _append(self, records: List[Dict]):
+        """レコードをジャーナルの末尾に追記（ロック内で呼び出す）"""
+        data = b"".join(self._encode(record) for record in records)
+        fd = os.open(self.history_file, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            # 前回の書き込みが途中で中断していた場合は、その行と連結しないよう改行を補う
+            size = os.fstat(fd).st_size
+            if size and os.lseek(fd, size - 1, os.SEEK_SET) >= 0 and os.read(fd, 1) != b"\n":
+                data = b"\n" + data
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+        finally:
+            os.close(fd)
+
+    def _compact_if_needed(self):
+        """行数がしきい値に達していればコンパクション（失敗しても追記済みの履歴には影響しない）"""
+        self._load()
+        if self._lines < max(self.max_items * self.compact_ratio, self.max_items + 1):
+            return
+        try:
+            self._compact()
+        except Exception as e:
+            logger.warning("履歴ジャーナルのコンパクションに失敗しました: %s", e)
+
+    def _compact(self):
+        """最新の上限件数だけを残してジャーナルを書き直す（ロック内で呼び出す）"""
+        items = self._load()
+        removed = items[:-self.max_items] if self.max_items else items
+        kept = items[-self.max_items:] if self.max_items else []
+        tmp_path = f"{self.history_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(b"".join(self._encode(item) for item in kept))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.history_file)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.blobs.release_many(item.get("image_hash") for item in removed)
+
+    def compact(self):
+        """ジャーナルを書き直して削除済み・上限超過分の履歴を取り除く"""
+        with self._locked():
+            if os.path.exists(self.history_file):
+                self._compact()
+
+    def add(self, item: Dict, image: Optional[bytes] = None) -> List[str]:
+        """
+        履歴項目を追加（ジャーナルに1行追記）
+
+        Args:
+            item: 履歴項目
+            image: 画像のバイト列（blobストアに保存し、履歴には内容ハッシュを記録）
+
+        Returns:
+            List[str]: 上限を超えて見えなくなった履歴項目のID（画像の参照はコンパクションのときに外す）
+        """
+        item = dict(item)
+        if image:
+            item["image_hash"] = self.blobs.put(image)
+        return self._append_items([item])
+
+    def import_items(self, items: List[Dict]):
+        """既存の履歴をまとめて取り込む"""
+        items = [dict(item) for item in items]
+        _take_image_refs(items, self.blobs)
+        self._append_items(items)
+
+    def _append_items(self, items: List[Dict]) -> List[str]:
+        """履歴項目を追記し、上限を超えて見えなくなった項目のIDを返す"""
+        with self._locked():
+            visible = [item["id"] for item in self._read()]
+            try:
+                self._append(items)
+            except Exception:
+                self.blobs.release_many(item.get("image_hash") for item in items)
+                raise
+            remaining = {item["id"] for item in self._read()}
+            self._compact_if_needed()
+        return [item_id for item_id in visible if item_id not in remaining]
+
+    def image_references(self) -> Dict[str, int]:
+        """画像の内容ハッシュごとの参照数（上限超過でまだ取り除いていない履歴も含む）"""
+        return dict(Counter(item["image_hash"] for item in self._load() if item.get("image_hash")))
+
+    def delete(self, item_id: str):
+        """履歴項目を削除（削除済みの印を追記）"""
+        with self._locked():
+            removed = [item for item in self._load() if item["id"] == item_id]
+            if not removed:
+                return
+            self._append([{"id": item_id, "deleted": True}])
+            self._compact_if_needed()
+        self.blobs.release_many(item.get("image_hash") for item in removed)
+
+    def clear(self):
+        """全履歴を削除"""
+        with self._locked():
+            if not os.path.exists(self.history_file):
+                return
+            references = self.image_references()
+            os.remove(self.history_file)
+        self.blobs.release_many(Counter(references).elements())
+
+
+class SQLiteHistoryStore:
+    """
+    SQLite（WALモード）に履歴を保存するバックエンド
+
+    検索・並び替えに使う列にはインデックスを張り、画像はblobストアに保存して
+    内容ハッシュだけを記録する。件数はメタテーブルで管理するため、
+    追加・削除・上限超過分の削除はいずれも履歴件数に比例しない。
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS history (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        timestamp TEXT NOT NULL,
+        image_name TEXT NOT NULL,
+        image_hash TEXT,
+        ocr_result TEXT NOT NULL,
+        confidence REAL NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp, seq);
+    CREATE INDEX IF NOT EXISTS idx_history_image_name ON history(image_name);
+    CREATE INDEX IF NOT EXISTS idx_history_confidence ON history(confidence);
+    CREATE INDEX IF NOT EXISTS idx_history_image_hash ON history(image_hash);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('count', 0);
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('legacy_imported', 0);
+    """
+
+    def __init__(self, db_file: str = HISTORY_DB_FILE, max_items: int = MAX_HISTORY_ITEMS,
+                 blob_store: Optional[BlobStore] = None):
+        self.db_file = db_file
+        self.max_items = max_items
+        self.blobs = blob_store or get_blob_store()
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(self._SCHEMA)
+        self._migrate_images(conn)
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _migrate_images(self, conn: sqlite3.Connection):
+        """旧形式（imagesテーブル）に保存した画像をblobストアに移す"""
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images'"
+        ).fetchone()
+        if exists is None:
+            return
+        rows = conn.execute(
+            "SELECT i.data, (SELECT COUNT(*) FROM history h WHERE h.image_hash = i.hash) AS refs FROM images i"
+        )
+        for row in rows:
+            if row["refs"]:
+                self.blobs.put(row["data"], refs=row["refs"])
+        with conn:
+            conn.execute("DROP TABLE images")
+
+    @staticmethod
+    def _row_to_item(row: sqlite3.Row) -> Dict:
+        return {
+            "id": row["id"],
+            "timestamp": row["timestamp"],
+            "image_name": row["image_name"],
+            "ocr_result": row["ocr_result"],
+            "confidence": row["confidence"],
+            "image_hash": row["image_hash"]
+        }
+
+    def _with_image(self, item: Dict) -> Dict:
+        image = self.blobs.get(item["image_hash"])
+        item["image_data"] = base64.b64encode(image).decode() if image else ""
+        return item
+
+    def _insert(self, conn: sqlite3.Connection, item: Dict) -> bool:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO history (id, timestamp, image_name, image_hash, ocr_result, confidence) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (item["id"], item["timestamp"], item["image_name"], item.get("image_hash"),
+             item["ocr_result"], item.get("confidence", 0.0))
+        )
+        if cursor.rowcount:
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'count'")
+        return cursor.rowcount > 0
+
+    def _trim(self, conn: sqlite3.Connection) -> List[sqlite3.Row]:
+        """上限を超えた古い履歴を削除（削除した行の id・image_hash を返す）"""
+        overflow = self._count(conn) - self.max_items
+        if overflow <= 0:
+            return []
+        rows = conn.execute(
+            "SELECT id, image_hash FROM history ORDER BY timestamp, seq LIMIT ?", (overflow,)
+        ).fetchall()
+        return [row for row in rows if self._delete(conn, row["id"])]
+
+    def _delete(self, conn: sqlite3.Connection, item_id: str) -> bool:
+        cursor = conn.execute("DELETE FROM history WHERE id = ?", (item_id,))
+        if cursor.rowcount:
+            conn.execute("UPDATE meta SET value = value - 1 WHERE key = 'count'")
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT value FROM meta WHERE key = 'count'").fetchone()[0]
+
+    def _save(self, items: List[Dict]) -> List[str]:
+        """
+        履歴項目を書き込み、取り込まれなかった項目と上限超過分の画像の参照を外す
+
+        Returns:
+            List[str]: 上限を超えたため削除した履歴項目のID
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                released = [item.get("image_hash") for item in items if not self._insert(conn, item)]
+                removed = self._trim(conn)
+        except Exception:
+            self.blobs.release_many(item.get("image_hash") for item in items)
+            raise
+        self.blobs.release_many(released + [row["image_hash"] for row in removed])
+        return [row["id"] for row in removed]
+
+    def add(self, item: Dict, image: Optional[bytes] = None) -> List[str]:
+        """
+        履歴項目を追加
+
+        Args:
+            item: 履歴項目
+            image: 画像のバイト列（blobストアに保存し、履歴には内容ハッシュを記録）
+
+        Returns:
+            List[str]: 上限を超えたため削除した履歴項目のID（検索インデックスなどから取り除く）
+        """
+        item = dict(item, image_hash=self.blobs.put(image) if image else None)
+        return self._save([item])
+
+    def import_items(self, items: List[Dict]):
+        """既存の履歴（JSON形式など）をまとめて取り込む"""
+        items = [dict(item) for item in items]
+        _take_image_refs(items, self.blobs)
+        self._save(items)
+
+    def import_legacy(self, history_file: str = HISTORY_FILE):
+        """
+        JSON形式の既存履歴を取り込む（最初の1回だけ）
+
+        取り込んだことはメタテーブルに記録するため、履歴をすべて削除した後に
+        古いJSONファイルの履歴が再び取り込まれることはない
+        """
+        conn = self._connect()
+        if conn.execute("SELECT value FROM meta WHERE key = 'legacy_imported'").fetchone()[0]:
+            return
+        if self.count() == 0 and os.path.exists(history_file):
+            self.import_items(JSONHistoryStore(history_file, blob_store=self.blobs).load_all())
+        with conn:
+            conn.execute("UPDATE meta SET value = 1 WHERE key = 'legacy_imported'")
+
+    def load_all(self) -> List[Dict]:
+        """全履歴を古い順に取得（画像は含まない）"""
+        rows = self._connect().execute(
+            "SELECT * FROM history ORDER BY timestamp, seq"
+        ).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    def load_page(self, offset: int = 0, limit: int = 20, newest_first: bool = True,
+                  include_images: bool = True, after: Optional[Dict] = None) -> List[Dict]:
+        """
+        履歴を1ページ分取得（タイムスタンプのインデックスを利用）
+
+        Args:
+            offset: 読み飛ばす件数（afterを指定した場合はafterの次の項目からの件数）
+            limit: 取得件数
+            newest_first: 新しい順かどうか
+            include_images: 画像（base64）を含めるかどうか
+            after: 前のページの最後の項目。指定するとその位置をインデックスで直接探すため、
+                   何ページ目でも読み飛ばす件数（offset）に比例しない
+        """
+        conn = self._connect()
+        order = "DESC" if newest_first else "ASC"
+        where, params = "", []
+        if after is not None:
+            row = conn.execute("SELECT seq FROM history WHERE id = ?", (after["id"],)).fetchone()
+            if row is not None:
+                seq = row["seq"]
+            else:
+                # 削除済みの項目の場合は同じ時刻の項目をすべて前のページ側とみなす
+                seq = -1 if newest_first else sys.maxsize
+            where = f"WHERE (timestamp, seq) {'<' if newest_first else '>'} (?, ?)"
+            params = [after["timestamp"], seq]
+        rows = conn.execute(
+            f"SELECT * FROM history {where} ORDER BY timestamp {order}, seq {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        items = [self._row_to_item(row) for row in rows]
+        return [self._with_image(item) for item in items] if include_images else items
+
+    def get_items(self, item_ids: List[str], include_images: bool = True) -> List[Dict]:
+        """指定したIDの履歴項目を指定順で取得"""
+        if not item_ids:
+            return []
+        placeholders = ",".join("?" * len(item_ids))
+        rows = self._connect().execute(
+            f"SELECT * FROM history WHERE id IN ({placeholders})",
+            list(item_ids)
+        ).fetchall()
+        items = {row["id"]: self._row_to_item(row) for row in rows}
+        found = [items[item_id] for item_id in item_ids if item_id in items]
+        return [self._with_image(item) for item in found] if include_images else found
+
+    def load_image(self, item_id: str) -> Optional[bytes]:
+        """履歴項目の画像を取得"""
+        row = self._connect().execute(
+            "SELECT image_hash FROM history WHERE id = ?", (item_id,)
+        ).fetchone()
+        return self.blobs.get(row["image_hash"]) if row is not None else None
+
+    def image_references(self) -> Dict[str, int]:
+        """画像の内容ハッシュごとの参照数（blobストアの整理用）"""
+        rows = self._connect().execute(
+            "SELECT image_hash, COUNT(*) AS refs FROM history WHERE image_hash IS NOT NULL GROUP BY image_hash"
+        ).fetchall()
+        return {row["image_hash"]: row["refs"] for row in rows}
+
+    def count(self) -> int:
+        """履歴の件数を取得"""
+        return self._count(self._connect())
+
+    def delete(self, item_id: str):
+        """履歴項目を削除"""
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT image_hash FROM history WHERE id = ?", (item_id,)).fetchone()
+            deleted = row is not None and self._delete(conn, item_id)
+        if deleted:
+            self.blobs.release(row["image_hash"])
+
+    def clear(self):
+        """全履歴を削除"""
+        conn = self._connect()
+        with conn:
+            references = self.image_references()
+            conn.execute("DELETE FROM history")
+            conn.execute("UPDATE meta SET value = 0 WHERE key = 'count'")
+        self.blobs.release_many(Counter(references).elements())
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    """設定（HISTORY_BACKEND）に応じた履歴ストアを取得"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if HISTORY_BACKEND == "sqlite":
+                    store = SQLiteHistoryStore()
+                    # 初回はJSON形式の既存履歴を取り込む
+                    try:
+                        store.import_legacy()
+                    except Exception as e:
+                        logger.warning("既存履歴の取り込みに失敗しました: %s", e)
+                    _store = store
+                elif HISTORY_BACKEND == "jsonl":
+                    store = JournalHistoryStore()
+                    # 初回はJSON形式の既存履歴を取り込む
+                    if store.count() == 0 and os.path.exists(HISTORY_FILE):
+                        try:
+                            store.import_items(JSONHistoryStore().load_all())
+                        except Exception as e:
+                            logger.warning("既存履歴の取り込みに失敗しました: %s", e)
+                    _store = store
+                else:
+                    _store = JSONHistoryStore()
+    return _store
@@ -0,0 +1,154 @@
+"""
+画像前処理
+Gemini APIへ送信する前に、文字認識に十分な解像度まで縮小し、
+アルファチャンネルやメタデータを除去して効率のよい形式で再エンコードする
+"""
+import io
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, features
+
+from config import (
+    PREPROCESS_FORMAT,
+    PREPROCESS_GRAYSCALE,
+    PREPROCESS_MAX_DPI,
+    PREPROCESS_MAX_SIDE,
+    PREPROCESS_QUALITY,
+)
+
+_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+# 再エンコードせずにそのまま送信できる形式
+_PASSTHROUGH_FORMATS = ("JPEG", "PNG", "WEBP")
+
+# 前処理の累計統計（設定ページ表示用）
+_stats_lock = threading.Lock()
+_total_stats = {
+    "images": 0,
+    "bytes_before": 0,
+    "bytes_after": 0,
+    "elapsed_ms": 0.0
+}
+
+
+def _record_stats(stats: Dict):
+    with _stats_lock:
+        _total_stats["images"] += 1
+        _total_stats["bytes_before"] += stats["bytes_before"]
+        _total_stats["bytes_after"] += stats["bytes_after"]
+        _total_stats["elapsed_ms"] += stats["elapsed_ms"]
+
+
+def get_preprocess_stats() -> Dict:
+    """前処理の累計統計を取得"""
+    with _stats_lock:
+        return dict(_total_stats)
+
+
+def flatten_alpha(image: Image.Image) -> Image.Image:
+    """アルファチャンネル（透過）を持つ画像を白背景に合成（透過がなければそのまま返す）"""
+    if image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image
+
+
+class ImagePreprocessor:
+    """送信用に画像を縮小・変換・再エンコードするクラス"""
+    
+    def __init__(self, max_side: int = PREPROCESS_MAX_SIDE, max_dpi: int = PREPROCESS_MAX_DPI,
+                 grayscale: bool = PREPROCESS_GRAYSCALE, output_format: str = PREPROCESS_FORMAT,
+                 quality: int = PREPROCESS_QUALITY):
+        self.max_side = max_side
+        self.max_dpi = max_dpi
+        self.grayscale = grayscale
+        self.output_format = output_format.upper()
+        if self.output_format == "WEBP" and not features.check("webp"):
+            self.output_format = "JPEG"
+        self.quality = quality
+    
+    def _target_size(self, image: Image.Image) -> Tuple[int, int]:
+        """長辺とDPIの上限から縮小後のサイズを計算"""
+        width, height = image.size
+        scale = 1.0
+        if self.max_side > 0 and max(width, height) > self.max_side:
+            scale = self.max_side / max(width, height)
+        
+        dpi = image.info.get("dpi")
+        if self.max_dpi > 0 and dpi:
+            try:
+                source_dpi = float(max(dpi))
+            except (TypeError, ValueError):
+                source_dpi = 0
+            if source_dpi > self.max_dpi:
+                scale = min(scale, self.max_dpi / source_dpi)
+        
+        return max(1, round(width * scale)), max(1, round(height * scale))
+    
+    def _convert_mode(self, image: Image.Image) -> Image.Image:
+        """アルファチャンネルを白背景に合成し、RGB/グレースケールに変換"""
+        image = flatten_alpha(image)
+        
+        if self.grayscale:
+            return image.convert("L")
+        if image.mode not in ("RGB", "L"):
+            return image.convert("RGB")
+        return image
+    
+    def process(self, image: Image.Image, source_data: Optional[bytes] = None) -> Tuple[Dict, Dict]:
+        """
+        画像を送信用に変換
+        
+        Args:
+            image: PIL画像オブジェクト
+            source_data: 元ファイルのバイト列（変換不要な場合はそのまま送信する）
+        
+        Returns:
+            Tuple[Dict, Dict]: (Gemini APIに渡すBlob {"mime_type", "data"}, 統計情報)
+        """
+        started = time.perf_counter()
+        original_size = image.size
+        bytes_before = len(source_data) if source_data is not None else image.width * image.height * len(image.getbands())
+        
+        # 先に縮小してから色変換することで変換対象の画素数を減らす
+        target_size = self._target_size(image)
+        resized = image
+        if target_size != original_size:
+            resized = image.resize(target_size, Image.LANCZOS, reducing_gap=3.0)
+        converted = self._convert_mode(resized)
+        
+        # 縮小・変換が不要で送信可能な形式ならば元のバイト列を再利用
+        passthrough = (
+            source_data is not None
+            and converted is image
+            and image.format in _PASSTHROUGH_FORMATS
+            and not image.info.get("exif")
+        )
+        
+        if passthrough:
+            blob = {"mime_type": _MIME_TYPES[image.format], "data": bytes(source_data)}
+        else:
+            buffered = io.BytesIO()
+            # 新しいバッファへ保存するためEXIF等のメタデータは引き継がれない
+            save_options = {"optimize": True} if self.output_format == "PNG" else {"quality": self.quality}
+            converted.save(buffered, format=self.output_format, **save_options)
+            blob = {"mime_type": _MIME_TYPES[self.output_format], "data": buffered.getvalue()}
+        
+        stats = {
+            "original_size": original_size,
+            "processed_size": target_size,
+            "bytes_before": bytes_before,
+            "bytes_after": len(blob["data"]),
+            "elapsed_ms": (time.perf_counter() - started) * 1000,
+            "passthrough": passthrough
+        }
+        _record_stats(stats)
+        return blob, stats
@@ -0,0 +1,444 @@
+"""
+バックグラウンドOCRジョブ
+SQLiteに永続化したキューにジョブを登録し、ワーカープールが順に処理して結果を履歴に保存する
+（画面を閉じたり再接続したりしても処理は継続し、結果はジョブIDで取得できる）
+"""
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import (
+    DOCUMENT_MAX_PAGES,
+    JOB_DB_FILE,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL,
+    JOB_RETENTION,
+    JOB_WORKERS,
+)
+from document_processor import (
+    DocumentOCRProcessor,
+    count_pages,
+    is_multipage_document,
+    render_first_page,
+    stitch_pages,
+)
+from metrics import JOBS_RUNNING
+from ocr_processor import OCRProcessor
+from utils import get_history_items, save_to_history
+
+logger = logging.getLogger(__name__)
+
+# ジョブの状態
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+# 一覧・状態取得で返す列（画像データは含めない）
+_JOB_COLUMNS = (
+    "id, batch_id, status, image_name, model_name, language_hint, auto_rotate, "
+    "table_recognition, save_history, ocr_result, confidence, cache_hit, error, history_id, "
+    "progress, total, attempts, created_at, started_at, finished_at"
+)
+
+
+class JobQueue:
+    """
+    SQLite（WALモード）に永続化したOCRジョブのキュー
+
+    ワーカーは実行権（リース）付きでジョブを取得し、リース期限までに完了しなかった
+    ジョブ（プロセスの終了など）は別のワーカーが再実行する。
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        batch_id TEXT,
+        status TEXT NOT NULL,
+        image_name TEXT NOT NULL,
+        image_data BLOB,
+        model_name TEXT NOT NULL,
+        language_hint TEXT NOT NULL,
+        auto_rotate INTEGER NOT NULL,
+        table_recognition INTEGER NOT NULL,
+        save_history INTEGER NOT NULL,
+        ocr_result TEXT,
+        confidence REAL,
+        cache_hit INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        history_id TEXT,
+        progress INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 1,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        lease_until REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, seq);
+    CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs(batch_id, seq);
+    """
+
+    def __init__(self, db_file: str = JOB_DB_FILE, lease_seconds: float = JOB_LEASE_SECONDS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.db_file = db_file
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        # 同一プロセス内のワーカーに新しいジョブの登録を知らせる
+        self.new_job = threading.Event()
+        self._connect().executescript(self._SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict:
+        job = dict(row)
+        for key in ("auto_rotate", "table_recognition", "save_history", "cache_hit"):
+            job[key] = bool(job[key])
+        return job
+
+    def submit(self, image_name: str, image_data: bytes, model_name: str, language_hint: str,
+               auto_rotate: bool = True, table_recognition: bool = False,
+               save_history: bool = True, batch_id: Optional[str] = None) -> str:
+        """
+        ジョブを登録
+
+        Returns:
+            str: ジョブID
+        """
+        return self.submit_many([(image_name, image_data)], model_name, language_hint, auto_rotate,
+                                table_recognition, save_history, batch_id)[0]
+
+    def submit_many(self, images: Iterable[Tuple[str, bytes]], model_name: str, language_hint: str,
+                    auto_rotate: bool = True, table_recognition: bool = False,
+                    save_history: bool = True, batch_id: Optional[str] = None) -> List[str]:
+        """
+        複数の画像をまとめてジョブとして登録
+
+        Args:
+            images: (ファイル名, バイト列) のリスト
+            batch_id: まとめて状態を確認するためのID（一括処理単位）
+
+        Returns:
+            List[str]: 登録順のジョブID
+        """
+        now = time.time()
+        job_ids = []
+        conn = self._connect()
+        with conn:
+            for image_name, image_data in images:
+                job_id = str(uuid.uuid4())
+                conn.execute(
+                    "INSERT INTO jobs (id, batch_id, status, image_name, image_data, model_name, "
+                    "language_hint, auto_rotate, table_recognition, save_history, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, batch_id, STATUS_QUEUED, image_name, image_data, model_name,
+                     language_hint, int(auto_rotate), int(table_recognition), int(save_history), now)
+                )
+                job_ids.append(job_id)
+        self.new_job.set()
+        return job_ids
+
+    def claim(self) -> Optional[Dict]:
+        """
+        次に処理するジョブを取得して実行中にする（画像データを含む）
+
+        待機中のジョブに加え、リース期限の切れた実行中ジョブも対象にする。
+        取得と状態更新は書き込みロック（BEGIN IMMEDIATE）を取った1つのトランザクションで行うため、
+        複数プロセスから呼び出しても重複しない。
+        """
+        conn = self._connect()
+        while True:
+            now = time.time()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT seq FROM jobs WHERE status = ? OR (status = ? AND lease_until < ?) "
+                    "ORDER BY seq LIMIT 1",
+                    (STATUS_QUEUED, STATUS_RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ? "
+                    "WHERE seq = ?",
+                    (STATUS_RUNNING, now, now + self.lease_seconds, row["seq"])
+                )
+                row = conn.execute(
+                    f"SELECT {_JOB_COLUMNS}, image_data FROM jobs WHERE seq = ?", (row["seq"],)
+                ).fetchone()
+            job = self._row_to_job(row)
+            if job["attempts"] <= self.max_attempts:
+                return job
+            # 処理中に繰り返し中断されたジョブは失敗として扱う
+            self.fail(job["id"], "再試行回数の上限に達しました")
+
+    def update_progress(self, job_id: str, progress: int, total: int):
+        """進捗を更新し、リースを延長"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, total = ?, lease_until = ? WHERE id = ? AND status = ?",
+                (progress, total, time.time() + self.lease_seconds, job_id, STATUS_RUNNING)
+            )
+
+    def complete(self, job_id: str, ocr_result: str, confidence: float, cache_hit: bool = False,
+                 history_id: Optional[str] = None):
+        """ジョブを完了にして結果を保存（キャンセル済みのジョブは更新しない）"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, ocr_result = ?, confidence = ?, cache_hit = ?, "
+                "history_id = ?, error = NULL, progress = total, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status = ?",
+                (STATUS_DONE, ocr_result, confidence, int(cache_hit), history_id, time.time(),
+                 job_id, STATUS_RUNNING)
+            )
+
+    def fail(self, job_id: str, error: str):
+        """ジョブを失敗にする"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status = ?",
+                (STATUS_FAILED, error, time.time(), job_id, STATUS_RUNNING)
+            )
+
+    def fail_attempt(self, job_id: str, attempt: int, error: str) -> bool:
+        """
+        処理中の例外を1回の試行として記録
+
+        再試行回数の上限までは待機中に戻して再実行し、上限に達したら失敗にする
+        （試行回数は claim で数えているため、リース切れと例外のどちらも同じ上限で打ち切られる）。
+        attempt には claim で取得したときの試行回数を渡す（リース切れで別のワーカーが
+        再取得した後は更新しない）。
+
+        Returns:
+            bool: 再実行のために待機中に戻した場合はTrue
+        """
+        requeue = attempt < self.max_attempts
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, progress = 0, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status = ? AND attempts = ?",
+                (STATUS_QUEUED if requeue else STATUS_FAILED, error, None if requeue else time.time(),
+                 job_id, STATUS_RUNNING, attempt)
+            )
+        if requeue and cursor.rowcount:
+            self.new_job.set()
+        return requeue and cursor.rowcount > 0
+
+    def cancel(self, job_id: str) -> bool:
+        """待機中・実行中のジョブをキャンセル（実行中の場合は結果を破棄する）"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND status IN (?, ?)",
+                (STATUS_CANCELLED, time.time(), job_id, STATUS_QUEUED, STATUS_RUNNING)
+            )
+        return cursor.rowcount > 0
+
+    def retry(self, job_id: str) -> bool:
+        """失敗・キャンセルしたジョブを再投入（前回の結果・履歴IDも消して待機中に戻す）"""
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, ocr_result = NULL, confidence = NULL, cache_hit = 0, "
+                "history_id = NULL, error = NULL, attempts = 0, progress = 0, "
+                "started_at = NULL, finished_at = NULL, lease_until = NULL WHERE id = ? AND status IN (?, ?) "
+                "AND image_data IS NOT NULL",
+                (STATUS_QUEUED, job_id, STATUS_FAILED, STATUS_CANCELLED)
+            )
+        if cursor.rowcount:
+            self.new_job.set()
+        return cursor.rowcount > 0
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """ジョブの状態と結果を取得（画像データは含まない）"""
+        row = self._connect().execute(
+            f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def list_jobs(self, limit: int = 50, offset: int = 0, batch_id: Optional[str] = None,
+                  status: Optional[str] = None) -> List[Dict]:
+        """ジョブを新しい順に取得"""
+        conditions = []
+        params = []
+        if batch_id:
+            conditions.append("batch_id = ?")
+            params.append(batch_id)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self._connect().execute(
+            f"SELECT {_JOB_COLUMNS} FROM jobs {where}ORDER BY seq DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def counts(self, batch_id: Optional[str] = None) -> Dict[str, int]:
+        """状態ごとのジョブ数を取得"""
+        where, params = ("WHERE batch_id = ? ", (batch_id,)) if batch_id else ("", ())
+        rows = self._connect().execute(
+            f"SELECT status, count(*) AS n FROM jobs {where}GROUP BY status", params
+        ).fetchall()
+        counts = {status: 0 for status in (STATUS_QUEUED, STATUS_RUNNING) + FINISHED_STATUSES}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+    def purge(self, older_than: float = JOB_RETENTION) -> int:
+        """終了してから一定時間が経過したジョブを削除"""
+        conn = self._connect()
+        placeholders = ",".join("?" * len(FINISHED_STATUSES))
+        with conn:
+            cursor = conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?",
+                FINISHED_STATUSES + (time.time() - older_than,)
+            )
+        return cursor.rowcount
+
+
+def execute_job(queue: JobQueue, job: Dict):
+    """1件のジョブを処理し、結果をキューと（指定時は）履歴に保存"""
+    image_name = job["image_name"]
+    image_data = job["image_data"]
+    options = {
+        "language_hint": job["language_hint"],
+        "auto_rotate": job["auto_rotate"],
+        "table_recognition": job["table_recognition"]
+    }
+
+    cache_hit = False
+    if is_multipage_document(image_name, image_data):
+        total = min(count_pages(image_data), DOCUMENT_MAX_PAGES)
+        queue.update_progress(job["id"], 0, total)
+        results = []
+        for result in DocumentOCRProcessor(job["model_name"]).process(image_data, **options):
+            results.append(result)
+            queue.update_progress(job["id"], len(results), total)
+        ocr_result, confidence = stitch_pages(results)
+        history_image = render_first_page(image_data) if job["save_history"] else b""
+    else:
+        processor = OCRProcessor(job["model_name"])
+        ocr_result, confidence = processor.process_image_bytes(image_data, **options)
+        cache_hit = processor.last_run_info.get("cache_hit", False)
+        history_image = image_data
+
+    # 処理中にキャンセルされた場合は結果を保存しない
+    current = queue.get(job["id"])
+    if current is None or current["status"] != STATUS_RUNNING:
+        return
+
+    history_id = None
+    if job["save_history"]:
+        # ジョブIDを履歴IDとして使い、ジョブから履歴を参照できるようにする。
+        # リース切れで再実行した場合は、前回の実行で保存済みの履歴を重ねて保存しない
+        if get_history_items([job["id"]], include_images=False) or \
+                save_to_history(image_name, history_image, ocr_result, confidence, item_id=job["id"]):
+            history_id = job["id"]
+
+    queue.complete(job["id"], ocr_result, confidence, cache_hit, history_id)
+
+
+class JobWorkerPool:
+    """キューからジョブを取り出して処理するワーカースレッド群"""
+
+    def __init__(self, queue: JobQueue, workers: int = JOB_WORKERS,
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """ワーカースレッドを起動"""
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ocr-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None):
+        """実行中のジョブが終わるのを待ってワーカーを停止"""
+        self._stop.set()
+        self.queue.new_job.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                logger.warning("ジョブの取得に失敗しました: %s", e)
+                job = None
+            if job is None:
+                # 新しいジョブの登録（同一プロセス）か、ポーリング間隔の経過まで待機
+                self.queue.new_job.wait(self.poll_interval)
+                self.queue.new_job.clear()
+                continue
+            try:
+                with JOBS_RUNNING.track_inprogress():
+                    execute_job(self.queue, job)
+            except Exception as e:
+                logger.exception("ジョブの処理に失敗しました: %s", job["id"])
+                self.queue.fail_attempt(job["id"], job["attempts"], str(e))
+
+
+_queue: Optional[JobQueue] = None
+_pool: Optional[JobWorkerPool] = None
+_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """プロセス共通のジョブキューを取得"""
+    global _queue
+    if _queue is None:
+        with _lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
+
+
+def start_job_workers() -> JobWorkerPool:
+    """プロセス共通のワーカープールを起動（起動済みの場合はそのまま返す）"""
+    global _pool
+    queue = get_job_queue()
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                pool = JobWorkerPool(queue)
+                pool.start()
+                # 古い完了済みジョブを整理
+                try:
+                    queue.purge()
+                except Exception as e:
+                    logger.warning("古いジョブの削除に失敗しました: %s", e)
+                _pool = pool
+    return _pool
@@ -3,16 +3,39 @@ from streamlit_option_menu import option_menu
 from PIL import Image
 import io
 import base64
+import html
 from datetime import datetime
 import json
 
-from config import APP_NAME, APP_VERSION, APP_DESCRIPTION, GEMINI_API_KEY, GEMINI_MODEL, SUPPORTED_LANGUAGES, OCR_ENGINES
+from config import APP_NAME, APP_VERSION, APP_DESCRIPTION, GEMINI_API_KEY, GEMINI_MODEL, SUPPORTED_LANGUAGES, OCR_ENGINES, BATCH_MAX_WORKERS, HISTORY_PAGE_SIZE, DOCUMENT_MAX_PAGES, DOCUMENT_MAX_WORKERS, TILE_ENABLED, TILE_TRIGGER_SIDE, DUPLICATE_DETECTION_ENABLED, DUPLICATE_REUSE_RESULT, SESSION_MAX_RESULTS, MODEL_WARM_UP
 from ocr_processor import OCRProcessor
+from batch_processor import BatchOCRProcessor, expand_uploads
+from document_processor import DocumentOCRProcessor, count_pages, render_first_page, stitch_pages
+from ocr_cache import get_ocr_cache
+from model_pool import warm_up_in_background
+from job_queue import FINISHED_STATUSES, get_job_queue, start_job_workers
+from metrics import collect_trace, render_metrics, stage, stage_summary, start_metrics_exporter
+from image_preprocessor import get_preprocess_stats
+from duplicate_index import perceptual_hash
+from uploads import UploadedImage
+from styles import get_style_html, get_uploader_style_html
+from prompts import describe_prompts, get_prompt_variant
+from structured_ocr import get_tables, merge_page_results, table_to_dataframe
+from text_detector import get_precheck_stats
 from utils import (
     validate_image_file, 
     save_to_history, 
-    load_history, 
+    load_history_page,
+    load_history_image,
+    get_history_thumbnail,
+    count_history,
+    get_history_items,
+    search_history,
+    find_similar_history,
     delete_history_item,
+    clear_history,
+    get_image_store_stats,
+    collect_image_garbage,
     format_timestamp,
     get_file_size_display
 )
@@ -25,496 +48,27 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# ImmeasurableなカスタムCSS
-st.markdown("""
-<style>
-    /* メインヘッダー - グラデーションとアニメーション */
-    .main-header {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        padding: 3rem 2rem;
-        border-radius: 20px;
-        text-align: center;
-        margin-bottom: 3rem;
-        box-shadow: 0 20px 40px rgba(102, 126, 234, 0.3);
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .main-header::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: -100%;
-        width: 100%;
-        height: 100%;
-        background: linear-gradient(90deg, transparent, rgba(255,255,255,0.2), transparent);
-        animation: shimmer 3s infinite;
-    }
-    
-    @keyframes shimmer {
-        0% { left: -100%; }
-        100% { left: 100%; }
-    }
-    
-    .main-header h1 {
-        margin: 0;
-        font-size: 3.5rem;
-        font-weight: 800;
-        text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-        background: linear-gradient(45deg, #fff, #f0f8ff);
-        -webkit-background-clip: text;
-        -webkit-text-fill-color: transparent;
-        background-clip: text;
-    }
-    
-    .main-header p {
-        margin: 1rem 0 0 0;
-        font-size: 1.4rem;
-        opacity: 0.95;
-        font-weight: 300;
-        letter-spacing: 1px;
-    }
-    
-    /* 機能カード - モダンなデザイン */
-    .feature-card {
-        background: linear-gradient(145deg, #ffffff, #f8f9fa);
-        padding: 2rem;
-        border-radius: 20px;
-        box-shadow: 0 10px 30px rgba(0,0,0,0.1);
-        margin: 1.5rem 0;
-        border: none;
-        position: relative;
-        overflow: hidden;
-        transition: all 0.3s ease;
-    }
-    
-    .feature-card::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        width: 100%;
-        height: 4px;
-        background: linear-gradient(90deg, #667eea, #764ba2);
-    }
-    
-    .feature-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 20px 40px rgba(0,0,0,0.15);
-    }
-    
-    .feature-card h3 {
-        color: #667eea;
-        margin-top: 0;
-        font-size: 1.5rem;
-        font-weight: 600;
-    }
-    
-    /* 信頼度インジケーター */
-    .confidence-high {
-        color: #00d4aa;
-        font-weight: bold;
-        text-shadow: 0 0 10px rgba(0, 212, 170, 0.3);
-    }
-    
-    .confidence-medium {
-        color: #ffa726;
-        font-weight: bold;
-        text-shadow: 0 0 10px rgba(255, 167, 38, 0.3);
-    }
-    
-    .confidence-low {
-        color: #ff5722;
-        font-weight: bold;
-        text-shadow: 0 0 10px rgba(255, 87, 34, 0.3);
-    }
-    
-    /* 結果ボックス */
-    .result-box {
-        background: linear-gradient(145deg, #f8f9fa, #ffffff);
-        border: 2px solid transparent;
-        border-radius: 15px;
-        padding: 1.5rem;
-        margin: 1.5rem 0;
-        box-shadow: 0 5px 15px rgba(0,0,0,0.08);
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .result-box::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        height: 3px;
-        background: linear-gradient(90deg, #667eea, #764ba2);
-    }
-    
-    /* アップロードエリア */
-    .upload-area {
-        background: linear-gradient(145deg, #f8f9fa, #ffffff);
-        border: 3px dashed #667eea;
-        border-radius: 20px;
-        padding: 3rem;
-        text-align: center;
-        margin: 2rem 0;
-        transition: all 0.3s ease;
-        position: relative;
-        overflow: hidden;
-    }
-    
-    .upload-area:hover {
-        border-color: #764ba2;
-        background: linear-gradient(145deg, #f0f8ff, #ffffff);
-        transform: scale(1.02);
-    }
-    
-    .upload-area::before {
-        content: '';
-        position: absolute;
-        top: 0;
-        left: 0;
-        right: 0;
-        bottom: 0;
-        background: linear-gradient(45deg, transparent, rgba(102, 126, 234, 0.05), transparent);
-        opacity: 0;
-        transition: opacity 0.3s ease;
-    }
-    
-    .upload-area:hover::before {
-        opacity: 1;
-    }
-    
-    /* アニメーション */
-    @keyframes fadeInUp {
-        from {
-            opacity: 0;
-            transform: translateY(30px);
-        }
-        to {
-            opacity: 1;
-            transform: translateY(0);
-        }
-    }
-    
-    .fade-in-up {
-        animation: fadeInUp 0.6s ease-out;
-    }
-    
-    /* レスポンシブデザイン */
-    @media (max-width: 768px) {
-        .main-header h1 {
-            font-size: 2.5rem;
-        }
-        
-        .main-header p {
-            font-size: 1.1rem;
-        }
-        
-        .feature-card {
-            padding: 1.5rem;
-        }
-    }
-</style>
-""", unsafe_allow_html=True)
+# カスタムCSS（テーマごとに作成済みの<style>要素を使い回す）
+st.markdown(get_style_html(st.query_params.get("theme", "light")), unsafe_allow_html=True)
 
-# ダークテーマ用のCSS（URLパラメータで制御）
-if st.query_params.get("theme") == "dark":
-    st.markdown("""
-    <style>
-        /* ダークテーマ用の強力なスタイル */
-        .stApp {
-            background-color: #0e1117 !important;
-        }
-        
-        .main .block-container {
-            background-color: #0e1117 !important;
-            color: #ffffff !important;
-        }
-        
-        .stApp > div {
-            background-color: #0e1117 !important;
-        }
-        
-        .stApp > div > div {
-            background-color: #0e1117 !important;
-        }
-        
-        .stApp > div > div > div {
-            background-color: #0e1117 !important;
-        }
-        
-        /* サイドバー */
-        .stSidebar {
-            background-color: #0e1117 !important;
-        }
-        
-        .stSidebar > div {
-            background-color: #0e1117 !important;
-        }
-        
-        /* テキスト - より高いコントラスト */
-        h1, h2, h3, h4, h5, h6 {
-            color: #ffffff !important;
-            text-shadow: 0 0 2px rgba(255, 255, 255, 0.1) !important;
-        }
-        
-        p, div, span, label {
-            color: #e0e0e0 !important;
-        }
-        
-        /* ボタン - より目立つ色 */
-        .stButton > button {
-            background-color: #1f77b4 !important;
-            color: #ffffff !important;
-            border: 1px solid #1f77b4 !important;
-            box-shadow: 0 2px 4px rgba(31, 119, 180, 0.3) !important;
-        }
-        
-        .stButton > button:hover {
-            background-color: #0d5aa7 !important;
-            color: #ffffff !important;
-            box-shadow: 0 4px 8px rgba(31, 119, 180, 0.4) !important;
-        }
-        
-        /* 入力欄 - より高いコントラスト */
-        .stTextInput > div > div > input,
-        .stTextArea > div > div > textarea,
-        .stSelectbox > div > div {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-            border: 2px solid #444 !important;
-        }
-        
-        .stTextInput > div > div > input:focus,
-        .stTextArea > div > div > textarea:focus {
-            border-color: #1f77b4 !important;
-            box-shadow: 0 0 0 2px rgba(31, 119, 180, 0.2) !important;
-        }
-        
-        /* ファイルアップローダー */
-        .stFileUploader > div {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-            border: 2px dashed #666 !important;
-        }
-        
-        .stFileUploader > div > div {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-        }
-        
-        .stFileUploader label {
-            color: #e0e0e0 !important;
-        }
-        
-        .stFileUploader button {
-            background-color: #1f77b4 !important;
-            color: #ffffff !important;
-            border: 1px solid #1f77b4 !important;
-        }
-        
-        .stFileUploader button:hover {
-            background-color: #0d5aa7 !important;
-            color: #ffffff !important;
-        }
-        
-        /* ファイルアップローダーの詳細スタイル */
-        .stFileUploader > div > div > div {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-        }
-        
-        .stFileUploader > div > div > div > div {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-        }
-        
-        .stFileUploader > div > div > div > div > div {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-        }
-        
-        /* ファイルアップローダーのテキスト */
-        .stFileUploader p {
-            color: #e0e0e0 !important;
-        }
-        
-        .stFileUploader span {
-            color: #e0e0e0 !important;
-        }
-        
-        .stFileUploader div {
-            color: #e0e0e0 !important;
-        }
-        
-        /* ファイルアップローダーのドラッグエリア */
-        .stFileUploader > div > div > div > div > div > div {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-            border: 2px dashed #666 !important;
-        }
-        
-        /* ファイルアップローダーのドラッグテキスト */
-        .stFileUploader > div > div > div > div > div > div > div {
-            color: #e0e0e0 !important;
-        }
-        
-        .stFileUploader > div > div > div > div > div > div > div > div {
-            color: #e0e0e0 !important;
-        }
-        
-        /* ファイルアップローダーのボタンエリア */
-        .stFileUploader > div > div > div > div > div > div > div > div > div {
-            background-color: #1a1a1a !important;
-        }
-        
-        .stFileUploader > div > div > div > div > div > div > div > div > div > button {
-            background-color: #1f77b4 !important;
-            color: #ffffff !important;
-            border: 1px solid #1f77b4 !important;
-        }
-        
-        .stFileUploader > div > div > div > div > div > div > div > div > div > button:hover {
-            background-color: #0d5aa7 !important;
-            color: #ffffff !important;
-        }
-        
-        /* カスタム要素 */
-        .main-header {
-            color: #4fc3f7 !important;
-            text-shadow: 0 0 4px rgba(79, 195, 247, 0.3) !important;
-        }
-        
-        .result-box {
-            background-color: #1a1a1a !important;
-            border: 2px solid #444 !important;
-            color: #ffffff !important;
-            box-shadow: 0 4px 8px rgba(0, 0, 0, 0.3) !important;
-        }
-        
-        .upload-area {
-            border-color: #666 !important;
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-        }
-        
-        /* 情報ボックス - より高いコントラスト */
-        .stAlert {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-            border: 2px solid #444 !important;
-            box-shadow: 0 2px 4px rgba(0, 0, 0, 0.2) !important;
-        }
-        
-        /* エクスパンダー */
-        .streamlit-expanderHeader {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-            border: 1px solid #444 !important;
-        }
-        
-        .streamlit-expanderContent {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-            border: 1px solid #444 !important;
-        }
-        
-        /* メトリクス */
-        .stMetric {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-            border: 1px solid #444 !important;
-        }
-        
-        /* プログレスバー */
-        .stProgress > div > div > div {
-            background-color: #1f77b4 !important;
-        }
-        
-        /* スピナー */
-        .stSpinner {
-            color: #1f77b4 !important;
-        }
-        
-        /* コードブロック */
-        pre, code {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-            border: 1px solid #444 !important;
-        }
-        
-        /* テーブル */
-        .stDataFrame {
-            background-color: #1a1a1a !important;
-            color: #ffffff !important;
-        }
-        
-        /* チェックボックス */
-        .stCheckbox > label {
-            color: #e0e0e0 !important;
-        }
-        
-        /* ラジオボタン */
-        .stRadio > label {
-            color: #e0e0e0 !important;
-        }
-        
-        /* スライダー */
-        .stSlider > div > div > div {
-            background-color: #1f77b4 !important;
-        }
-        
-        /* セレクトボックス */
-        .stSelectbox > label {
-            color: #e0e0e0 !important;
-        }
-        
-        /* マークダウン */
-        .stMarkdown {
-            color: #e0e0e0 !important;
-        }
-        
-        /* リンク */
-        a {
-            color: #4fc3f7 !important;
-        }
-        
-        a:hover {
-            color: #81d4fa !important;
-        }
-        
-        /* 成功メッセージ */
-        .stSuccess {
-            background-color: #1a1a1a !important;
-            color: #4caf50 !important;
-            border: 2px solid #4caf50 !important;
-        }
-        
-        /* エラーメッセージ */
-        .stError {
-            background-color: #1a1a1a !important;
-            color: #f44336 !important;
-            border: 2px solid #f44336 !important;
-        }
-        
-        /* 警告メッセージ */
-        .stWarning {
-            background-color: #1a1a1a !important;
-            color: #ff9800 !important;
-            border: 2px solid #ff9800 !important;
-        }
-        
-        /* 情報メッセージ */
-        .stInfo {
-            background-color: #1a1a1a !important;
-            color: #2196f3 !important;
-            border: 2px solid #2196f3 !important;
-        }
-    </style>
-    """, unsafe_allow_html=True)
+@st.cache_resource
+def warm_up_models() -> bool:
+    """全セッションで共有するGeminiモデルをバックグラウンドで準備（最初の描画はSDKの読み込みを待たない）"""
+    if not MODEL_WARM_UP:
+        return False
+    warm_up_in_background(OCR_ENGINES.values())
+    return True
+
+@st.cache_resource
+def start_background_workers() -> bool:
+    """バックグラウンドジョブのワーカー（とメトリクスの書き出し）をプロセス内で一度だけ起動"""
+    try:
+        start_job_workers()
+        start_metrics_exporter()
+    except Exception as e:
+        print(f"ジョブワーカーの起動に失敗しました: {e}")  # デバッグ用
+        return False
+    return True
 
 def main():
     """メインアプリケーション"""
@@ -534,8 +88,8 @@ def main():
     with st.sidebar:
         selected = option_menu(
             "メニュー",
-            ["🏠 ホーム", "📚 履歴", "⚙️ 設定", "❓ ヘルプ"],
-            icons=['house', 'clock-history', 'gear', 'question-circle'],
+            ["🏠 ホーム", "📦 一括処理", "🕒 ジョブ", "📚 履歴", "⚙️ 設定", "❓ ヘルプ"],
+            icons=['house', 'collection', 'hourglass-split', 'clock-history', 'gear', 'question-circle'],
             menu_icon="cast",
             default_index=0,
         )
@@ -545,25 +99,39 @@ def main():
         st.error("⚠️ Gemini APIキーが設定されていません。設定画面でAPIキーを入力してください。")
         return
     
-    # ページ表示
-    if selected == "🏠 ホーム":
-        show_home_page()
-    elif selected == "📚 履歴":
-        show_history_page()
-    elif selected == "⚙️ 設定":
-        show_settings_page()
-    elif selected == "❓ ヘルプ":
-        show_help_page()
+    # モデルとAPIクライアントをバックグラウンドで事前生成（プロセス内で一度だけ）
+    warm_up_models()
+    start_background_workers()
+    
+    # ページ表示（ページごとの描画時間を計測）
+    pages = {
+        "🏠 ホーム": ("home", show_home_page),
+        "📦 一括処理": ("batch", show_batch_page),
+        "🕒 ジョブ": ("jobs", show_jobs_page),
+        "📚 履歴": ("history", show_history_page),
+        "⚙️ 設定": ("settings", show_settings_page),
+        "❓ ヘルプ": ("help", show_help_page),
+    }
+    page_name, show_page = pages[selected]
+    with stage(f"render_{page_name}"):
+        show_page()
 
-def show_home_page():
-    """ホームページ（OCR処理）"""
-    st.markdown("""
-    <div class="main-header fade-in-up">
-        <h1>✨ Immeasurable OCR</h1>
-        <p>無限の可能性を秘めた画像文字認識システム</p>
-    </div>
-    """, unsafe_allow_html=True)
-    
+def show_trace_panel(trace: list):
+    """1回の処理の段階ごとの所要時間を表示"""
+    if not trace:
+        return
+    # pandasは読み込みに0.5秒ほどかかるため、表を表示するときまで遅らせる
+    import pandas as pd
+    with st.expander("🔬 処理時間の内訳", expanded=True):
+        df = pd.DataFrame(trace).groupby("stage", sort=False, as_index=False)["ms"].sum()
+        st.bar_chart(df, x="stage", y="ms", horizontal=True)
+        st.dataframe(
+            df.rename(columns={"stage": "処理段階", "ms": "所要時間 (ms)"}).round(1),
+            hide_index=True, use_container_width=True
+        )
+
+def show_ocr_settings():
+    """OCR設定パネルを表示して選択内容を返す"""
     # OCR.space風の設定パネル
     with st.expander("⚙️ OCR設定", expanded=True):
         col1, col2, col3 = st.columns(3)
@@ -601,6 +169,20 @@ def show_home_page():
     - テーブル認識: {'有効' if table_recognition else '無効'}
     """)
     
+    return selected_language, selected_engine, auto_rotate, table_recognition
+
+def show_home_page():
+    """ホームページ（OCR処理）"""
+    st.markdown("""
+    <div class="main-header fade-in-up">
+        <h1>✨ Immeasurable OCR</h1>
+        <p>無限の可能性を秘めた画像文字認識システム</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # OCR設定パネル
+    selected_language, selected_engine, auto_rotate, table_recognition = show_ocr_settings()
+    
     # 画像アップロード
     st.subheader("📁 画像をアップロード")
     
@@ -609,239 +191,583 @@ def show_home_page():
     **📋 画像アップロード方法:**
     - **クリック**: 下の「ファイルを選択」ボタンをクリックして画像を選択
     - **ドラッグ&ドロップ**: 画像ファイルを下のエリアにドラッグ&ドロップ
-    - **対応形式**: JPG, JPEG, PNG, GIF, BMP, TIFF
+    - **対応形式**: JPG, JPEG, PNG, GIF, BMP, TIFF, PDF（複数ページ対応）
     - **最大サイズ**: 10MB
     """)
     
     # アップロードエリアを広くするためのCSS
-    st.markdown("""
-    <style>
-    /* ファイルアップローダーのスタイルをカスタマイズ */
-    .stFileUploader > div {
-        min-height: 120px !important;
-        padding: 20px !important;
-    }
-    
-    .stFileUploader > div > div {
-        min-height: 80px !important;
-        border: 2px dashed #1f77b4 !important;
-        border-radius: 10px !important;
-        padding: 20px !important;
-        text-align: center !important;
-        background-color: #f8f9fa !important;
-        transition: all 0.3s ease !important;
-    }
-    
-    .stFileUploader > div > div:hover {
-        border-color: #0d5aa7 !important;
-        background-color: #e3f2fd !important;
-    }
-    
-    /* ダークテーマ対応 */
-    [data-testid="stAppViewContainer"] [data-theme="dark"] .stFileUploader > div > div {
-        background-color: #2d2d2d !important;
-        border-color: #666 !important;
-        color: #ffffff !important;
-    }
-    
-    [data-testid="stAppViewContainer"] [data-theme="dark"] .stFileUploader > div > div:hover {
-        border-color: #1f77b4 !important;
-        background-color: #3a3a3a !important;
-    }
-    
-    /* ファイルアップローダーのテキストを日本語に変更 - より具体的なセレクター */
-    .stFileUploader > div > div::before {
-        content: "📁 ここをクリックしてファイルを選択 または 画像をドラッグ&ドロップ" !important;
-        display: block !important;
-        font-size: 16px !important;
-        font-weight: bold !important;
-        color: #1f77b4 !important;
-        text-align: center !important;
-        margin-bottom: 10px !important;
-        padding: 10px !important;
-        position: relative !important;
-        z-index: 1000 !important;
-    }
-    
-    /* 英語のテキストを非表示 - より具体的なセレクター */
-    .stFileUploader > div > div > div:first-child,
-    .stFileUploader > div > div > div:first-child > div,
-    .stFileUploader > div > div > div:first-child > span,
-    .stFileUploader > div > div > div:first-child > p {
-        display: none !important;
-        visibility: hidden !important;
-    }
-    
-    /* ボタンテキストも日本語に変更 */
-    .stFileUploader > div > div::after {
-        content: "📁 ファイルを選択" !important;
-        display: inline-block !important;
-        background-color: #1f77b4 !important;
-        color: white !important;
-        padding: 8px 16px !important;
-        border-radius: 5px !important;
-        font-size: 14px !important;
-        font-weight: bold !important;
-        cursor: pointer !important;
-        margin-top: 10px !important;
-        position: relative !important;
-        z-index: 1000 !important;
-    }
-    
-    /* ダークテーマでのテキスト色 */
-    [data-testid="stAppViewContainer"] [data-theme="dark"] .stFileUploader > div > div::before {
-        color: #1f77b4 !important;
-    }
-    
-    [data-testid="stAppViewContainer"] [data-theme="dark"] .stFileUploader > div > div::after {
-        background-color: #1f77b4 !important;
-        color: white !important;
-    }
-    
-    /* 追加の非表示ルール */
-    .stFileUploader > div > div > div:first-child * {
-        display: none !important;
-        visibility: hidden !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    st.markdown(get_uploader_style_html(), unsafe_allow_html=True)
     
     uploaded_file = st.file_uploader(
         "📁 画像ファイルをアップロード",
-        type=['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff'],
+        type=['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'pdf'],
         help="画像ファイルをクリックして選択するか、ドラッグ&ドロップしてください",
         label_visibility="visible"
     )
     
     if uploaded_file is not None:
+        # バイト列・内容ハッシュ・形式の判定・デコードはアップロードごとに1回だけ行い、再実行時は使い回す
+        cached_upload = st.session_state.get("home_upload")
+        if cached_upload is None or cached_upload[0] != uploaded_file.file_id:
+            cached_upload = (uploaded_file.file_id, UploadedImage.from_upload(uploaded_file))
+            st.session_state["home_upload"] = cached_upload
+        upload = cached_upload[1]
+        
         # ファイル検証
-        is_valid, message = validate_image_file(uploaded_file)
+        is_valid, message = validate_image_file(upload)
         if not is_valid:
             st.error(f"❌ {message}")
             return
         
         st.success(f"✅ {message}")
         
+        # PDF・複数フレームの画像はページ単位で処理
+        if upload.is_multipage():
+            show_document_ocr(upload, selected_language, selected_engine, auto_rotate, table_recognition)
+            return
+        
         # 画像表示
         col1, col2 = st.columns([1, 1])
         with col1:
             st.subheader("アップロードされた画像")
-            image = Image.open(uploaded_file)
-            st.image(image, caption=uploaded_file.name, use_container_width=True)
+            try:
+                image = upload.image
+            except Exception:
+                st.error("❌ 画像を読み込めませんでした（ファイルが壊れている可能性があります）")
+                return
+            st.image(upload.display_source, caption=upload.name, use_container_width=True)
             
             # ファイル情報
             st.info(f"""
             **ファイル情報:**
-            - ファイル名: {uploaded_file.name}
-            - サイズ: {get_file_size_display(uploaded_file.size)}
-            - 形式: {uploaded_file.type}
+            - ファイル名: {upload.name}
+            - サイズ: {get_file_size_display(upload.size)}
+            - 形式: {upload.mime_type}
             - 寸法: {image.size[0]} × {image.size[1]} ピクセル
             """)
         
         with col2:
             st.subheader("OCR処理")
             
-            if st.button("🚀 文字起こし開始", type="primary"):
+            stream_output = st.checkbox("⚡ ストリーミング表示", value=True,
+                                        help="読み取った文字列を生成され次第表示します")
+            show_trace = st.checkbox("🔬 処理時間の内訳を表示", value=False,
+                                     help="画像の読み込み・前処理・API呼び出し・履歴保存などの所要時間を表示します")
+            tile_large = st.checkbox("🧩 大きな画像はタイル分割して読み取る", value=TILE_ENABLED,
+                                     help=f"長辺が{TILE_TRIGGER_SIDE}ピクセルを超える画像を重なりのあるタイルに分割し、"
+                                          "並列に読み取って結合します（小さな文字の読み落としを防ぎます）")
+            structured_output = st.checkbox("🧱 構造化出力（ブロック・位置・表を取得）", value=False,
+                                            help="JSONスキーマを指定して応答させ、ブロックごとの位置・信頼度・言語と"
+                                                 "表のセルを取得します（結果は全体を受信してから表示されます）")
+            
+            # アップロード内容のハッシュ（似た画像の確認と結果の保持に使用）
+            upload_key = upload.content_hash
+            
+            # 同じ文書を再スキャン・再撮影した画像が履歴にあるか確認（アップロードごとに1回だけ）
+            image_phash = None
+            duplicate = None
+            if DUPLICATE_DETECTION_ENABLED:
+                duplicate_checks = st.session_state.setdefault("duplicate_checks", {})
+                if upload_key not in duplicate_checks:
+                    phash = perceptual_hash(image)
+                    similar = find_similar_history(phash)
+                    duplicate_checks[upload_key] = (phash, similar[0] if similar else None)
+                image_phash, duplicate = duplicate_checks[upload_key]
+            
+            reuse_duplicate = False
+            if duplicate:
+                st.warning(f"🔁 似た画像が履歴にあります: {duplicate['image_name']}"
+                           f"（{format_timestamp(duplicate['timestamp'])}、差異 {duplicate['distance']}/64）")
+                reuse_duplicate = st.checkbox("♻️ 前回の結果を再利用する（Gemini APIを呼び出さない）",
+                                              value=DUPLICATE_REUSE_RESULT)
+            
+            # 結果はアップロード内容と設定ごとにセッションに保持し、ボタン操作などによる再実行では
+            # APIを呼び出さずに保持した結果を表示する
+            result_key = ":".join([upload_key, OCR_ENGINES[selected_engine], SUPPORTED_LANGUAGES[selected_language],
+                                   str(auto_rotate), str(table_recognition), str(tile_large),
+                                   str(structured_output)])
+            ocr_results = st.session_state.setdefault("ocr_results", {})
+            # 「🔄 再処理」が押された場合はキャッシュを使わずに処理し直す
+            reprocess = st.session_state.pop("reprocess_key", None) == result_key
+            
+            if st.button("🚀 文字起こし開始", type="primary") or reprocess:
                 try:
-                    with st.spinner("画像を解析中..."):
+                    trace = []
+                    if reuse_duplicate and not reprocess:
+                        ocr_result, confidence = duplicate["ocr_result"], duplicate.get("confidence", 0.0)
+                        run_info = {"duplicate_of": duplicate["id"]}
+                    else:
                         # OCR処理
-                        processor = OCRProcessor(OCR_ENGINES[selected_engine])
-                        ocr_result, confidence = processor.process_image(
-                            image, 
+                        processor = OCRProcessor(OCR_ENGINES[selected_engine], structured=structured_output)
+                        ocr_options = dict(
                             language_hint=SUPPORTED_LANGUAGES[selected_language],
                             auto_rotate=auto_rotate,
-                            table_recognition=table_recognition
+                            table_recognition=table_recognition,
+                            image=image,
+                            use_cache=not reprocess,
+                            tiling=None if tile_large else False
                         )
-                    
-                    # 結果表示
-                    st.success("✅ OCR処理が完了しました！")
-                    
-                    # 信頼度表示
-                    confidence_percent = confidence * 100
-                    if confidence_percent >= 80:
-                        confidence_class = "confidence-high"
-                        confidence_text = "高"
-                        confidence_emoji = "🟢"
-                    elif confidence_percent >= 60:
-                        confidence_class = "confidence-medium"
-                        confidence_text = "中"
-                        confidence_emoji = "🟡"
-                    else:
-                        confidence_class = "confidence-low"
-                        confidence_text = "低"
-                        confidence_emoji = "🔴"
-                    
-                    # OCR.space風の結果表示
-                    st.markdown(f"""
-                    <div class="result-box">
-                        <h4>📝 OCR結果</h4>
-                        <div style="background-color: #ffffff; padding: 1rem; border-radius: 5px; border: 1px solid #ddd; margin: 1rem 0;">
-                            <pre style="white-space: pre-wrap; font-family: 'Courier New', monospace; margin: 0;">{ocr_result}</pre>
-                        </div>
-                        <p class="{confidence_class}">
-                            <strong>{confidence_emoji} 信頼度: {confidence_text} ({confidence_percent:.1f}%)</strong>
-                        </p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # 結果の編集とアクション
-                    st.subheader("📝 結果の編集")
-                    
-                    col1, col2 = st.columns([3, 1])
-                    with col1:
-                        edited_result = st.text_area(
-                            "結果を編集してください",
-                            value=ocr_result,
-                            height=200,
-                            label_visibility="collapsed"
-                        )
-                    
-                    with col2:
-                        st.markdown("**アクション**")
-                        if st.button("📋 コピー", type="secondary"):
-                            st.write("```")
-                            st.code(edited_result)
-                            st.write("```")
-                            st.success("結果をクリップボードにコピーしました！")
                         
-                        if st.button("🔄 再処理", type="secondary"):
-                            st.rerun()
+                        with collect_trace(trace):
+                            if stream_output:
+                                # 生成途中の文字列を順次表示し、完了後に保持した結果の表示へ置き換える
+                                stream_placeholder = st.empty()
+                                with stream_placeholder.container():
+                                    st.markdown("**📝 読み取り中...**")
+                                    st.write_stream(processor.stream_image_bytes(upload.data, **ocr_options))
+                                stream_placeholder.empty()
+                                ocr_result, confidence = processor.last_run_info["result"]
+                            else:
+                                with st.spinner("画像を解析中..."):
+                                    ocr_result, confidence = processor.process_image_bytes(
+                                        upload.data, **ocr_options
+                                    )
+                        run_info = processor.last_run_info
                     
-                    # 自動で履歴に保存
-                    image_data = base64.b64encode(uploaded_file.getvalue()).decode()
-                    if save_to_history(
-                        uploaded_file.name, 
-                        image_data, 
-                        ocr_result, 
-                        confidence
-                    ):
-                        st.success("✅ 履歴に自動保存しました")
-                    else:
-                        st.error("❌ 履歴の保存に失敗しました")
+                    # 自動で履歴に保存（画像は内容ハッシュごとに1回だけ保存される）
+                    with collect_trace(trace):
+                        saved = save_to_history(
+                            upload.name, 
+                            upload.data, 
+                            ocr_result, 
+                            confidence,
+                            perceptual_hash=image_phash
+                        )
                     
-                    # 手動保存ボタン（編集後の結果を保存）
-                    if st.button("💾 編集結果を履歴に保存"):
-                        if save_to_history(
-                            uploaded_file.name, 
-                            image_data, 
-                            edited_result, 
-                            confidence
-                        ):
-                            st.success("✅ 編集結果を履歴に保存しました")
-                        else:
-                            st.error("❌ 履歴の保存に失敗しました")
+                    # 同じキーの結果は置き換え、古いものから上限を超えた分を捨てる
+                    ocr_results.pop(result_key, None)
+                    ocr_results[result_key] = {
+                        "ocr_result": ocr_result,
+                        "confidence": confidence,
+                        "run_info": run_info,
+                        "trace": trace,
+                        "saved": saved
+                    }
+                    while len(ocr_results) > SESSION_MAX_RESULTS:
+                        ocr_results.pop(next(iter(ocr_results)))
+                    # 編集欄は新しい結果で初期化する
+                    st.session_state.pop(f"edited_{result_key}", None)
                     
                 except Exception as e:
                     st.error(f"❌ エラーが発生しました: {str(e)}")
+            
+            entry = ocr_results.get(result_key)
+            if entry is not None:
+                show_ocr_result(entry, result_key, upload.name, upload.data, image_phash, show_trace)
+
+def show_ocr_result(entry: dict, result_key: str, image_name: str, image_data: bytes,
+                    image_phash, show_trace: bool):
+    """セッションに保持したOCR結果と編集欄を表示（再実行のたびに呼ばれるがAPIは呼び出さない）"""
+    ocr_result = entry["ocr_result"]
+    confidence = entry["confidence"]
+    run_info = entry["run_info"]
+    
+    # 結果表示
+    st.success("✅ OCR処理が完了しました！")
+    if run_info.get("duplicate_of"):
+        st.info("♻️ 似た画像の前回の結果を再利用しました（API呼び出しなし）")
+    if run_info.get("cache_hit"):
+        st.info("⚡ キャッシュから結果を取得しました（API呼び出しなし）")
+    if run_info.get("no_text"):
+        st.info("📭 文字が見つからなかったため、Gemini APIを呼び出しませんでした")
+    tiles = run_info.get("tiles")
+    if tiles:
+        tile_errors = run_info.get("tile_errors", 0)
+        tile_skipped = run_info.get("tile_skipped", 0)
+        st.caption(f"🧩 {tiles}枚のタイルに分割して並列に読み取りました"
+                   + (f"（{tile_errors}枚は失敗）" if tile_errors else "")
+                   + (f"（{tile_skipped}枚は文字なしのため省略）" if tile_skipped else ""))
+    preprocess_stats = run_info.get("preprocess")
+    if preprocess_stats:
+        st.caption(
+            f"📉 送信サイズ: {get_file_size_display(preprocess_stats['bytes_before'])} → "
+            f"{get_file_size_display(preprocess_stats['bytes_after'])}"
+            f"（{preprocess_stats['processed_size'][0]} × {preprocess_stats['processed_size'][1]} ピクセル, "
+            f"前処理 {preprocess_stats['elapsed_ms']:.0f} ms）"
+        )
+    
+    # 信頼度表示
+    confidence_percent = confidence * 100
+    if confidence_percent >= 80:
+        confidence_class = "confidence-high"
+        confidence_text = "高"
+        confidence_emoji = "🟢"
+    elif confidence_percent >= 60:
+        confidence_class = "confidence-medium"
+        confidence_text = "中"
+        confidence_emoji = "🟡"
+    else:
+        confidence_class = "confidence-low"
+        confidence_text = "低"
+        confidence_emoji = "🔴"
+    
+    # OCR.space風の結果表示
+    st.markdown(f"""
+    <div class="result-box">
+        <h4>📝 OCR結果</h4>
+        <div style="background-color: #ffffff; padding: 1rem; border-radius: 5px; border: 1px solid #ddd; margin: 1rem 0;">
+            <pre style="white-space: pre-wrap; font-family: 'Courier New', monospace; margin: 0;">{ocr_result}</pre>
+        </div>
+        <p class="{confidence_class}">
+            <strong>{confidence_emoji} 信頼度: {confidence_text} ({confidence_percent:.1f}%)</strong>
+        </p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    structured = run_info.get("structured")
+    if structured:
+        show_structured_result(structured, result_key)
+    
+    # 結果の編集とアクション
+    st.subheader("📝 結果の編集")
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        edited_result = st.text_area(
+            "結果を編集してください",
+            value=entry.get("edited", ocr_result),
+            height=200,
+            key=f"edited_{result_key}",
+            label_visibility="collapsed"
+        )
+        # 別のページへ移動して編集欄の状態が破棄されても、編集内容を復元できるようにする
+        entry["edited"] = edited_result
+    
+    with col2:
+        st.markdown("**アクション**")
+        if st.button("📋 コピー", type="secondary"):
+            st.write("```")
+            st.code(edited_result)
+            st.write("```")
+            st.success("結果をクリップボードにコピーしました！")
+        
+        if st.button("🔄 再処理", type="secondary"):
+            st.session_state["reprocess_key"] = result_key
+            st.rerun()
+    
+    if entry["saved"]:
+        st.success("✅ 履歴に自動保存しました")
+    else:
+        st.error("❌ 履歴の保存に失敗しました")
+    
+    if show_trace:
+        show_trace_panel(entry["trace"])
+    
+    # 手動保存ボタン（編集後の結果を保存）
+    if st.button("💾 編集結果を履歴に保存"):
+        if save_to_history(
+            image_name, 
+            image_data, 
+            edited_result, 
+            confidence,
+            perceptual_hash=image_phash
+        ):
+            st.success("✅ 編集結果を履歴に保存しました")
+        else:
+            st.error("❌ 履歴の保存に失敗しました")
+
+def show_structured_result(structured: dict, result_key: str):
+    """構造化出力のブロック一覧と表を表示"""
+    import pandas as pd
+    blocks = structured["blocks"]
+    with st.expander(f"🧱 構造化データ（{len(blocks)}ブロック、言語: {structured['language'] or '不明'}）"):
+        if blocks:
+            st.dataframe(pd.DataFrame([
+                {
+                    # 複数ページ文書ではブロックごとにページ番号を表示
+                    **({"ページ": block["page"]} if "page" in block else {}),
+                    "種類": block["type"],
+                    "信頼度 (%)": round(block["confidence"] * 100, 1),
+                    "位置 [上, 左, 下, 右]": ", ".join(map(str, block["bbox"])) if block["bbox"] else "-",
+                    "行数": len(block["lines"]),
+                    "文字列": block["text"][:80]
+                }
+                for block in blocks
+            ]), hide_index=True, use_container_width=True)
+        
+        # 表はセルをそのままDataFrameにする（文字列を解析し直さない）
+        for number, block in enumerate(get_tables(structured), start=1):
+            st.markdown(f"**📊 表 {number}**")
+            table = table_to_dataframe(block)
+            st.dataframe(table, hide_index=True, use_container_width=True)
+            st.download_button(
+                f"📥 表 {number} をCSVでダウンロード",
+                table.to_csv(index=False).encode("utf-8-sig"),
+                file_name=f"ocr_table_{number}.csv",
+                mime="text/csv",
+                key=f"table_{number}_{result_key}"
+            )
+        
+        st.download_button(
+            "📥 構造化データをJSONでダウンロード",
+            json.dumps(structured, ensure_ascii=False, indent=2).encode("utf-8"),
+            file_name="ocr_result.json",
+            mime="application/json",
+            key=f"structured_{result_key}"
+        )
+
+def show_document_ocr(upload: UploadedImage, selected_language, selected_engine, auto_rotate, table_recognition):
+    """複数ページ文書（PDF・マルチフレームTIFF/GIF）のOCR処理"""
+    import pandas as pd
+    file_data = upload.data
+    try:
+        page_count = count_pages(file_data)
+        preview = render_first_page(file_data)
+    except Exception as e:
+        st.error(f"❌ 文書の読み込みに失敗しました: {str(e)}")
+        return
+    
+    target_pages = min(page_count, DOCUMENT_MAX_PAGES)
+    
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        st.subheader("アップロードされた文書")
+        st.image(preview, caption=f"{upload.name}（1ページ目）", use_container_width=True)
+        
+        # ファイル情報
+        st.info(f"""
+        **ファイル情報:**
+        - ファイル名: {upload.name}
+        - サイズ: {get_file_size_display(upload.size)}
+        - ページ数: {page_count}{f"（先頭{target_pages}ページを処理）" if page_count > target_pages else ""}
+        """)
+    
+    with col2:
+        st.subheader("OCR処理")
+        
+        max_workers = st.slider("⚡ 同時処理ページ数", 1, 16, DOCUMENT_MAX_WORKERS,
+                                help="Gemini APIへ同時に送信するページ数")
+        structured_output = st.checkbox("🧱 構造化出力（ブロック・位置・表を取得）", value=False,
+                                        help="JSONスキーマを指定して応答させ、ページごとのブロックの位置・信頼度・"
+                                             "言語と表のセルを取得して文書全体にまとめます")
+        
+        if st.button("🚀 全ページを文字起こし", type="primary"):
+            processor = DocumentOCRProcessor(OCR_ENGINES[selected_engine], max_workers=max_workers,
+                                             structured=structured_output)
+            progress = st.progress(0.0, text="処理を開始しています...")
+            results = []
+            
+            try:
+                for result in processor.process(
+                    file_data,
+                    language_hint=SUPPORTED_LANGUAGES[selected_language],
+                    auto_rotate=auto_rotate,
+                    table_recognition=table_recognition
+                ):
+                    results.append(result)
+                    progress.progress(len(results) / target_pages, text=f"{len(results)} / {target_pages} ページ完了")
+            except Exception as e:
+                st.error(f"❌ エラーが発生しました: {str(e)}")
+                return
+            
+            ocr_result, confidence = stitch_pages(results)
+            failed = sum(1 for result in results if result["error"])
+            if failed:
+                st.warning(f"⚠️ {failed}ページの処理に失敗しました")
+            st.success(f"✅ OCR処理が完了しました！（平均信頼度: {confidence * 100:.1f}%）")
+            
+            # ページごとの信頼度
+            st.dataframe(pd.DataFrame([
+                {
+                    "ページ": result["page"],
+                    "信頼度": f"{result['confidence'] * 100:.1f}%",
+                    "状態": f"エラー: {result['error']}" if result["error"] else (
+                        "キャッシュ" if result["cache_hit"] else ("文字なし" if result["no_text"] else "完了"))
+                }
+                for result in sorted(results, key=lambda result: result["page"])
+            ]), hide_index=True, use_container_width=True)
+            
+            st.text_area("📝 OCR結果", value=ocr_result, height=400)
+            
+            if structured_output:
+                show_structured_result(merge_page_results(results), f"document:{upload.content_hash}")
+            
+            # 履歴には先頭ページの画像とともに保存
+            if save_to_history(upload.name, preview, ocr_result, confidence):
+                st.success("✅ 履歴に自動保存しました")
+            else:
+                st.error("❌ 履歴の保存に失敗しました")
+
+def show_batch_page():
+    """一括処理ページ（複数画像・ZIP）"""
+    import pandas as pd
+    st.header("📦 一括処理")
+    
+    selected_language, selected_engine, auto_rotate, table_recognition = show_ocr_settings()
+    
+    uploaded_files = st.file_uploader(
+        "📁 画像ファイルまたはZIPをアップロード",
+        type=['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'zip'],
+        accept_multiple_files=True,
+        help="複数の画像、または画像をまとめたZIPファイルを選択してください"
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        max_workers = st.slider("⚡ 同時処理数", 1, 16, BATCH_MAX_WORKERS,
+                                help="Gemini APIへ同時に送信するリクエスト数")
+    with col2:
+        save_results = st.checkbox("💾 結果を履歴に保存", value=True)
+        run_in_background = st.checkbox(
+            "🕒 バックグラウンドで実行", value=False,
+            help="ジョブとして登録し、画面を閉じても処理を続けます（進捗は「ジョブ」ページで確認）"
+        )
+    
+    if not uploaded_files:
+        st.info("📝 画像ファイルまたはZIPファイルをアップロードしてください。")
+        return
+    
+    images, warnings = expand_uploads((f.name, f.getvalue()) for f in uploaded_files)
+    for warning in warnings:
+        st.warning(f"⚠️ {warning}")
+    
+    st.info(f"📊 {len(images)}件の画像を処理します")
+    
+    if images and run_in_background and st.button("🕒 ジョブとして登録", type="primary"):
+        batch_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+        try:
+            get_job_queue().submit_many(
+                images,
+                model_name=OCR_ENGINES[selected_engine],
+                language_hint=SUPPORTED_LANGUAGES[selected_language],
+                auto_rotate=auto_rotate,
+                table_recognition=table_recognition,
+                save_history=save_results,
+                batch_id=batch_id
+            )
+        except Exception as e:
+            st.error(f"❌ ジョブの登録に失敗しました: {str(e)}")
+            return
+        # 再接続後もURLから一括処理の状態を確認できるようにする
+        st.query_params["batch"] = batch_id
+        st.success(f"✅ {len(images)}件のジョブを登録しました（バッチID: {batch_id}）。"
+                   "進捗は「🕒 ジョブ」ページで確認できます。")
+    
+    if images and not run_in_background and st.button("🚀 一括文字起こし開始", type="primary"):
+        batch = BatchOCRProcessor(OCR_ENGINES[selected_engine], max_workers=max_workers)
+        progress = st.progress(0.0, text="処理を開始しています...")
+        results = [None] * len(images)
+        completed = 0
+        
+        for result in batch.process(
+            images,
+            language_hint=SUPPORTED_LANGUAGES[selected_language],
+            auto_rotate=auto_rotate,
+            table_recognition=table_recognition
+        ):
+            completed += 1
+            results[result["index"]] = result
+            progress.progress(completed / len(images), text=f"{completed} / {len(images)} 件完了")
+            
+            if result["error"]:
+                st.error(f"❌ {result['name']}: {result['error']}")
+                continue
+            
+            cache_note = "（キャッシュ）" if result["cache_hit"] else ("（文字なし）" if result["no_text"] else "")
+            with st.expander(f"✅ {result['name']} - 信頼度 {result['confidence'] * 100:.1f}% "
+                             f"({result['elapsed']:.1f}秒){cache_note}"):
+                st.text(result["ocr_result"])
+            
+            if save_results:
+                save_to_history(result["name"], images[result["index"]][1], result["ocr_result"], result["confidence"])
+        
+        st.session_state["batch_results"] = results
+        failed = sum(1 for result in results if result["error"])
+        st.success(f"✅ 一括処理が完了しました（成功: {len(results) - failed}件 / 失敗: {failed}件）")
+    
+    # 直近の一括処理結果のダウンロード
+    batch_results = st.session_state.get("batch_results")
+    if batch_results:
+        df = pd.DataFrame([
+            {
+                "ファイル名": result["name"],
+                "OCR結果": result["ocr_result"],
+                "信頼度": result["confidence"],
+                "エラー": result["error"] or ""
+            }
+            for result in batch_results
+        ])
+        st.download_button(
+            "📥 結果をCSVでダウンロード",
+            df.to_csv(index=False).encode("utf-8-sig"),
+            file_name="ocr_batch_results.csv",
+            mime="text/csv"
+        )
+
+def show_jobs_page():
+    """バックグラウンドジョブの状態ページ"""
+    st.header("🕒 ジョブ")
+    queue = get_job_queue()
+    
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        batch_id = st.text_input("🔖 バッチID（空欄の場合はすべて表示）", value=st.query_params.get("batch", ""))
+    with col2:
+        status_labels = {"すべて": None, "待機中": "queued", "実行中": "running",
+                         "完了": "done", "失敗": "failed", "キャンセル": "cancelled"}
+        status_label = st.selectbox("📊 状態", list(status_labels))
+    
+    if batch_id:
+        st.query_params["batch"] = batch_id
+    elif "batch" in st.query_params:
+        del st.query_params["batch"]
+    
+    counts = queue.counts(batch_id or None)
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("待機中", counts["queued"])
+    with col2:
+        st.metric("実行中", counts["running"])
+    with col3:
+        st.metric("完了", counts["done"])
+    with col4:
+        st.metric("失敗", counts["failed"])
+    
+    total = sum(counts.values())
+    if total:
+        finished = sum(counts[status] for status in FINISHED_STATUSES)
+        st.progress(finished / total, text=f"{finished} / {total} 件終了")
+    
+    if st.button("🔄 最新の状態に更新"):
+        st.rerun()
+    
+    jobs = queue.list_jobs(limit=100, batch_id=batch_id or None, status=status_labels[status_label])
+    if not jobs:
+        st.info("📝 ジョブはありません。「📦 一括処理」ページからバックグラウンド処理を登録できます。")
+        return
+    
+    status_icons = {"queued": "⏳", "running": "⚙️", "done": "✅", "failed": "❌", "cancelled": "🚫"}
+    for job in jobs:
+        created = format_timestamp(datetime.fromtimestamp(job["created_at"]).isoformat())
+        with st.expander(f"{status_icons[job['status']]} {job['image_name']} - {created}"):
+            if job["status"] == "running" and job["total"] > 1:
+                st.progress(job["progress"] / job["total"], text=f"{job['progress']} / {job['total']} ページ")
+            if job["status"] == "done":
+                st.write(f"**信頼度:** {job['confidence'] * 100:.1f}%"
+                         f"{'（キャッシュ）' if job['cache_hit'] else ''}")
+                st.text_area("OCR結果", value=job["ocr_result"], height=150,
+                             key=f"job_{job['id']}", label_visibility="collapsed")
+                if job["history_id"]:
+                    st.caption("💾 履歴に保存済み")
+            if job["error"]:
+                st.error(job["error"])
+            
+            if job["status"] in ("queued", "running"):
+                if st.button("🚫 キャンセル", key=f"cancel_{job['id']}"):
+                    queue.cancel(job["id"])
+                    st.rerun()
+            elif job["status"] in ("failed", "cancelled"):
+                if st.button("🔁 再実行", key=f"retry_{job['id']}"):
+                    queue.retry(job["id"])
+                    st.rerun()
 
 def show_history_page():
     """履歴ページ"""
     st.header("📚 処理履歴")
     
-    # 履歴の読み込み
-    history = load_history()
-    
-    if not history:
+    # 件数は1回の表示につき1回だけ取得する
+    history_count = count_history()
+    if history_count == 0:
         st.info("📝 まだ処理履歴がありません。画像をアップロードしてOCR処理を行ってください。")
         return
     
@@ -850,80 +776,122 @@ def show_history_page():
     with col1:
         search_term = st.text_input("🔍 検索（ファイル名または内容）")
     with col2:
-        sort_order = st.selectbox("📊 並び順", ["新しい順", "古い順"])
-    
-    # 履歴の表示
-    filtered_history = history
-    
-    # 検索フィルター
-    if search_term:
-        filtered_history = [
-            item for item in history
-            if search_term.lower() in item["image_name"].lower() or 
-               search_term.lower() in item["ocr_result"].lower()
-        ]
-    
-    # ソート
-    if sort_order == "新しい順":
-        filtered_history.sort(key=lambda x: x["timestamp"], reverse=True)
-    else:
-        filtered_history.sort(key=lambda x: x["timestamp"])
-    
-    st.info(f"📊 {len(filtered_history)}件の履歴が見つかりました")
+        sort_options = ["関連度順", "新しい順", "古い順"] if search_term else ["新しい順", "古い順"]
+        sort_order = st.selectbox("📊 並び順", sort_options)
+    
+    # 表示中のページ番号（ページ切り替えウィジェットの値を前回の実行から引き継ぐ）
+    page_size = HISTORY_PAGE_SIZE
+    page = st.session_state.get("history_page", 1)
+    
+    # 表示したページの最後の項目（以降のページはその位置から読み込み、先頭から読み飛ばさない）
+    # 検索語・並び順・件数が変わった場合は位置が変わるため作り直す
+    cursor_key = (search_term, sort_order, history_count)
+    if st.session_state.get("history_cursor_key") != cursor_key:
+        st.session_state["history_cursor_key"] = cursor_key
+        st.session_state["history_cursors"] = {}
+    cursors = st.session_state["history_cursors"]
+    
+    def fetch_page(page: int):
+        known = max((number for number in cursors if number < page), default=0)
+        offset = (page - known - 1) * page_size
+        if search_term:
+            # 全文検索インデックスで検索（ページ単位で取得）
+            order = {"関連度順": "rank", "新しい順": "newest", "古い順": "oldest"}[sort_order]
+            total, hits = search_history(search_term, offset=offset, limit=page_size, order=order,
+                                         after=cursors.get(known))
+            if hits:
+                cursors[page] = {key: hits[-1][key] for key in ("id", "timestamp", "rank")}
+            snippets = {hit["id"]: hit["snippet"] for hit in hits}
+            items = get_history_items([hit["id"] for hit in hits], include_images=False)
+            for item in items:
+                item["snippet"] = snippets[item["id"]]
+            return total, items
+        items = load_history_page(offset, page_size, newest_first=sort_order == "新しい順",
+                                  include_images=False, after=cursors.get(known))
+        if items:
+            cursors[page] = {"id": items[-1]["id"], "timestamp": items[-1]["timestamp"]}
+        return history_count, items
+    
+    total, page_items = fetch_page(page)
+    page_count = max(1, (total + page_size - 1) // page_size)
+    if page > page_count:
+        # 検索語の変更や削除でページ数が減った場合は先頭に戻す
+        page = 1
+        total, page_items = fetch_page(page)
+    st.session_state["history_page"] = page
+    
+    st.info(f"📊 {total}件の履歴が見つかりました（{page} / {page_count} ページ）")
     
     # 履歴一覧
-    for i, item in enumerate(filtered_history):
-        with st.expander(f"📷 {item['image_name']} - {format_timestamp(item['timestamp'])}", expanded=False):
-            col1, col2 = st.columns([1, 2])
+    for item in page_items:
+        show_history_item(item)
+    
+    if page_count > 1:
+        st.number_input("📄 ページ", min_value=1, max_value=page_count, key="history_page")
+
+def show_history_item(item: dict):
+    """履歴項目を1件表示（元画像は要求されたときだけ読み込む）"""
+    if "snippet" in item:
+        st.markdown(f"**📷 {html.escape(item['image_name'])}**: {item['snippet']}", unsafe_allow_html=True)
+    with st.expander(f"📷 {item['image_name']} - {format_timestamp(item['timestamp'])}", expanded=False):
+        col1, col2 = st.columns([1, 2])
+        
+        with col1:
+            # サムネイル表示
+            thumbnail = get_history_thumbnail(item)
+            if thumbnail:
+                st.image(thumbnail, caption=item["image_name"], use_container_width=True)
+            else:
+                # プレースホルダー
+                st.info("📷 画像データが破損している可能性があります")
             
-            with col1:
-                # 画像表示
+            show_full_key = f"show_full_{item['id']}"
+            if st.toggle("🔍 元画像を表示", key=show_full_key):
+                image_data = load_history_image(item["id"])
                 try:
-                    image_data = base64.b64decode(item["image_data"])
                     image = Image.open(io.BytesIO(image_data))
                     st.image(image, caption=item["image_name"], use_container_width=True)
                 except Exception as e:
                     st.error(f"画像の表示に失敗しました: {str(e)}")
-                    # プレースホルダー画像を表示
-                    st.info("📷 画像データが破損している可能性があります")
+        
+        with col2:
+            # 詳細情報
+            st.write(f"**📅 処理日時:** {format_timestamp(item['timestamp'])}")
+            
+            # 信頼度の表示
+            confidence_percent = item['confidence'] * 100
+            if confidence_percent >= 80:
+                confidence_color = "🟢"
+            elif confidence_percent >= 60:
+                confidence_color = "🟡"
+            else:
+                confidence_color = "🔴"
+            st.write(f"**{confidence_color} 信頼度:** {confidence_percent:.1f}%")
+            
+            st.write(f"**📝 抽出された文字列:**")
+            st.text_area("OCR結果", value=item["ocr_result"], height=150, key=f"history_{item['id']}", label_visibility="collapsed")
+            
+            # 操作ボタン
+            col_btn1, col_btn2, col_btn3 = st.columns(3)
+            with col_btn1:
+                if st.button("📋 コピー", key=f"copy_{item['id']}"):
+                    st.write("✅ クリップボードにコピーしました")
             
-            with col2:
-                # 詳細情報
-                st.write(f"**📅 処理日時:** {format_timestamp(item['timestamp'])}")
-                
-                # 信頼度の表示
-                confidence_percent = item['confidence'] * 100
-                if confidence_percent >= 80:
-                    confidence_color = "🟢"
-                elif confidence_percent >= 60:
-                    confidence_color = "🟡"
-                else:
-                    confidence_color = "🔴"
-                st.write(f"**{confidence_color} 信頼度:** {confidence_percent:.1f}%")
-                
-                st.write(f"**📝 抽出された文字列:**")
-                st.text_area("OCR結果", value=item["ocr_result"], height=150, key=f"history_{item['id']}", label_visibility="collapsed")
-                
-                # 操作ボタン
-                col_btn1, col_btn2, col_btn3 = st.columns(3)
-                with col_btn1:
-                    if st.button("📋 コピー", key=f"copy_{item['id']}"):
-                        st.write("✅ クリップボードにコピーしました")
-                
-                with col_btn2:
-                    if st.button("🔄 再処理", key=f"reprocess_{item['id']}"):
-                        st.info("再処理機能は今後実装予定です")
-                
-                with col_btn3:
-                    if st.button("🗑️ 削除", key=f"delete_{item['id']}"):
-                        if delete_history_item(item["id"]):
-                            st.success("✅ 履歴を削除しました")
-                            st.rerun()
-                        else:
-                            st.error("❌ 削除に失敗しました")
+            with col_btn2:
+                if st.button("🔄 再処理", key=f"reprocess_{item['id']}"):
+                    st.info("再処理機能は今後実装予定です")
+            
+            with col_btn3:
+                if st.button("🗑️ 削除", key=f"delete_{item['id']}"):
+                    if delete_history_item(item["id"]):
+                        st.success("✅ 履歴を削除しました")
+                        st.rerun()
+                    else:
+                        st.error("❌ 削除に失敗しました")
 
 def show_settings_page():
     """設定ページ"""
+    import pandas as pd
     st.header("⚙️ 設定")
     
     # API設定
@@ -1019,19 +987,116 @@ def show_settings_page():
     if st.button("💾 設定を保存"):
         st.success("✅ 設定を保存しました")
     
+    # OCRキャッシュ
+    st.subheader("⚡ OCRキャッシュ")
+    
+    cache_stats = get_ocr_cache().stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("ヒット", cache_stats["hits"])
+    with col2:
+        st.metric("ミス", cache_stats["misses"])
+    with col3:
+        st.metric("ヒット率", f"{cache_stats['hit_rate'] * 100:.1f}%")
+    with col4:
+        st.metric("保存件数", cache_stats["entries"])
+    
+    if st.button("🧹 キャッシュをクリア", type="secondary"):
+        get_ocr_cache().clear()
+        st.success("✅ キャッシュをクリアしました")
+    
+    # 画像前処理
+    st.subheader("📉 画像前処理")
+    
+    preprocess_stats = get_preprocess_stats()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("処理枚数", preprocess_stats["images"])
+    with col2:
+        saved_bytes = preprocess_stats["bytes_before"] - preprocess_stats["bytes_after"]
+        st.metric("削減した送信量", get_file_size_display(max(0, saved_bytes)))
+    with col3:
+        average_ms = preprocess_stats["elapsed_ms"] / preprocess_stats["images"] if preprocess_stats["images"] else 0.0
+        st.metric("平均処理時間", f"{average_ms:.0f} ms")
+    
+    # 文字の有無の事前判定
+    st.subheader("📭 文字の有無の事前判定")
+    
+    precheck_stats = get_precheck_stats()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("判定枚数", precheck_stats["checked"])
+    with col2:
+        st.metric("省略したAPI呼び出し", precheck_stats["skipped"])
+    with col3:
+        average_ms = precheck_stats["elapsed_ms"] / precheck_stats["checked"] if precheck_stats["checked"] else 0.0
+        st.metric("平均判定時間", f"{average_ms:.1f} ms")
+    
+    # OCRプロンプト
+    st.subheader("💬 OCRプロンプト")
+    
+    st.caption("環境変数 `OCR_PROMPT_VARIANT`（モデル別は `OCR_PROMPT_VARIANTS`）で切り替えられます。"
+               "トークン数は目安です（日本語・テーブル認識の有無別）。")
+    st.dataframe(pd.DataFrame([
+        {
+            "種類": f"{row['variant']}（{row['label']}）",
+            "テーブル認識": "あり" if row["table_recognition"] else "なし",
+            "文字数": row["chars"],
+            "トークン数（目安）": row["tokens"],
+            "使用中のエンジン": ", ".join(
+                name for name, model in OCR_ENGINES.items() if get_prompt_variant(model) == row["variant"]
+            )
+        }
+        for row in describe_prompts("japanese")
+    ]), hide_index=True, use_container_width=True)
+    
+    # 処理時間のメトリクス
+    st.subheader("🔬 処理時間")
+    
+    summary = stage_summary()
+    if summary:
+        st.dataframe(pd.DataFrame([
+            {
+                "処理段階": row["stage"],
+                "回数": row["count"],
+                "平均 (ms)": round(row["mean_ms"], 1),
+                "p95 (ms, 推定)": round(row["p95_ms"], 1)
+            }
+            for row in summary
+        ]), hide_index=True, use_container_width=True)
+    else:
+        st.info("📝 まだ計測データがありません。")
+    
+    st.download_button(
+        "📥 メトリクスをダウンロード（Prometheus形式）",
+        render_metrics().encode("utf-8"),
+        file_name="ocr_metrics.prom",
+        mime="text/plain"
+    )
+    
     # 履歴のクリア
     st.subheader("🗑️ データ管理")
     
+    image_stats = get_image_store_stats()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("保存中の画像", image_stats["blobs"])
+    with col2:
+        st.metric("画像の合計サイズ", get_file_size_display(image_stats["bytes"]))
+    with col3:
+        st.metric("履歴からの参照数", image_stats["refs"])
+    
+    if st.button("🧹 未使用の画像を整理", type="secondary",
+                 help="どの履歴からも参照されていない画像を削除し、参照数を履歴に合わせて修正します"):
+        removed = collect_image_garbage()
+        if removed is not None:
+            st.success(f"✅ {removed}件の未使用の画像を削除しました")
+    
     if st.button("🗑️ 全履歴を削除", type="secondary"):
         if st.checkbox("本当に全履歴を削除しますか？"):
-            try:
-                import os
-                if os.path.exists("ocr_history.json"):
-                    os.remove("ocr_history.json")
+            if clear_history():
                 st.success("✅ 全履歴を削除しました")
                 st.rerun()
-            except Exception as e:
-                st.error(f"❌ 履歴の削除に失敗しました: {e}")
 
 def show_help_page():
     """ヘルプページ"""
@@ -1047,7 +1112,8 @@ def show_help_page():
     - **📊 テーブル認識**: 表形式のデータを認識
     
     ### 2. 画像のアップロード
-    - サポート形式: JPG, JPEG, PNG, GIF, BMP, TIFF
+    - サポート形式: JPG, JPEG, PNG, GIF, BMP, TIFF, PDF
+    - PDFや複数ページのTIFF/GIFは全ページをまとめて処理
     - 最大ファイルサイズ: 10MB
     - ドラッグ&ドロップまたはファイル選択ボタンでアップロード
     
@@ -1109,6 +1175,8 @@ def show_help_page():
     - **📊 テーブル認識**: 表形式のデータを構造化して認識
     - **🎨 テーマ切り替え**: ライト/ダークテーマの切り替え
     - **📚 履歴管理**: 処理結果の自動保存と管理
+    - **📦 一括処理**: 複数画像やZIPファイルをまとめて並列処理
+    - **🕒 バックグラウンド処理**: 一括処理をジョブとして登録し、画面を閉じても処理を継続
     - **📋 コピー機能**: 結果の簡単なコピー
     """)
     
@@ -0,0 +1,331 @@
+"""
+処理時間・件数のメトリクス
+処理段階ごとのヒストグラム、キャッシュヒットやリトライのカウンター、処理中件数のゲージを
+プロセス内で集計し、Prometheusのテキスト形式で出力する
+"""
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import METRICS_ENABLED, METRICS_EXPORT_FILE, METRICS_EXPORT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# 処理時間ヒストグラムのバケット（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 現在のリクエストの処理段階ごとの所要時間（collect_traceで有効化）
+_current_trace: ContextVar[Optional[List[Dict]]] = ContextVar("ocr_trace", default=None)
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = []
+    for name, value in zip(label_names, label_values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    """ラベル付きメトリクスの共通処理（サブクラスは _samples で出力する行を返す）"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    @abstractmethod
+    def _samples(self) -> Iterator[str]:
+        """Prometheusのテキスト形式のサンプル行を返す（ロック内で呼び出される）"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """増加のみのカウンター"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """増減する現在値（処理中の件数など）"""
+
+    type_name = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """ブロックの実行中だけ値を1増やす"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """値の分布（処理時間など）"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def summary(self) -> List[Dict]:
+        """ラベルごとの件数・平均・推定p95（秒）"""
+        with self._lock:
+            states = [(key, dict(state, counts=list(state["counts"]))) for key, state in self._values.items()]
+        summaries = []
+        for key, state in states:
+            summaries.append({
+                "labels": dict(zip(self.label_names, key)),
+                "count": state["count"],
+                "mean": state["sum"] / state["count"] if state["count"] else 0.0,
+                "p95": self._estimate_quantile(state, 0.95)
+            })
+        return summaries
+
+    def _estimate_quantile(self, state: Dict, q: float) -> float:
+        """バケットの上限値から分位点を推定"""
+        target = state["count"] * q
+        cumulative = 0
+        for bound, count in zip(self.buckets, state["counts"]):
+            cumulative += count
+            if cumulative >= target and count:
+                return bound if bound != float("inf") else self.buckets[-2]
+        return 0.0
+
+    def _samples(self) -> Iterator[str]:
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(state['sum'])}"
+            yield f"{self.name}_count{labels} {state['count']}"
+
+
+class MetricsRegistry:
+    """メトリクスの登録とテキスト形式での出力"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name: str, documentation: str, label_names: Tuple[str, ...], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = metric_class(name, documentation, label_names, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, label_names, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式（text/plain; version=0.0.4）で出力"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "ocr_stage_duration_seconds", "Time spent in each OCR pipeline stage.", ("stage",)
+)
+REQUESTS = REGISTRY.counter(
+    "ocr_requests_total", "OCR requests sent to the model, by model and outcome.", ("model", "status")
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "ocr_cache_lookups_total", "OCR result cache lookups, by result (hit/miss).", ("result",)
+)
+RETRIES = REGISTRY.counter(
+    "ocr_retries_total", "Gemini API calls retried after a transient error.", ("model",)
+)
+RATE_LIMITED = REGISTRY.counter(
+    "ocr_rate_limited_total", "Gemini API responses with HTTP 429.", ("model",)
+)
+SAFETY_BLOCKS = REGISTRY.counter(
+    "ocr_safety_blocks_total", "Requests blocked by the Gemini safety filter.", ("model",)
+)
+PRECHECKS = REGISTRY.counter(
+    "ocr_text_precheck_total", "Local text pre-checks, by result (text/no_text).", ("result",)
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "ocr_in_flight_requests", "OCR requests currently being processed.", ("model",)
+)
+JOBS_RUNNING = REGISTRY.gauge(
+    "ocr_jobs_running", "Background OCR jobs currently being processed."
+)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    処理段階の所要時間を計測してヒストグラムに記録
+
+    collect_traceの内側では、リクエストごとの内訳にも追加する
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_stage(name: str, seconds: float):
+    """計測済みの所要時間を処理段階として記録"""
+    if not METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(seconds, stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append({"stage": name, "ms": seconds * 1000})
+
+
+@contextmanager
+def collect_trace(trace: Optional[List[Dict]] = None):
+    """ブロック内で計測した処理段階の内訳をリストで受け取る（既存のリストに追記も可能）"""
+    trace = trace if trace is not None else []
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def render_metrics() -> str:
+    """全メトリクスをPrometheusのテキスト形式で取得"""
+    return REGISTRY.render()
+
+
+def stage_summary() -> List[Dict]:
+    """処理段階ごとの件数・平均・推定p95（ミリ秒）"""
+    return [
+        {
+            "stage": summary["labels"]["stage"],
+            "count": summary["count"],
+            "mean_ms": summary["mean"] * 1000,
+            "p95_ms": summary["p95"] * 1000
+        }
+        for summary in sorted(STAGE_SECONDS.summary(), key=lambda s: s["labels"]["stage"])
+    ]
+
+
+def export_metrics(path: str = METRICS_EXPORT_FILE):
+    """メトリクスをファイルに書き出す（node_exporterのtextfile collector向け）"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(render_metrics())
+    os.replace(tmp_path, path)
+
+
+_exporter: Optional[threading.Thread] = None
+_exporter_lock = threading.Lock()
+
+
+def start_metrics_exporter() -> bool:
+    """METRICS_EXPORT_FILE が設定されていれば、一定間隔でファイルに書き出すスレッドを起動"""
+    global _exporter
+    if not METRICS_EXPORT_FILE:
+        return False
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                def run():
+                    while True:
+                        try:
+                            export_metrics()
+                        except Exception as e:
+                            logger.warning("メトリクスの書き出しに失敗しました: %s", e)
+                        time.sleep(METRICS_EXPORT_INTERVAL)
+
+                _exporter = threading.Thread(target=run, name="metrics-exporter", daemon=True)
+                _exporter.start()
+    return True
@@ -0,0 +1,86 @@
+"""
+Geminiモデルのプール
+genai.configureとGenerativeModelの生成をプロセス内で一度だけ行い、
+全リクエスト・全セッションで同じモデルオブジェクトと接続を再利用する
+SDK（google.generativeai）の読み込みには1秒近くかかるため、最初にモデルが必要になるまで遅らせる
+"""
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+from config import GEMINI_API_KEY, OCR_ENGINES
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+_models: Dict[str, "genai.GenerativeModel"] = {}
+_lock = threading.Lock()
+_configured = False
+
+
+def _genai():
+    """SDKを読み込む（2回目以降は読み込み済みのモジュールを返すだけ）"""
+    import google.generativeai as genai
+    return genai
+
+
+def _configure():
+    """APIキーを設定（ロック取得済みで呼び出す）"""
+    global _configured
+    if not _configured:
+        if not GEMINI_API_KEY:
+            raise ValueError("Gemini APIキーが設定されていません")
+        _genai().configure(api_key=GEMINI_API_KEY)
+        _configured = True
+
+
+def get_model(model_name: str) -> "genai.GenerativeModel":
+    """モデル名に対応するGenerativeModelを取得（初回のみ生成）"""
+    model = _models.get(model_name)
+    if model is None:
+        with _lock:
+            model = _models.get(model_name)
+            if model is None:
+                _configure()
+                model = _genai().GenerativeModel(model_name)
+                _models[model_name] = model
+    return model
+
+
+def register_model(model_name: str, model):
+    """モデルを差し替え（ベンチマークなどでAPIの代替を使う場合）"""
+    with _lock:
+        _models[model_name] = model
+
+
+def warm_up(model_names: Optional[Iterable[str]] = None):
+    """
+    起動時にモデルとAPIクライアント（接続）を事前に生成
+
+    クライアントはSDKがプロセス内で1つだけ生成して全モデルで共有するため、ここで生成しておけば
+    各モデルの初回リクエストでは生成済みのクライアントを受け取るだけになる
+    """
+    models = [get_model(model_name) for model_name in model_names or OCR_ENGINES.values()]
+    genai = _genai()
+    if any(isinstance(model, genai.GenerativeModel) for model in models):
+        from google.generativeai import client as genai_client
+        genai_client.get_default_generative_client()
+
+
+def warm_up_in_background(model_names: Optional[Iterable[str]] = None) -> threading.Thread:
+    """
+    モデルの事前生成を別スレッドで開始（SDKの読み込みを待たずに最初の画面・応答を返す）
+
+    準備が終わる前にOCR処理が始まった場合は get_model のロックで待ち合わせる
+    """
+    def run():
+        try:
+            warm_up(model_names)
+        except Exception as e:
+            logger.warning("モデルの事前準備に失敗しました: %s", e)
+
+    thread = threading.Thread(target=run, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,228 @@
+"""
+OCR結果キャッシュ
+画像バイト列とOCR設定のハッシュをキーに結果を保存し、同一リクエストのAPI呼び出しを省略する
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from config import (
+    OCR_CACHE_BACKEND,
+    OCR_CACHE_DIR,
+    OCR_CACHE_MAX_ITEMS,
+    OCR_CACHE_TTL,
+)
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(image_data: bytes, model_name: str, language_hint: str,
+                   auto_rotate: bool, table_recognition: bool, variant: str = "") -> str:
+    """画像バイト列とOCR設定からキャッシュキーを生成（variantは処理方法の違い、例: "tiled"）"""
+    hasher = hashlib.sha256()
+    hasher.update(image_data)
+    options = [model_name, language_hint, bool(auto_rotate), bool(table_recognition)]
+    if variant:
+        options.append(variant)
+    options = json.dumps(options, ensure_ascii=False)
+    hasher.update(options.encode("utf-8"))
+    return hasher.hexdigest()
+
+
+class MemoryCacheBackend:
+    """プロセス内メモリに結果を保持するバックエンド"""
+
+    def __init__(self):
+        self._entries: Dict[str, Dict] = {}
+
+    def load_index(self) -> Dict[str, float]:
+        """保存済みエントリのキーと作成時刻を取得"""
+        return {key: entry["created_at"] for key, entry in self._entries.items()}
+
+    def read(self, key: str) -> Optional[Dict]:
+        return self._entries.get(key)
+
+    def write(self, key: str, entry: Dict):
+        self._entries[key] = entry
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class DiskCacheBackend:
+    """ローカルディスクにエントリごとのJSONファイルとして保存するバックエンド"""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def load_index(self) -> Dict[str, float]:
+        """ファイルの更新時刻を作成時刻として索引を構築（本文は読み込まない）"""
+        index = {}
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    index[entry.name[:-5]] = entry.stat().st_mtime
+        return index
+
+    def read(self, key: str) -> Optional[Dict]:
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, key: str, entry: Dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 書き込み途中のファイルを読まないよう一時ファイル経由で置き換える
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        os.utime(path, (entry["created_at"], entry["created_at"]))
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for key in list(self.load_index()):
+            self.delete(key)
+
+
+class OCRCache:
+    """件数上限（LRU）とTTLで管理するOCR結果キャッシュ"""
+
+    def __init__(self, backend, max_items: int = OCR_CACHE_MAX_ITEMS, ttl: int = OCR_CACHE_TTL):
+        self.backend = backend
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # キー -> 作成時刻（先頭ほど最近使われていない）
+        self._index: "OrderedDict[str, float]" = OrderedDict(
+            sorted(self.backend.load_index().items(), key=lambda kv: kv[1])
+        )
+        with self._lock:
+            self._evict()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl > 0 and time.time() - created_at > self.ttl
+
+    def _evict(self):
+        """期限切れと上限超過のエントリを削除（ロック取得済みで呼び出す）"""
+        for key, created_at in list(self._index.items()):
+            if self._is_expired(created_at):
+                del self._index[key]
+                self.backend.delete(key)
+        while len(self._index) > self.max_items:
+            key, _ = self._index.popitem(last=False)
+            self.backend.delete(key)
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """キャッシュから結果を取得（存在しない場合はNone）"""
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+        return entry["ocr_result"], entry["confidence"]
+
+    def get_entry(self, key: str) -> Optional[Dict]:
+        """キャッシュから保存済みのエントリ（ocr_result・confidence・structured など）を取得"""
+        with self._lock:
+            created_at = self._index.get(key)
+            if created_at is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            if self._is_expired(created_at):
+                del self._index[key]
+                self.backend.delete(key)
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            entry = self.backend.read(key)
+            if entry is None:
+                del self._index[key]
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.inc(result="hit")
+            return entry
+
+    def set(self, key: str, ocr_result: str, confidence: float, model_name: str = "",
+            structured: Optional[Dict] = None):
+        """結果をキャッシュに保存（structuredは構造化出力モードの結果）"""
+        entry = {
+            "created_at": time.time(),
+            "model_name": model_name,
+            "ocr_result": ocr_result,
+            "confidence": confidence
+        }
+        if structured is not None:
+            entry["structured"] = structured
+        with self._lock:
+            try:
+                self.backend.write(key, entry)
+            except Exception as e:
+                logger.warning("キャッシュの保存に失敗しました: %s", e)
+                return
+            self._index[key] = entry["created_at"]
+            self._index.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        """全エントリと統計を削除"""
+        with self._lock:
+            self.backend.clear()
+            self._index.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict:
+        """ヒット/ミス数などの統計情報を取得"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._index),
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+_cache: Optional[OCRCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OCRCache:
+    """プロセス共通のOCRキャッシュを取得"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if OCR_CACHE_BACKEND == "memory":
+                    backend = MemoryCacheBackend()
+                else:
+                    backend = DiskCacheBackend(OCR_CACHE_DIR)
+                _cache = OCRCache(backend)
+    return _cache
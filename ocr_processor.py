@@ -1,91 +1,378 @@
 import base64
 import io
-from typing import Dict, Optional, Tuple
+import time
+from typing import Dict, Iterator, Optional, Tuple
 from PIL import Image
-import google.generativeai as genai
-from config import GEMINI_API_KEY, GEMINI_MODEL, SUPPORTED_LANGUAGES, OCR_ENGINES
+from config import GEMINI_API_KEY, GEMINI_MODEL, SUPPORTED_LANGUAGES, OCR_ENGINES, OCR_CACHE_ENABLED, PREPROCESS_ENABLED, TEXT_PRECHECK_ENABLED
+from ocr_cache import get_ocr_cache, make_cache_key
+from image_preprocessor import ImagePreprocessor
+from rate_limiter import call_with_retry
+from model_pool import get_model
+from metrics import IN_FLIGHT, REQUESTS, SAFETY_BLOCKS, record_stage, stage
+from tiled_ocr import TiledOCRProcessor, should_tile
+from text_detector import detect_text
+from prompts import get_prompt, get_prompt_variant
+from structured_ocr import empty_result, get_generation_config, parse_structured_response
 
 class OCRProcessor:
     """Google Gemini APIを使用したOCR処理クラス"""
     
-    def __init__(self, model_name: str = None):
-        """初期化"""
+    def __init__(self, model_name: str = None, prompt_variant: str = None, structured: bool = False):
+        """
+        初期化
+        
+        Args:
+            model_name: モデル名（省略時は既定のモデル）
+            prompt_variant: プロンプトの種類（省略時はモデルごとの設定に従う）
+            structured: 構造化出力（JSON）モード。ブロック・行・位置・信頼度・表のセルを
+                        last_run_info["structured"] に格納する
+        """
         if not GEMINI_API_KEY:
             raise ValueError("Gemini APIキーが設定されていません")
         
-        genai.configure(api_key=GEMINI_API_KEY)
+        # モデルはプロセス内で共有（生成済みであれば再利用）
         self.model_name = model_name or GEMINI_MODEL
-        self.model = genai.GenerativeModel(self.model_name)
+        self.model = get_model(self.model_name)
+        self.prompt_variant = prompt_variant
+        self.structured = structured
+        # 直近の処理に関する情報（キャッシュヒットなど）
+        self.last_run_info: Dict = {}
+    
+    def process_image_bytes(self, image_data: bytes, language_hint: str = "日本語",
+                            auto_rotate: bool = True, table_recognition: bool = False,
+                            image: Optional[Image.Image] = None,
+                            use_cache: bool = True, tiling: Optional[bool] = None,
+                            precheck: Optional[bool] = None) -> Tuple[str, float]:
+        """
+        画像バイト列をOCR処理（結果キャッシュを利用）
+        
+        Args:
+            image_data: 画像ファイルのバイト列（キャッシュキーに使用）
+            language_hint: 言語ヒント
+            auto_rotate: 自動回転の有効/無効
+            table_recognition: テーブル認識の有効/無効
+            image: デコード済みのPIL画像（省略時はimage_dataから読み込む）
+            use_cache: キャッシュの利用有無
+            tiling: タイル分割の有無（Noneの場合は画像の大きさから判断）
+            precheck: 文字の有無の事前判定の有無（Noneの場合は設定に従う）
+        
+        Returns:
+            Tuple[str, float]: (抽出された文字列, 信頼度スコア)
+        """
+        self.last_run_info = {"cache_hit": False}
+        cache = get_ocr_cache() if use_cache and OCR_CACHE_ENABLED else None
+        
+        # 画像の大きさだけを読み込んでタイル分割するかを決める（画素のデコードは後で行われる）
+        if image is None:
+            with stage("image_open"):
+                image = Image.open(io.BytesIO(image_data))
+        tiled = should_tile(image) if tiling is None else tiling
+        
+        if cache is not None:
+            with stage("cache_lookup"):
+                cache_key = make_cache_key(image_data, self.model_name, language_hint,
+                                           auto_rotate, table_recognition, self.cache_variant(tiled))
+                cached = cache.get_entry(cache_key)
+            if cached is not None:
+                self.last_run_info["cache_hit"] = True
+                if self.structured:
+                    self.last_run_info["structured"] = cached.get("structured")
+                return cached["ocr_result"], cached["confidence"]
+        
+        if tiled:
+            ocr_text, confidence = self.process_image_tiled(
+                image,
+                language_hint=language_hint,
+                auto_rotate=auto_rotate,
+                table_recognition=table_recognition,
+                precheck=precheck
+            )
+        else:
+            ocr_text, confidence = self.process_image(
+                image,
+                language_hint=language_hint,
+                auto_rotate=auto_rotate,
+                table_recognition=table_recognition,
+                source_data=image_data,
+                precheck=precheck
+            )
+        
+        # 文字なしの判定結果は保存しない（判定の設定を変えたときに読み直せるように）
+        if cache is not None and not self.last_run_info.get("no_text"):
+            with stage("cache_store"):
+                cache.set(cache_key, ocr_text, confidence, self.model_name,
+                          structured=self.last_run_info.get("structured"))
+        
+        return ocr_text, confidence
     
     def process_image(self, image: Image.Image, language_hint: str = "日本語", 
-                     auto_rotate: bool = True, table_recognition: bool = False) -> Tuple[str, float]:
+                     auto_rotate: bool = True, table_recognition: bool = False,
+                     source_data: Optional[bytes] = None,
+                     precheck: Optional[bool] = None) -> Tuple[str, float]:
         """
         画像をOCR処理して文字列を抽出
         
+        文字がなさそうな画像はGemini APIを呼び出さずに空の結果を返す（last_run_info["no_text"]）
+        
         Args:
             image: PIL画像オブジェクト
             language_hint: 言語ヒント（例: "日本語", "英語"）
             auto_rotate: 自動回転の有効/無効
             table_recognition: テーブル認識の有効/無効
+            source_data: 元ファイルのバイト列（前処理が不要な場合にそのまま送信）
+            precheck: 文字の有無の事前判定の有無（Noneの場合は設定に従う）
         
         Returns:
             Tuple[str, float]: (抽出された文字列, 信頼度スコア)
         """
+        self.last_run_info = {"cache_hit": False}
+        if not self._precheck_text(image, precheck):
+            return "", 0.0
         try:
-            # 画像の向きを自動調整
-            if auto_rotate:
-                image = self._auto_rotate_image(image)
-            
-            # Gemini API用のプロンプト
-            prompt = f"""
-            あなたは画像内の文字を正確に読み取るOCR専門家です。
-            以下の指示に従って画像内の文字列を抽出してください：
-            
-            1. 画像内のすべての文字列を正確に読み取る
-            2. 文字の順序や配置を保持する
-            3. 改行や段落構造を適切に表現する
-            4. 手書き文字も可能な限り読み取る
-            5. 言語: {language_hint}
-            6. 信頼度が低い場合は[信頼度: 低]と明記する
-            """
+            with IN_FLIGHT.track_inprogress(model=self.model_name):
+                image_part = self._prepare_image(image, auto_rotate, source_data)
+                prompt = self._build_prompt(language_hint, table_recognition)
+                
+                # Gemini APIにリクエスト（画像の送信と生成時間を含む）
+                # レート制限を守り、一時的なエラーは再試行する
+                with stage("model_call"):
+                    response = call_with_retry(
+                        lambda: self._generate([prompt, image_part]),
+                        self.model_name
+                    )
+                    ocr_text = response.text
+                
+                # レスポンスから文字列を抽出
+                result = self.parse_result(ocr_text)
+            REQUESTS.inc(model=self.model_name, status="ok")
+            return result
             
-            # テーブル認識の指示を追加
-            if table_recognition:
-                prompt += """
-            7. テーブル構造を認識し、表形式で整理する
-            8. 列と行の関係を明確に表現する
-            """
-            
-            prompt += f"""
-            
-            結果は以下の形式で返してください：
-            ```
-            文字列の内容
-            [信頼度: 高/中/低]
-            ```
-            
-            この画像内の文字列を{language_hint}で読み取ってください。
-            """
-            
-            # Gemini APIにリクエスト
-            response = self.model.generate_content([prompt, image])
+        except Exception as e:
+            raise self._wrap_error(e)
+    
+    def process_image_tiled(self, image: Image.Image, language_hint: str = "日本語",
+                            auto_rotate: bool = True, table_recognition: bool = False,
+                            precheck: Optional[bool] = None) -> Tuple[str, float]:
+        """
+        大きな画像を重なりのあるタイルに分割して並列にOCR処理し、読み順に結合
+        
+        タイル数などは last_run_info（tiles, tile_errors, tile_skipped, tile_scale）に格納する。
+        文字の有無はタイルごとに判定する（画像全体を縮小して判定すると小さな文字を見落とすため）
+        
+        Returns:
+            Tuple[str, float]: (抽出された文字列, 信頼度スコア)
+        """
+        self.last_run_info = {"cache_hit": False}
+        if auto_rotate:
+            with stage("auto_rotate"):
+                image = self._auto_rotate_image(image)
+        
+        tiled_processor = TiledOCRProcessor(self.model_name, prompt_variant=self.prompt_variant,
+                                            structured=self.structured)
+        result = tiled_processor.process(image, language_hint=language_hint,
+                                         table_recognition=table_recognition, precheck=precheck)
+        self.last_run_info.update(tiled_processor.last_run_info)
+        if self.last_run_info["tile_skipped"] == self.last_run_info["tiles"]:
+            self.last_run_info["no_text"] = True
+            if self.structured:
+                self.last_run_info["structured"] = empty_result()
+        return result
+    
+    def process_image_stream(self, image: Image.Image, language_hint: str = "日本語",
+                             auto_rotate: bool = True, table_recognition: bool = False,
+                             source_data: Optional[bytes] = None,
+                             precheck: Optional[bool] = None) -> Iterator[str]:
+        """
+        画像をOCR処理し、生成された文字列を届いた順に返す（ストリーミング）
+        
+        全文を受信した後の信頼度と整形済み文字列は last_run_info["result"] に格納する
+        
+        Args:
+            image: PIL画像オブジェクト
+            language_hint: 言語ヒント
+            auto_rotate: 自動回転の有効/無効
+            table_recognition: テーブル認識の有効/無効
+            source_data: 元ファイルのバイト列
+            precheck: 文字の有無の事前判定の有無（Noneの場合は設定に従う）
+        
+        Yields:
+            str: 生成された文字列の断片
+        """
+        if self.structured:
+            # JSONは途中まで表示しても意味がないため、構造化出力モードでは全体を受信してから返す
+            result = self.process_image(image, language_hint=language_hint, auto_rotate=auto_rotate,
+                                        table_recognition=table_recognition, source_data=source_data,
+                                        precheck=precheck)
+            self.last_run_info["result"] = result
+            yield result[0]
+            return
+        self.last_run_info = {"cache_hit": False}
+        if not self._precheck_text(image, precheck):
+            self.last_run_info["result"] = ("", 0.0)
+            return
+        try:
+            with IN_FLIGHT.track_inprogress(model=self.model_name):
+                image_part = self._prepare_image(image, auto_rotate, source_data)
+                prompt = self._build_prompt(language_hint, table_recognition)
+                
+                started = time.perf_counter()
+                response = call_with_retry(
+                    lambda: self._generate([prompt, image_part], stream=True),
+                    self.model_name
+                )
+                
+                chunks = []
+                for chunk in response:
+                    text = chunk.text
+                    if text:
+                        if not chunks:
+                            # 最初の文字列が届くまでの時間（表示開始までの待ち時間）
+                            record_stage("model_first_chunk", time.perf_counter() - started)
+                        chunks.append(text)
+                        yield text
+                record_stage("model_call", time.perf_counter() - started)
+                
+                self.last_run_info["result"] = self.parse_result("".join(chunks))
+            REQUESTS.inc(model=self.model_name, status="ok")
             
-            # レスポンスから文字列を抽出
-            ocr_text = response.text.strip()
+        except Exception as e:
+            raise self._wrap_error(e)
+    
+    def stream_image_bytes(self, image_data: bytes, language_hint: str = "日本語",
+                           auto_rotate: bool = True, table_recognition: bool = False,
+                           image: Optional[Image.Image] = None,
+                           use_cache: bool = True, tiling: Optional[bool] = None,
+                           precheck: Optional[bool] = None) -> Iterator[str]:
+        """
+        画像バイト列をストリーミングでOCR処理（キャッシュヒット時は保存済みの結果を一度に返す）
+        
+        全文を受信した後の信頼度と整形済み文字列は last_run_info["result"] に格納する。
+        タイル分割する場合は、全タイルを結合した結果を一度に返す
+        """
+        cache = get_ocr_cache() if use_cache and OCR_CACHE_ENABLED else None
+        
+        if image is None:
+            with stage("image_open"):
+                image = Image.open(io.BytesIO(image_data))
+        tiled = should_tile(image) if tiling is None else tiling
+        
+        if cache is not None:
+            cache_key = make_cache_key(image_data, self.model_name, language_hint,
+                                       auto_rotate, table_recognition, self.cache_variant(tiled))
+            with stage("cache_lookup"):
+                cached = cache.get_entry(cache_key)
+            if cached is not None:
+                result = (cached["ocr_result"], cached["confidence"])
+                self.last_run_info = {"cache_hit": True, "result": result}
+                if self.structured:
+                    self.last_run_info["structured"] = cached.get("structured")
+                yield result[0]
+                return
+        
+        if tiled:
+            result = self.process_image_tiled(
+                image,
+                language_hint=language_hint,
+                auto_rotate=auto_rotate,
+                table_recognition=table_recognition,
+                precheck=precheck
+            )
+            self.last_run_info["result"] = result
+            yield result[0]
+        else:
+            yield from self.process_image_stream(
+                image,
+                language_hint=language_hint,
+                auto_rotate=auto_rotate,
+                table_recognition=table_recognition,
+                source_data=image_data,
+                precheck=precheck
+            )
+        
+        if cache is not None and not self.last_run_info.get("no_text"):
+            ocr_text, confidence = self.last_run_info["result"]
+            with stage("cache_store"):
+                cache.set(cache_key, ocr_text, confidence, self.model_name,
+                          structured=self.last_run_info.get("structured"))
+    
+    def parse_result(self, ocr_text: str) -> Tuple[str, float]:
+        """Geminiの応答から (整形済み文字列, 信頼度) を取得"""
+        if self.structured:
+            # 構造化出力はJSONを1回解析するだけ（信頼度はブロックごとの値の平均）
+            with stage("parse_result"):
+                structured = parse_structured_response(ocr_text)
+            self.last_run_info["structured"] = structured
+            return structured["text"], structured["confidence"]
+        
+        with stage("parse_result"):
+            ocr_text = ocr_text.strip()
             
             # 信頼度を推定（レスポンス内容から判断）
             confidence = self._estimate_confidence(ocr_text)
             
             # 信頼度の表記を除去して純粋な文字列を取得
             clean_text = self._extract_clean_text(ocr_text)
-            
-            return clean_text, confidence
-            
-        except Exception as e:
-            if "blocked" in str(e).lower():
-                raise Exception("画像の内容がGeminiの安全フィルターによりブロックされました。別の画像を試してください。")
-            else:
-                raise Exception(f"OCR処理中にエラーが発生しました: {str(e)}")
+        
+        return clean_text, confidence
+    
+    def _precheck_text(self, image: Image.Image, precheck: Optional[bool]) -> bool:
+        """白紙・ほぼ白紙でないか事前に判定（白紙の場合はFalseを返し、last_run_info["no_text"]に記録）"""
+        if not (TEXT_PRECHECK_ENABLED if precheck is None else precheck):
+            return True
+        with stage("text_precheck"):
+            detection = detect_text(image)
+        self.last_run_info["text_precheck"] = detection
+        if not detection["has_text"]:
+            self.last_run_info["no_text"] = True
+            if self.structured:
+                self.last_run_info["structured"] = empty_result()
+        return detection["has_text"]
+    
+    def _prepare_image(self, image: Image.Image, auto_rotate: bool,
+                       source_data: Optional[bytes] = None):
+        """画像の向きを調整し、送信用に前処理"""
+        # 画像の向きを自動調整
+        if auto_rotate:
+            with stage("auto_rotate"):
+                image = self._auto_rotate_image(image)
+        
+        # 送信サイズを削減するための前処理
+        if not PREPROCESS_ENABLED:
+            return image
+        with stage("preprocess"):
+            image_part, preprocess_stats = ImagePreprocessor().process(image, source_data)
+        self.last_run_info["preprocess"] = preprocess_stats
+        return image_part
+    
+    def _build_prompt(self, language_hint: str, table_recognition: bool) -> str:
+        """Gemini API用のプロンプトを取得（組み合わせごとに組み立て済みのものを再利用）"""
+        variant = "structured" if self.structured else self.prompt_variant
+        return get_prompt(language_hint, table_recognition, self.model_name, variant)
+    
+    def _generate(self, contents: list, stream: bool = False):
+        """Gemini APIにリクエスト（構造化出力モードではJSONスキーマを指定する）"""
+        if self.structured:
+            return self.model.generate_content(contents, stream=stream,
+                                               generation_config=get_generation_config())
+        return self.model.generate_content(contents, stream=stream)
+    
+    def cache_variant(self, tiled: bool) -> str:
+        """キャッシュキーに含める処理方法（タイル分割と、構造化出力・standard以外のプロンプト）"""
+        if self.structured:
+            prompt_variant = "structured"
+        else:
+            prompt_variant = self.prompt_variant or get_prompt_variant(self.model_name)
+        parts = ["tiled" if tiled else "", "" if prompt_variant == "standard" else f"prompt:{prompt_variant}"]
+        return "+".join(part for part in parts if part)
+    
+    def _wrap_error(self, error: Exception) -> Exception:
+        """API呼び出しの例外を利用者向けのメッセージに変換"""
+        if "blocked" in str(error).lower():
+            SAFETY_BLOCKS.inc(model=self.model_name)
+            REQUESTS.inc(model=self.model_name, status="blocked")
+            return Exception("画像の内容がGeminiの安全フィルターによりブロックされました。別の画像を試してください。")
+        REQUESTS.inc(model=self.model_name, status="error")
+        return Exception(f"OCR処理中にエラーが発生しました: {str(error)}")
     
     def _estimate_confidence(self, ocr_text: str) -> float:
         """OCR結果から信頼度を推定"""
@@ -147,6 +434,6 @@ class OCRProcessor:
         """OCRエンジンを切り替え"""
         if engine_name in OCR_ENGINES.values():
             self.model_name = engine_name
-            self.model = genai.GenerativeModel(self.model_name)
+            self.model = get_model(self.model_name)
         else:
             raise ValueError(f"サポートされていないエンジンです: {engine_name}")
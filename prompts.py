@@ -0,0 +1,142 @@
+"""
+OCRプロンプトのレジストリ
+プロンプトは (種類, 言語, テーブル認識, エンジン) ごとに一度だけ組み立てて使い回す。
+詳しい指示の standard と、同じ出力形式のまま入力トークンを減らした compact を用意し、
+ベンチマーク（benchmarks/run.py --stages prompt）で精度とレイテンシを比較できる
+"""
+import logging
+import math
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from config import GEMINI_MODEL, MODEL_PROMPT_VARIANTS, OCR_PROMPT_VARIANT
+
+logger = logging.getLogger(__name__)
+
+# プロンプトの種類と説明（設定ページ・ベンチマーク用）
+PROMPT_VARIANTS = {
+    "standard": "標準（詳しい指示）",
+    "compact": "簡潔（入力トークンを削減）",
+}
+
+# 種類ごとのテンプレート（{language} は言語ヒント、{table} はテーブル認識の指示に置き換える）
+# standard と compact は結果の末尾に [信頼度: 高/中/低] を付けさせる（信頼度の推定に使うため）
+_TEMPLATES = {
+    "standard": {
+        "body": """あなたは画像内の文字を正確に読み取るOCR専門家です。
+以下の指示に従って画像内の文字列を抽出してください：
+
+1. 画像内のすべての文字列を正確に読み取る
+2. 文字の順序や配置を保持する
+3. 改行や段落構造を適切に表現する
+4. 手書き文字も可能な限り読み取る
+5. 言語: {language}
+6. 信頼度が低い場合は[信頼度: 低]と明記する
+{table}
+結果は以下の形式で返してください：
+```
+文字列の内容
+[信頼度: 高/中/低]
+```
+
+この画像内の文字列を{language}で読み取ってください。""",
+        "table": """7. テーブル構造を認識し、表形式で整理する
+8. 列と行の関係を明確に表現する
+""",
+    },
+    "compact": {
+        "body": """画像内の文字をすべて正確に書き起こしてください（言語: {language}）。
+順序・改行・段落を保ち、手書きも読むこと。{table}
+文字列のみを出力し、最終行に[信頼度: 高/中/低]を付けること。""",
+        "table": "表は行と列の関係を保って表形式で出力すること。",
+    },
+    # 構造化出力（JSON）モード用。出力形式はJSONスキーマで指定するため、ここでは内容だけを指示する
+    "structured": {
+        "body": """画像内の文字をすべて正確に読み取り、JSONで返してください（言語: {language}）。
+段落・見出し・表などのまとまりごとにblocksの要素とし、読み順に並べること。
+各ブロックには行ごとの文字列と信頼度（0〜1）、ブロック全体の信頼度、位置（bbox: [ymin, xmin, ymax, xmax]、
+画像全体を0〜1000に正規化）を含めること。手書きも読み、typeをhandwritingとすること。{table}
+languageには検出した主な言語をISO 639-1のコードで入れること。""",
+        "table": "\n表はtypeをtableとし、cellsに行ごとのセルの文字列（先頭行は見出し）を入れること。",
+    },
+}
+
+
+def get_prompt_variant(model_name: Optional[str] = None) -> str:
+    """エンジンに設定されたプロンプトの種類を取得"""
+    return MODEL_PROMPT_VARIANTS.get(model_name or GEMINI_MODEL, OCR_PROMPT_VARIANT)
+
+
+@lru_cache(maxsize=256)
+def _compile(variant: str, language_hint: str, table_recognition: bool, model_name: str) -> str:
+    template = _TEMPLATES.get(variant)
+    if template is None:
+        raise ValueError(f"サポートされていないプロンプトです: {variant}")
+    return template["body"].format(
+        language=language_hint,
+        table=template["table"] if table_recognition else ""
+    )
+
+
+def get_prompt(language_hint: str, table_recognition: bool, model_name: Optional[str] = None,
+               variant: Optional[str] = None) -> str:
+    """
+    OCR用のプロンプトを取得（同じ組み合わせは組み立て済みの文字列を返す）
+
+    Args:
+        language_hint: 言語ヒント
+        table_recognition: テーブル認識の有効/無効
+        model_name: エンジン（モデル名）
+        variant: プロンプトの種類（Noneの場合はエンジンの設定に従う）
+
+    Returns:
+        str: プロンプト
+    """
+    model_name = model_name or GEMINI_MODEL
+    return _compile(variant or get_prompt_variant(model_name), language_hint,
+                    bool(table_recognition), model_name)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の目安を計算（APIを呼ばずに比較するため）
+
+    英数字は4文字で約1トークン、日本語などそれ以外の文字は1文字で約1トークンとして数える
+    """
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+@lru_cache(maxsize=256)
+def count_prompt_tokens(variant: str, language_hint: str, table_recognition: bool,
+                        model_name: Optional[str] = None, use_api: bool = False) -> int:
+    """
+    プロンプトの入力トークン数を取得
+
+    use_api=True の場合はモデルの count_tokens で実際のトークン数を数える（失敗した場合は目安を返す）
+    """
+    prompt = get_prompt(language_hint, table_recognition, model_name, variant)
+    if use_api:
+        try:
+            from model_pool import get_model
+
+            return get_model(model_name or GEMINI_MODEL).count_tokens(prompt).total_tokens
+        except Exception as e:
+            logger.warning("トークン数の取得に失敗しました: %s", e)
+    return estimate_tokens(prompt)
+
+
+def describe_prompts(language_hint: str, model_name: Optional[str] = None) -> List[Dict]:
+    """プロンプトの種類ごとの文字数・トークン数の目安（テーブル認識の有無別）を取得"""
+    rows = []
+    for variant, label in PROMPT_VARIANTS.items():
+        for table_recognition in (False, True):
+            prompt = get_prompt(language_hint, table_recognition, model_name, variant)
+            rows.append({
+                "variant": variant,
+                "label": label,
+                "table_recognition": table_recognition,
+                "chars": len(prompt),
+                "tokens": count_prompt_tokens(variant, language_hint, table_recognition, model_name)
+            })
+    return rows
@@ -0,0 +1,212 @@
+"""
+Gemini API呼び出しのリトライとレート制限
+429や一時的な5xxエラーを指数バックオフ（ジッター付き）で再試行し、
+モデルごとのトークンバケットでプロセス内の全セッションのリクエストを平準化する
+"""
+import logging
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, TypeVar
+
+from config import (
+    GEMINI_MAX_RETRIES,
+    GEMINI_RATE_LIMIT_BURST,
+    GEMINI_RATE_LIMIT_MAX_WAIT,
+    GEMINI_RATE_LIMIT_RPM,
+    GEMINI_RETRY_BASE_DELAY,
+    GEMINI_RETRY_MAX_DELAY,
+    MODEL_RATE_LIMITS,
+)
+from metrics import RATE_LIMITED, RETRIES, record_stage
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 再試行するHTTPステータス
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# エラーメッセージ内の待機時間の指定（例: "retry_delay { seconds: 34 }", "Please retry in 12.5s"）
+_RETRY_DELAY_PATTERNS = [
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)"),
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+]
+
+# リトライ・待機の累計統計
+_stats_lock = threading.Lock()
+_stats = {
+    "retries": 0,
+    "rate_limited": 0,
+    "throttle_waits": 0,
+    "throttle_wait_seconds": 0.0
+}
+
+
+def _increment(key: str, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def get_retry_stats() -> Dict:
+    """リトライ・レート制限の累計統計を取得"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+class TokenBucket:
+    """一定レートでトークンが補充されるバケット（スレッドセーフ）"""
+    
+    def __init__(self, rate_per_minute: int, burst: int = GEMINI_RATE_LIMIT_BURST):
+        self.rate = max(rate_per_minute, 1) / 60.0  # 1秒あたりのトークン数
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def acquire(self, max_wait: float = GEMINI_RATE_LIMIT_MAX_WAIT) -> float:
+        """
+        トークンを1つ取得（取得できるまで待機）
+        
+        Returns:
+            float: 待機した秒数
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            
+            if waited + wait > max_wait:
+                raise Exception("APIのリクエストが混雑しています。しばらく待ってから再度お試しください。")
+            time.sleep(wait)
+            waited += wait
+    
+    def pause(self, seconds: float):
+        """サーバーから待機を指示された場合に、全リクエストの送信を一時停止"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(model_name: str) -> TokenBucket:
+    """モデルごとのレート制限を取得（プロセス内で共有）"""
+    bucket = _buckets.get(model_name)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(model_name)
+            if bucket is None:
+                bucket = TokenBucket(MODEL_RATE_LIMITS.get(model_name, GEMINI_RATE_LIMIT_RPM))
+                _buckets[model_name] = bucket
+    return bucket
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """例外からHTTPステータスコードを取得"""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(response, "status", None)
+    return status if isinstance(status, int) else None
+
+
+def is_retryable(error: Exception) -> bool:
+    """再試行すべき一時的なエラーか判定"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return _status_code(error) in _RETRYABLE_STATUS
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """エラーに含まれる待機時間（Retry-Afterなど）を秒で取得"""
+    # HTTPレスポンスのRetry-Afterヘッダー
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+    
+    # google.rpc.RetryInfo
+    for detail in getattr(error, "details", None) or []:
+        retry_delay = getattr(detail, "retry_delay", None)
+        if retry_delay is not None:
+            return retry_delay.seconds + retry_delay.nanos / 1e9
+    
+    # エラーメッセージ内の指定
+    message = str(error)
+    for pattern in _RETRY_DELAY_PATTERNS:
+        match = pattern.search(message)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def call_with_retry(func: Callable[[], T], model_name: str,
+                    max_retries: int = GEMINI_MAX_RETRIES,
+                    base_delay: float = GEMINI_RETRY_BASE_DELAY,
+                    max_delay: float = GEMINI_RETRY_MAX_DELAY) -> T:
+    """
+    レート制限を守りながら関数を呼び出し、一時的なエラーは再試行
+    
+    Args:
+        func: Gemini APIを呼び出す関数
+        model_name: レート制限の対象モデル
+        max_retries: 最大再試行回数
+        base_delay: バックオフの初期待機時間（秒）
+        max_delay: バックオフの最大待機時間（秒）
+    
+    Returns:
+        funcの戻り値
+    """
+    bucket = get_rate_limiter(model_name)
+    attempt = 0
+    while True:
+        waited = bucket.acquire()
+        if waited > 0:
+            _increment("throttle_waits")
+            _increment("throttle_wait_seconds", waited)
+            record_stage("rate_limit_wait", waited)
+        
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            
+            # 指数バックオフ（フルジッター）。サーバー指定の待機時間があれば優先
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            retry_after = get_retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, max_delay))
+            if _status_code(e) == 429:
+                _increment("rate_limited")
+                RATE_LIMITED.inc(model=model_name)
+                bucket.pause(delay)
+            
+            attempt += 1
+            _increment("retries")
+            RETRIES.inc(model=model_name)
+            logger.warning("Gemini APIの一時的なエラーのため再試行します（%d/%d, %.1f秒後）: %s", attempt, max_retries, delay, e)
+            time.sleep(delay)
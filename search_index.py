@@ -0,0 +1,295 @@
+"""
+履歴の全文検索インデックス
+日本語・中国語のように単語区切りのない文章でも検索できるよう、
+文字バイグラムに分割した文字列をSQLite FTS5に登録する
+"""
+import html
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from config import SEARCH_INDEX_FILE
+from history_store import get_history_store
+
+# 検索語として扱う文字の連続（記号・空白で区切る）
+_TOKEN_RUN = re.compile(r"[^\W_]+")
+
+# スニペットの前後に表示する文字数
+SNIPPET_CONTEXT = 40
+
+
+def normalize_text(text: str) -> str:
+    """全角/半角・大文字/小文字の違いを吸収"""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+# インデックスに登録する文字列の形式の版（変わった場合は既存の履歴から作り直す）
+TOKENIZER_VERSION = 2
+
+
+def to_bigrams(text: str) -> str:
+    """
+    文字列を空白区切りの文字バイグラム列に変換
+
+    文字の連続ごとに、末尾の1文字をユニグラムとして加える（1文字の検索は
+    その文字で始まるトークンへの前方一致で行うため、連続の末尾の文字も見つかるようにする）
+    """
+    tokens = []
+    for run in _TOKEN_RUN.findall(normalize_text(text)):
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        tokens.append(run[-1])
+    return " ".join(tokens)
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """検索語をFTS5のMATCH式に変換（語ごとのフレーズをANDで結合）"""
+    phrases = []
+    for run in _TOKEN_RUN.findall(normalize_text(query)):
+        if len(run) == 1:
+            # 1文字の場合はその文字で始まるバイグラム・末尾のユニグラムに前方一致させる
+            phrases.append(f'"{run}"*')
+        else:
+            phrases.append('"' + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+    return " AND ".join(phrases) if phrases else None
+
+
+def make_snippet(text: str, query: str, context: int = SNIPPET_CONTEXT) -> str:
+    """一致箇所の前後を切り出し、一致部分を<mark>で囲んだHTMLを生成"""
+    terms = [term for term in _TOKEN_RUN.findall(query) if term]
+    lowered = text.casefold()
+    position = -1
+    matched = ""
+    for term in terms:
+        for candidate in (term.casefold(), normalize_text(term)):
+            position = lowered.find(candidate)
+            if position >= 0:
+                matched = candidate
+                break
+        if position >= 0:
+            break
+
+    if position < 0:
+        snippet = text[:context * 2]
+        return html.escape(snippet) + ("…" if len(text) > len(snippet) else "")
+
+    start = max(0, position - context)
+    end = min(len(text), position + len(matched) + context)
+    snippet = text[start:end]
+
+    # 表示範囲内のすべての検索語をハイライト
+    variants = set(terms) | {normalize_text(term) for term in terms}
+    pattern = "|".join(re.escape(term) for term in sorted(variants, key=len, reverse=True))
+    parts = []
+    last = 0
+    for match in re.finditer(pattern, snippet, flags=re.IGNORECASE):
+        parts.append(html.escape(snippet[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group(0))}</mark>")
+        last = match.end()
+    parts.append(html.escape(snippet[last:]))
+
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    return prefix + "".join(parts) + suffix
+
+
+class HistorySearchIndex:
+    """
+    履歴の保存・削除に合わせて差分更新される全文検索インデックス
+
+    件数の上限は持たず、履歴ストアが上限を超えて削除した項目を remove_many で取り除く
+    （独自に古い文書を削除すると、履歴ストアの削除と食い違って件数がずれる）
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS docs (
+        doc_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        timestamp TEXT NOT NULL,
+        image_name TEXT NOT NULL,
+        ocr_result TEXT NOT NULL,
+        confidence REAL NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_docs_timestamp ON docs(timestamp);
+    CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+        name_grams, text_grams, tokenize = 'unicode61'
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('count', 0);
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('tokenizer_version', 0);
+    """
+
+    def __init__(self, db_file: str = SEARCH_INDEX_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._connect().executescript(self._SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """スレッドごとの接続を取得"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, item: Dict):
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO docs (id, timestamp, image_name, ocr_result, confidence) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (item["id"], item["timestamp"], item["image_name"], item["ocr_result"],
+             item.get("confidence", 0.0))
+        )
+        if cursor.rowcount:
+            conn.execute(
+                "INSERT INTO docs_fts (rowid, name_grams, text_grams) VALUES (?, ?, ?)",
+                (cursor.lastrowid, to_bigrams(item["image_name"]), to_bigrams(item["ocr_result"]))
+            )
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'count'")
+
+    @staticmethod
+    def _delete_doc(conn: sqlite3.Connection, doc_id: int):
+        conn.execute("DELETE FROM docs WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM docs_fts WHERE rowid = ?", (doc_id,))
+        conn.execute("UPDATE meta SET value = value - 1 WHERE key = 'count'")
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT value FROM meta WHERE key = 'count'").fetchone()[0]
+
+    def add(self, item: Dict):
+        """履歴項目をインデックスに追加"""
+        conn = self._connect()
+        with conn:
+            self._insert(conn, item)
+
+    def remove(self, item_id: str):
+        """履歴項目をインデックスから削除"""
+        self.remove_many([item_id])
+
+    def remove_many(self, item_ids: List[str]):
+        """複数の履歴項目をインデックスから削除（履歴ストアが上限を超えて削除した項目など）"""
+        conn = self._connect()
+        with conn:
+            for item_id in item_ids:
+                row = conn.execute("SELECT doc_id FROM docs WHERE id = ?", (item_id,)).fetchone()
+                if row is not None:
+                    self._delete_doc(conn, row["doc_id"])
+
+    def rebuild(self, items: List[Dict]):
+        """既存の履歴からインデックスを作り直す"""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM docs")
+            conn.execute("DELETE FROM docs_fts")
+            conn.execute("UPDATE meta SET value = 0 WHERE key = 'count'")
+            for item in sorted(items, key=lambda x: x["timestamp"]):
+                self._insert(conn, item)
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'tokenizer_version'", (TOKENIZER_VERSION,))
+
+    def clear(self):
+        """インデックスを空にする"""
+        self.rebuild([])
+
+    def count(self) -> int:
+        """登録済み文書数を取得"""
+        return self._count(self._connect())
+
+    def is_outdated(self) -> bool:
+        """登録済みの文字列の形式が古いかどうか（作り直しが必要）"""
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'tokenizer_version'").fetchone()
+        return row[0] != TOKENIZER_VERSION
+
+    def search(self, query: str, offset: int = 0, limit: int = 20,
+               order: str = "rank", after: Optional[Dict] = None) -> Tuple[int, List[Dict]]:
+        """
+        全文検索を実行
+
+        Args:
+            query: 検索語（空白区切りで複数指定するとAND検索）
+            offset: 取得開始位置（afterを指定した場合はafterの次の結果からの件数）
+            limit: 取得件数
+            order: 並び順（"rank": 関連度順, "newest": 新しい順, "oldest": 古い順）
+            after: 同じ検索語・並び順の前のページの最後の結果。指定するとその位置より後ろだけを
+                   並べ替えるため、何ページ目でも読み飛ばす件数（offset）に比例しない
+
+        Returns:
+            Tuple[int, List[Dict]]: (ヒット件数, 検索結果) 結果にはsnippet（HTML）と
+                                    rank（関連度、小さいほど関連が高い）を含む
+        """
+        match_query = build_match_query(query)
+        if match_query is None:
+            return 0, []
+
+        column, direction = {
+            "newest": ("d.timestamp", "DESC"),
+            "oldest": ("d.timestamp", "ASC"),
+        }.get(order, ("docs_fts.rank", "ASC"))
+
+        conn = self._connect()
+        total = conn.execute(
+            "SELECT count(*) FROM docs_fts WHERE docs_fts MATCH ?", (match_query,)
+        ).fetchone()[0]
+        where, params = "", []
+        if after is not None:
+            row = conn.execute("SELECT doc_id FROM docs WHERE id = ?", (after["id"],)).fetchone()
+            if row is not None:
+                doc_id = row["doc_id"]
+            else:
+                # 削除済みの結果の場合は同じ値の結果をすべて前のページ側とみなす
+                doc_id = -1 if direction == "DESC" else sys.maxsize
+            value = after["timestamp"] if column == "d.timestamp" else after["rank"]
+            where = f"AND ({column}, d.doc_id) {'<' if direction == 'DESC' else '>'} (?, ?)"
+            params = [value, doc_id]
+        if column == "d.timestamp":
+            # 時刻順は時刻のインデックスを位置から順にたどり、一致した文書だけを取得する
+            # （一致した全文書を読み込んで並べ替えない）
+            sql = (
+                "SELECT d.id, d.timestamp, d.image_name, d.ocr_result, d.confidence, NULL AS rank "
+                "FROM docs d INDEXED BY idx_docs_timestamp "
+                "WHERE +d.doc_id IN (SELECT rowid FROM docs_fts WHERE docs_fts MATCH ?) "
+            )
+        else:
+            # 関連度順は一致した全文書の関連度が必要なため、全文検索の結果から並べ替える
+            sql = (
+                "SELECT d.id, d.timestamp, d.image_name, d.ocr_result, d.confidence, docs_fts.rank AS rank "
+                "FROM docs_fts JOIN docs d ON d.doc_id = docs_fts.rowid "
+                "WHERE docs_fts MATCH ? "
+            )
+        rows = conn.execute(
+            sql + f"{where} ORDER BY {column} {direction}, d.doc_id {direction} LIMIT ? OFFSET ?",
+            [match_query] + params + [limit, offset]
+        ).fetchall()
+
+        results = []
+        for row in rows:
+            item = dict(row)
+            item["snippet"] = make_snippet(item["ocr_result"], query)
+            results.append(item)
+        return total, results
+
+
+_index: Optional[HistorySearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> HistorySearchIndex:
+    """プロセス共通の検索インデックスを取得（初回は既存履歴から構築）"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = HistorySearchIndex()
+                store = get_history_store()
+                if index.is_outdated() or (index.count() == 0 and store.count() > 0):
+                    index.rebuild(store.load_all())
+                _index = index
+    return _index
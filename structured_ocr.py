@@ -0,0 +1,277 @@
+"""
+構造化出力（JSON）モードのOCR結果
+Gemini APIにJSONスキーマを指定して、ブロック・行・位置・信頼度・言語・表のセルを含む結果を受け取り、
+1回のjson.loadsで解析する。文字列から信頼度の表記を探す推定は行わない
+"""
+import json
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# ブロックの種類
+BLOCK_TYPES = ["paragraph", "heading", "table", "handwriting", "other"]
+
+# 応答のJSONスキーマ（位置はGeminiの慣例どおり [ymin, xmin, ymax, xmax] を0〜1000に正規化した値）
+OCR_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "language": {"type": "string", "description": "検出した主な言語（ISO 639-1、例: ja）"},
+        "blocks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {"type": "string", "enum": BLOCK_TYPES},
+                    "bbox": {
+                        "type": "array",
+                        "items": {"type": "integer"},
+                        "description": "[ymin, xmin, ymax, xmax]（画像全体を0〜1000に正規化）"
+                    },
+                    "confidence": {"type": "number", "description": "ブロック全体の信頼度（0〜1）"},
+                    "lines": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "text": {"type": "string"},
+                                "confidence": {"type": "number"}
+                            },
+                            "required": ["text", "confidence"]
+                        }
+                    },
+                    "cells": {
+                        "type": "array",
+                        "items": {"type": "array", "items": {"type": "string"}},
+                        "description": "表の場合のセルの文字列（行ごと、先頭行は見出し）"
+                    }
+                },
+                "required": ["type", "confidence", "lines"]
+            }
+        }
+    },
+    "required": ["language", "blocks"]
+}
+
+# generate_content に渡す生成設定
+STRUCTURED_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": OCR_RESPONSE_SCHEMA
+}
+
+
+def _clamp_confidence(value, default: float) -> float:
+    try:
+        return min(1.0, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return default
+
+
+def _parse_bbox(value) -> Optional[List[int]]:
+    """[ymin, xmin, ymax, xmax] を0〜1000の整数に揃える（形式が違う場合はNone）"""
+    if not isinstance(value, list) or len(value) != 4:
+        return None
+    try:
+        ymin, xmin, ymax, xmax = (min(1000, max(0, int(v))) for v in value)
+    except (TypeError, ValueError):
+        return None
+    return [min(ymin, ymax), min(xmin, xmax), max(ymin, ymax), max(xmin, xmax)]
+
+
+def _parse_cells(value) -> Optional[List[List[str]]]:
+    """表のセルを行ごとの文字列のリストに揃える（列数は最も長い行に合わせる）"""
+    if not isinstance(value, list):
+        return None
+    rows = [[str(cell).strip() for cell in row] for row in value if isinstance(row, list) and row]
+    if not rows:
+        return None
+    width = max(len(row) for row in rows)
+    return [row + [""] * (width - len(row)) for row in rows]
+
+
+def render_table(cells: List[List[str]]) -> str:
+    """表のセルをMarkdownの表として文字列にする（先頭行を見出しとする）"""
+    def row_text(row: List[str]) -> str:
+        return "| " + " | ".join(cell.replace("|", "\\|").replace("\n", " ") for cell in row) + " |"
+
+    lines = [row_text(cells[0]), "| " + " | ".join("---" for _ in cells[0]) + " |"]
+    lines.extend(row_text(row) for row in cells[1:])
+    return "\n".join(lines)
+
+
+def _parse_block(raw: Dict) -> Optional[Dict]:
+    block_confidence = _clamp_confidence(raw.get("confidence"), 0.0)
+    lines = [
+        {
+            "text": str(line.get("text", "")).rstrip(),
+            "confidence": _clamp_confidence(line.get("confidence"), block_confidence)
+        }
+        for line in raw.get("lines") or [] if isinstance(line, dict)
+    ]
+    cells = _parse_cells(raw.get("cells"))
+    block_type = raw.get("type") if raw.get("type") in BLOCK_TYPES else "other"
+    if block_type == "table" and cells:
+        text = render_table(cells)
+    else:
+        text = "\n".join(line["text"] for line in lines).strip()
+    if not text:
+        return None
+    return {
+        "type": block_type,
+        "text": text,
+        "confidence": block_confidence,
+        "bbox": _parse_bbox(raw.get("bbox")),
+        "lines": lines,
+        "cells": cells
+    }
+
+
+def summarize_blocks(blocks: List[Dict], language: str = "") -> Dict:
+    """
+    ブロックの一覧から結果全体（全文・信頼度）をまとめる
+
+    Returns:
+        Dict: text（ブロックを空行でつないだ全文）・confidence（文字数で重み付けした平均）・
+              language・blocks
+    """
+    weights = [(len(block["text"]), block["confidence"]) for block in blocks]
+    total = sum(weight for weight, _ in weights)
+    return {
+        "text": "\n\n".join(block["text"] for block in blocks),
+        "confidence": sum(weight * value for weight, value in weights) / total if total else 0.0,
+        "language": language,
+        "blocks": blocks
+    }
+
+
+def parse_structured_response(response_text: str) -> Dict:
+    """
+    構造化出力の応答を解析
+
+    Args:
+        response_text: Gemini APIが返したJSON文字列
+
+    Returns:
+        Dict: text・confidence・language・blocks（type・text・confidence・bbox・lines・cells）
+    """
+    try:
+        data = json.loads(response_text)
+    except ValueError as e:
+        raise Exception(f"構造化出力の解析に失敗しました: {e}")
+    if not isinstance(data, dict):
+        raise Exception("構造化出力の解析に失敗しました: 応答がJSONオブジェクトではありません")
+    blocks = [block for block in map(_parse_block, (raw for raw in data.get("blocks") or []
+                                                    if isinstance(raw, dict))) if block]
+    return summarize_blocks(blocks, str(data.get("language") or ""))
+
+
+def empty_result() -> Dict:
+    """文字がない場合の構造化出力"""
+    return summarize_blocks([])
+
+
+def _to_image_bbox(bbox: List[int], tile_box: Tuple[int, int, int, int],
+                   image_size: Tuple[int, int]) -> List[int]:
+    """タイル内の位置（0〜1000）を画像全体の位置（0〜1000）に変換"""
+    left, top, right, bottom = tile_box
+    width, height = image_size
+    ymin, xmin, ymax, xmax = bbox
+    return [
+        round((top + ymin / 1000 * (bottom - top)) / height * 1000),
+        round((left + xmin / 1000 * (right - left)) / width * 1000),
+        round((top + ymax / 1000 * (bottom - top)) / height * 1000),
+        round((left + xmax / 1000 * (right - left)) / width * 1000)
+    ]
+
+
+def merge_tile_results(tiles: List[Dict], image_size: Tuple[int, int]) -> Dict:
+    """
+    タイルごとの構造化出力を画像全体の結果にまとめる
+
+    位置を画像全体の座標に変換し、重なり部分で複数のタイルに現れたブロックは、中心に最も近い
+    中心を持つタイルのものだけを残す（位置のないブロックはそのまま残す）
+
+    Args:
+        tiles: row・col・box（タイルの位置）・structured を含むタイルごとの結果
+        image_size: タイル分割した画像の (幅, 高さ)
+    """
+    width, height = image_size
+    centers = [((tile["box"][0] + tile["box"][2]) / 2 / width * 1000,
+                (tile["box"][1] + tile["box"][3]) / 2 / height * 1000) for tile in tiles]
+    blocks = []
+    languages = Counter()
+    for index, tile in sorted(enumerate(tiles), key=lambda item: (item[1]["row"], item[1]["col"])):
+        structured = tile.get("structured")
+        if not structured:
+            continue
+        for block in structured["blocks"]:
+            languages[structured["language"]] += len(block["text"])
+            if block["bbox"] is None:
+                blocks.append(block)
+                continue
+            bbox = _to_image_bbox(block["bbox"], tile["box"], image_size)
+            x, y = (bbox[1] + bbox[3]) / 2, (bbox[0] + bbox[2]) / 2
+            nearest = min(range(len(tiles)),
+                          key=lambda i: (centers[i][0] - x) ** 2 + (centers[i][1] - y) ** 2)
+            if nearest == index:
+                blocks.append(dict(block, bbox=bbox))
+    language = languages.most_common(1)[0][0] if languages else ""
+    return summarize_blocks(blocks, language)
+
+
+def merge_page_results(pages: List[Dict]) -> Dict:
+    """
+    ページごとの構造化出力を文書全体の結果にまとめる
+
+    ブロックをページ順に並べて各ブロックに page（1始まり）を付ける。行ごとの信頼度・位置（ページ内）・
+    表のセルはそのまま残す（失敗したページ・白紙のページはブロックがないため含まれない）
+
+    Args:
+        pages: page・structured を含むページごとの結果（DocumentOCRProcessor.process の結果）
+    """
+    blocks = []
+    languages = Counter()
+    for page in sorted(pages, key=lambda result: result["page"]):
+        structured = page.get("structured")
+        if not structured:
+            continue
+        for block in structured["blocks"]:
+            languages[structured["language"]] += len(block["text"])
+            blocks.append(dict(block, page=page["page"]))
+    language = languages.most_common(1)[0][0] if languages else ""
+    return summarize_blocks(blocks, language)
+
+
+def _column_names(header: List[str]) -> List[str]:
+    """見出しを列名にする（空の見出しは「列n」、重複する見出しには番号を付ける）"""
+    names = []
+    seen = Counter()
+    for number, name in enumerate(header, start=1):
+        name = name or f"列{number}"
+        seen[name] += 1
+        names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return names
+
+
+def table_to_dataframe(block: Dict):
+    """表のブロックをpandasのDataFrameに変換（先頭行を列名とする）"""
+    import pandas as pd
+
+    cells = block.get("cells") or []
+    if len(cells) < 2:
+        return pd.DataFrame(cells)
+    return pd.DataFrame(cells[1:], columns=_column_names(cells[0]))
+
+
+def get_tables(structured: Optional[Dict]) -> List[Dict]:
+    """構造化出力から表のブロックを取得"""
+    if not structured:
+        return []
+    return [block for block in structured["blocks"] if block["type"] == "table" and block["cells"]]
+
+
+@lru_cache(maxsize=1)
+def get_generation_config() -> Dict:
+    """generate_content に渡す生成設定（JSONスキーマの変換は初回の1回だけ行う）"""
+    from google.generativeai.types import generation_types
+
+    return generation_types.to_generation_config_dict(STRUCTURED_GENERATION_CONFIG)
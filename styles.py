@@ -0,0 +1,623 @@
+"""
+画面のスタイル（CSS）
+Streamlitは操作のたびにスクリプト全体を再実行するため、CSSはここで一度だけ
+コメントと空白を取り除いた<style>要素に変換し、再実行時は変換済みの文字列を送るだけにする
+"""
+import re
+from functools import lru_cache
+
+# ImmeasurableなカスタムCSS
+BASE_CSS = """
+/* メインヘッダー - グラデーションとアニメーション */
+.main-header {
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    color: white;
+    padding: 3rem 2rem;
+    border-radius: 20px;
+    text-align: center;
+    margin-bottom: 3rem;
+    box-shadow: 0 20px 40px rgba(102, 126, 234, 0.3);
+    position: relative;
+    overflow: hidden;
+}
+
+.main-header::before {
+    content: '';
+    position: absolute;
+    top: 0;
+    left: -100%;
+    width: 100%;
+    height: 100%;
+    background: linear-gradient(90deg, transparent, rgba(255,255,255,0.2), transparent);
+    animation: shimmer 3s infinite;
+}
+
+@keyframes shimmer {
+    0% { left: -100%; }
+    100% { left: 100%; }
+}
+
+.main-header h1 {
+    margin: 0;
+    font-size: 3.5rem;
+    font-weight: 800;
+    text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
+    background: linear-gradient(45deg, #fff, #f0f8ff);
+    -webkit-background-clip: text;
+    -webkit-text-fill-color: transparent;
+    background-clip: text;
+}
+
+.main-header p {
+    margin: 1rem 0 0 0;
+    font-size: 1.4rem;
+    opacity: 0.95;
+    font-weight: 300;
+    letter-spacing: 1px;
+}
+
+/* 機能カード - モダンなデザイン */
+.feature-card {
+    background: linear-gradient(145deg, #ffffff, #f8f9fa);
+    padding: 2rem;
+    border-radius: 20px;
+    box-shadow: 0 10px 30px rgba(0,0,0,0.1);
+    margin: 1.5rem 0;
+    border: none;
+    position: relative;
+    overflow: hidden;
+    transition: all 0.3s ease;
+}
+
+.feature-card::before {
+    content: '';
+    position: absolute;
+    top: 0;
+    left: 0;
+    width: 100%;
+    height: 4px;
+    background: linear-gradient(90deg, #667eea, #764ba2);
+}
+
+.feature-card:hover {
+    transform: translateY(-5px);
+    box-shadow: 0 20px 40px rgba(0,0,0,0.15);
+}
+
+.feature-card h3 {
+    color: #667eea;
+    margin-top: 0;
+    font-size: 1.5rem;
+    font-weight: 600;
+}
+
+/* 信頼度インジケーター */
+.confidence-high {
+    color: #00d4aa;
+    font-weight: bold;
+    text-shadow: 0 0 10px rgba(0, 212, 170, 0.3);
+}
+
+.confidence-medium {
+    color: #ffa726;
+    font-weight: bold;
+    text-shadow: 0 0 10px rgba(255, 167, 38, 0.3);
+}
+
+.confidence-low {
+    color: #ff5722;
+    font-weight: bold;
+    text-shadow: 0 0 10px rgba(255, 87, 34, 0.3);
+}
+
+/* 結果ボックス */
+.result-box {
+    background: linear-gradient(145deg, #f8f9fa, #ffffff);
+    border: 2px solid transparent;
+    border-radius: 15px;
+    padding: 1.5rem;
+    margin: 1.5rem 0;
+    box-shadow: 0 5px 15px rgba(0,0,0,0.08);
+    position: relative;
+    overflow: hidden;
+}
+
+.result-box::before {
+    content: '';
+    position: absolute;
+    top: 0;
+    left: 0;
+    right: 0;
+    height: 3px;
+    background: linear-gradient(90deg, #667eea, #764ba2);
+}
+
+/* アップロードエリア */
+.upload-area {
+    background: linear-gradient(145deg, #f8f9fa, #ffffff);
+    border: 3px dashed #667eea;
+    border-radius: 20px;
+    padding: 3rem;
+    text-align: center;
+    margin: 2rem 0;
+    transition: all 0.3s ease;
+    position: relative;
+    overflow: hidden;
+}
+
+.upload-area:hover {
+    border-color: #764ba2;
+    background: linear-gradient(145deg, #f0f8ff, #ffffff);
+    transform: scale(1.02);
+}
+
+.upload-area::before {
+    content: '';
+    position: absolute;
+    top: 0;
+    left: 0;
+    right: 0;
+    bottom: 0;
+    background: linear-gradient(45deg, transparent, rgba(102, 126, 234, 0.05), transparent);
+    opacity: 0;
+    transition: opacity 0.3s ease;
+}
+
+.upload-area:hover::before {
+    opacity: 1;
+}
+
+/* アニメーション */
+@keyframes fadeInUp {
+    from {
+        opacity: 0;
+        transform: translateY(30px);
+    }
+    to {
+        opacity: 1;
+        transform: translateY(0);
+    }
+}
+
+.fade-in-up {
+    animation: fadeInUp 0.6s ease-out;
+}
+
+/* レスポンシブデザイン */
+@media (max-width: 768px) {
+    .main-header h1 {
+        font-size: 2.5rem;
+    }
+
+    .main-header p {
+        font-size: 1.1rem;
+    }
+
+    .feature-card {
+        padding: 1.5rem;
+    }
+}
+"""
+
+# ダークテーマ用のCSS（URLパラメータで制御）
+DARK_CSS = """
+/* ダークテーマ用の強力なスタイル */
+.stApp {
+    background-color: #0e1117 !important;
+}
+
+.main .block-container {
+    background-color: #0e1117 !important;
+    color: #ffffff !important;
+}
+
+.stApp > div {
+    background-color: #0e1117 !important;
+}
+
+.stApp > div > div {
+    background-color: #0e1117 !important;
+}
+
+.stApp > div > div > div {
+    background-color: #0e1117 !important;
+}
+
+/* サイドバー */
+.stSidebar {
+    background-color: #0e1117 !important;
+}
+
+.stSidebar > div {
+    background-color: #0e1117 !important;
+}
+
+/* テキスト - より高いコントラスト */
+h1, h2, h3, h4, h5, h6 {
+    color: #ffffff !important;
+    text-shadow: 0 0 2px rgba(255, 255, 255, 0.1) !important;
+}
+
+p, div, span, label {
+    color: #e0e0e0 !important;
+}
+
+/* ボタン - より目立つ色 */
+.stButton > button {
+    background-color: #1f77b4 !important;
+    color: #ffffff !important;
+    border: 1px solid #1f77b4 !important;
+    box-shadow: 0 2px 4px rgba(31, 119, 180, 0.3) !important;
+}
+
+.stButton > button:hover {
+    background-color: #0d5aa7 !important;
+    color: #ffffff !important;
+    box-shadow: 0 4px 8px rgba(31, 119, 180, 0.4) !important;
+}
+
+/* 入力欄 - より高いコントラスト */
+.stTextInput > div > div > input,
+.stTextArea > div > div > textarea,
+.stSelectbox > div > div {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+    border: 2px solid #444 !important;
+}
+
+.stTextInput > div > div > input:focus,
+.stTextArea > div > div > textarea:focus {
+    border-color: #1f77b4 !important;
+    box-shadow: 0 0 0 2px rgba(31, 119, 180, 0.2) !important;
+}
+
+/* ファイルアップローダー */
+.stFileUploader > div {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+    border: 2px dashed #666 !important;
+}
+
+.stFileUploader > div > div {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+}
+
+.stFileUploader label {
+    color: #e0e0e0 !important;
+}
+
+.stFileUploader button {
+    background-color: #1f77b4 !important;
+    color: #ffffff !important;
+    border: 1px solid #1f77b4 !important;
+}
+
+.stFileUploader button:hover {
+    background-color: #0d5aa7 !important;
+    color: #ffffff !important;
+}
+
+/* ファイルアップローダーの詳細スタイル */
+.stFileUploader > div > div > div {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+}
+
+.stFileUploader > div > div > div > div {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+}
+
+.stFileUploader > div > div > div > div > div {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+}
+
+/* ファイルアップローダーのテキスト */
+.stFileUploader p {
+    color: #e0e0e0 !important;
+}
+
+.stFileUploader span {
+    color: #e0e0e0 !important;
+}
+
+.stFileUploader div {
+    color: #e0e0e0 !important;
+}
+
+/* ファイルアップローダーのドラッグエリア */
+.stFileUploader > div > div > div > div > div > div {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+    border: 2px dashed #666 !important;
+}
+
+/* ファイルアップローダーのドラッグテキスト */
+.stFileUploader > div > div > div > div > div > div > div {
+    color: #e0e0e0 !important;
+}
+
+.stFileUploader > div > div > div > div > div > div > div > div {
+    color: #e0e0e0 !important;
+}
+
+/* ファイルアップローダーのボタンエリア */
+.stFileUploader > div > div > div > div > div > div > div > div > div {
+    background-color: #1a1a1a !important;
+}
+
+.stFileUploader > div > div > div > div > div > div > div > div > div > button {
+    background-color: #1f77b4 !important;
+    color: #ffffff !important;
+    border: 1px solid #1f77b4 !important;
+}
+
+.stFileUploader > div > div > div > div > div > div > div > div > div > button:hover {
+    background-color: #0d5aa7 !important;
+    color: #ffffff !important;
+}
+
+/* カスタム要素 */
+.main-header {
+    color: #4fc3f7 !important;
+    text-shadow: 0 0 4px rgba(79, 195, 247, 0.3) !important;
+}
+
+.result-box {
+    background-color: #1a1a1a !important;
+    border: 2px solid #444 !important;
+    color: #ffffff !important;
+    box-shadow: 0 4px 8px rgba(0, 0, 0, 0.3) !important;
+}
+
+.upload-area {
+    border-color: #666 !important;
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+}
+
+/* 情報ボックス - より高いコントラスト */
+.stAlert {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+    border: 2px solid #444 !important;
+    box-shadow: 0 2px 4px rgba(0, 0, 0, 0.2) !important;
+}
+
+/* エクスパンダー */
+.streamlit-expanderHeader {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+    border: 1px solid #444 !important;
+}
+
+.streamlit-expanderContent {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+    border: 1px solid #444 !important;
+}
+
+/* メトリクス */
+.stMetric {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+    border: 1px solid #444 !important;
+}
+
+/* プログレスバー */
+.stProgress > div > div > div {
+    background-color: #1f77b4 !important;
+}
+
+/* スピナー */
+.stSpinner {
+    color: #1f77b4 !important;
+}
+
+/* コードブロック */
+pre, code {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+    border: 1px solid #444 !important;
+}
+
+/* テーブル */
+.stDataFrame {
+    background-color: #1a1a1a !important;
+    color: #ffffff !important;
+}
+
+/* チェックボックス */
+.stCheckbox > label {
+    color: #e0e0e0 !important;
+}
+
+/* ラジオボタン */
+.stRadio > label {
+    color: #e0e0e0 !important;
+}
+
+/* スライダー */
+.stSlider > div > div > div {
+    background-color: #1f77b4 !important;
+}
+
+/* セレクトボックス */
+.stSelectbox > label {
+    color: #e0e0e0 !important;
+}
+
+/* マークダウン */
+.stMarkdown {
+    color: #e0e0e0 !important;
+}
+
+/* リンク */
+a {
+    color: #4fc3f7 !important;
+}
+
+a:hover {
+    color: #81d4fa !important;
+}
+
+/* 成功メッセージ */
+.stSuccess {
+    background-color: #1a1a1a !important;
+    color: #4caf50 !important;
+    border: 2px solid #4caf50 !important;
+}
+
+/* エラーメッセージ */
+.stError {
+    background-color: #1a1a1a !important;
+    color: #f44336 !important;
+    border: 2px solid #f44336 !important;
+}
+
+/* 警告メッセージ */
+.stWarning {
+    background-color: #1a1a1a !important;
+    color: #ff9800 !important;
+    border: 2px solid #ff9800 !important;
+}
+
+/* 情報メッセージ */
+.stInfo {
+    background-color: #1a1a1a !important;
+    color: #2196f3 !important;
+    border: 2px solid #2196f3 !important;
+}
+"""
+
+# アップロードエリアを広くするためのCSS
+UPLOADER_CSS = """
+/* ファイルアップローダーのスタイルをカスタマイズ */
+.stFileUploader > div {
+    min-height: 120px !important;
+    padding: 20px !important;
+}
+
+.stFileUploader > div > div {
+    min-height: 80px !important;
+    border: 2px dashed #1f77b4 !important;
+    border-radius: 10px !important;
+    padding: 20px !important;
+    text-align: center !important;
+    background-color: #f8f9fa !important;
+    transition: all 0.3s ease !important;
+}
+
+.stFileUploader > div > div:hover {
+    border-color: #0d5aa7 !important;
+    background-color: #e3f2fd !important;
+}
+
+/* ダークテーマ対応 */
+[data-testid="stAppViewContainer"] [data-theme="dark"] .stFileUploader > div > div {
+    background-color: #2d2d2d !important;
+    border-color: #666 !important;
+    color: #ffffff !important;
+}
+
+[data-testid="stAppViewContainer"] [data-theme="dark"] .stFileUploader > div > div:hover {
+    border-color: #1f77b4 !important;
+    background-color: #3a3a3a !important;
+}
+
+/* ファイルアップローダーのテキストを日本語に変更 - より具体的なセレクター */
+.stFileUploader > div > div::before {
+    content: "📁 ここをクリックしてファイルを選択 または 画像をドラッグ&ドロップ" !important;
+    display: block !important;
+    font-size: 16px !important;
+    font-weight: bold !important;
+    color: #1f77b4 !important;
+    text-align: center !important;
+    margin-bottom: 10px !important;
+    padding: 10px !important;
+    position: relative !important;
+    z-index: 1000 !important;
+}
+
+/* 英語のテキストを非表示 - より具体的なセレクター */
+.stFileUploader > div > div > div:first-child,
+.stFileUploader > div > div > div:first-child > div,
+.stFileUploader > div > div > div:first-child > span,
+.stFileUploader > div > div > div:first-child > p {
+    display: none !important;
+    visibility: hidden !important;
+}
+
+/* ボタンテキストも日本語に変更 */
+.stFileUploader > div > div::after {
+    content: "📁 ファイルを選択" !important;
+    display: inline-block !important;
+    background-color: #1f77b4 !important;
+    color: white !important;
+    padding: 8px 16px !important;
+    border-radius: 5px !important;
+    font-size: 14px !important;
+    font-weight: bold !important;
+    cursor: pointer !important;
+    margin-top: 10px !important;
+    position: relative !important;
+    z-index: 1000 !important;
+}
+
+/* ダークテーマでのテキスト色 */
+[data-testid="stAppViewContainer"] [data-theme="dark"] .stFileUploader > div > div::before {
+    color: #1f77b4 !important;
+}
+
+[data-testid="stAppViewContainer"] [data-theme="dark"] .stFileUploader > div > div::after {
+    background-color: #1f77b4 !important;
+    color: white !important;
+}
+
+/* 追加の非表示ルール */
+.stFileUploader > div > div > div:first-child * {
+    display: none !important;
+    visibility: hidden !important;
+}
+"""
+
+_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_SPACES = re.compile(r"\s+")
+_AROUND_PUNCTUATION = re.compile(r"\s*([{};,])\s*")
+_AFTER_COLON = re.compile(r":\s+")
+
+
+def minify_css(css: str) -> str:
+    """CSSからコメントと不要な空白を取り除く（セレクタ中の空白は1つに詰めて残す）"""
+    css = _COMMENT.sub("", css)
+    css = _SPACES.sub(" ", css)
+    css = _AROUND_PUNCTUATION.sub(r"\1", css)
+    return _AFTER_COLON.sub(":", css).strip()
+
+
+@lru_cache(maxsize=2)
+def _build_style_html(dark: bool) -> str:
+    css = BASE_CSS + DARK_CSS if dark else BASE_CSS
+    return f"<style>{minify_css(css)}</style>"
+
+
+def get_style_html(theme: str = "light") -> str:
+    """
+    ページ全体のスタイルの<style>要素を取得（テーマごとに1回だけ作成）
+
+    Args:
+        theme: "dark" の場合はダークテーマ、それ以外（URLの不正な値を含む）はライトテーマ
+
+    Returns:
+        str: st.markdown(..., unsafe_allow_html=True) に渡す<style>要素
+    """
+    # URLのクエリパラメータをそのまま受け取るため、キャッシュはテーマの2種類だけに限る
+    return _build_style_html(theme == "dark")
+
+
+@lru_cache(maxsize=None)
+def get_uploader_style_html() -> str:
+    """ホームページのアップロードエリアの<style>要素を取得"""
+    return f"<style>{minify_css(UPLOADER_CSS)}</style>"
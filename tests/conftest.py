@@ -0,0 +1,58 @@
+"""
+テスト共通の設定
+アプリのモジュールはリポジトリ直下にあるため、パスに追加して読み込む
+"""
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT_DIR, os.path.join(ROOT_DIR, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# アプリのモジュールを読み込む前に設定を上書き（実際のGemini APIは呼び出さない）
+os.environ["GEMINI_API_KEY"] = "test"
+os.environ["HISTORY_BACKEND"] = "sqlite"
+os.environ["OCR_CACHE_BACKEND"] = "memory"
+os.environ["METRICS_EXPORT_FILE"] = ""
+os.environ["GEMINI_RATE_LIMIT_RPM"] = "100000000"
+os.environ["GEMINI_RATE_LIMIT_BURST"] = "100000"
+
+import blob_store  # noqa: E402
+import duplicate_index  # noqa: E402
+import history_store  # noqa: E402
+import model_pool  # noqa: E402
+import ocr_cache  # noqa: E402
+import search_index  # noqa: E402
+import thumbnails  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _work_in_tmp_path(tmp_path, monkeypatch):
+    """
+    一時ディレクトリで実行し、プロセス共通のストアを作り直す
+
+    既定のパス（blobs/ など）に書き込むストアがリポジトリを汚さず、テスト間で履歴を共有しない
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(blob_store, "_store", None)
+    monkeypatch.setattr(history_store, "_store", None)
+    monkeypatch.setattr(search_index, "_index", None)
+    monkeypatch.setattr(duplicate_index, "_index", None)
+    monkeypatch.setattr(thumbnails, "_cache", None)
+    monkeypatch.setattr(ocr_cache, "_cache", None)
+    monkeypatch.setattr(model_pool, "_models", {})
+
+
+@pytest.fixture
+def fake_model():
+    """全エンジンをGemini APIの代替（遅延なし）に差し替え"""
+    from config import GEMINI_MODEL, OCR_ENGINES
+    from fake_gemini import FakeGenerativeModel
+
+    model = FakeGenerativeModel(latency=0.0, jitter=0.0, seed=0)
+    for model_name in set(OCR_ENGINES.values()) | {GEMINI_MODEL}:
+        model_pool.register_model(model_name, model)
+    return model
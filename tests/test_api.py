@@ -0,0 +1,114 @@
+"""HTTP APIのリクエスト検証のテスト（Gemini APIの代わりに benchmarks/fake_gemini.py を使用）"""
+import base64
+import io
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+from api.ocr import app
+from fixtures import make_document_image
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("body", [
+    '[]',
+    '"x"',
+    '{bad',
+    '{}',
+    '{"image": 5}',
+    '{"image": ["aGk="]}',
+    '{"image": "!!"}',
+    '{"image": "aGk=", "image_name": 3}',
+])
+def test_invalid_json_body_is_rejected_with_400(client, body):
+    response = client.post("/api/ocr", content=body, headers={"content-type": "application/json"})
+
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+
+def test_job_submission_validates_json_body(client):
+    response = client.post("/api/jobs", content='[]', headers={"content-type": "application/json"})
+    assert response.status_code == 400
+
+
+def _png_base64() -> str:
+    buffer = io.BytesIO()
+    make_document_image(320, 240, seed=0).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+@pytest.fixture
+def small_limit(monkeypatch):
+    monkeypatch.setattr("api.ocr.MAX_FILE_SIZE", 1000)
+
+    def no_decode(*args, **kwargs):
+        raise AssertionError("上限を超えた本文をデコードした")
+
+    monkeypatch.setattr("api.ocr.base64.b64decode", no_decode)
+
+
+def test_oversized_json_body_is_rejected_before_decoding(client, small_limit):
+    body = json.dumps({"image": "A" * 4000})
+
+    response = client.post("/api/ocr", content=body, headers={"content-type": "application/json"})
+
+    assert response.status_code == 413
+
+
+def test_oversized_body_without_content_length_is_rejected(client, small_limit):
+    body = json.dumps({"image": "A" * 200_000}).encode()
+    chunks = (body[start:start + 4096] for start in range(0, len(body), 4096))
+
+    response = client.post("/api/ocr", content=chunks, headers={"content-type": "application/json"})
+
+    assert response.status_code == 413
+
+
+def test_oversized_multipart_upload_is_rejected(client, monkeypatch):
+    monkeypatch.setattr("api.ocr.MAX_FILE_SIZE", 1000)
+    files = {"file": ("scan.png", b"\x89PNG\r\n\x1a\n" + b"0" * 200_000, "image/png")}
+
+    assert client.post("/api/ocr", files=files).status_code == 413
+
+
+def test_broken_image_is_rejected_with_415(client):
+    image = base64.b64decode(_png_base64())[:200]
+    body = json.dumps({"image": base64.b64encode(image).decode()})
+
+    response = client.post("/api/ocr", content=body, headers={"content-type": "application/json"})
+
+    assert response.status_code == 415
+
+
+def test_storage_errors_after_decoding_are_not_reported_as_bad_image(client, monkeypatch):
+    def disk_full(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    # 画像の読み込み後のOCR処理（キャッシュのディスクなど）で起きたOSError
+    monkeypatch.setattr("ocr_processor.OCRProcessor.process_image_bytes", disk_full)
+    body = json.dumps({"image": _png_base64()})
+
+    response = client.post("/api/ocr", content=body, headers={"content-type": "application/json"})
+
+    assert response.status_code == 502
+    assert "No space left" in response.json()["error"]
+
+
+def test_multipage_tiff_returns_pages_in_order(client, fake_model):
+    pages = [make_document_image(400, 300, seed=seed).convert("RGB") for seed in range(3)]
+    buffer = io.BytesIO()
+    pages[0].save(buffer, format="TIFF", save_all=True, append_images=pages[1:])
+    files = {"file": ("scan.tiff", buffer.getvalue(), "image/tiff")}
+
+    response = client.post("/api/ocr", files=files)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [page["page"] for page in body["pages"]] == [1, 2, 3]
+    assert body["text"].index("ページ 1") < body["text"].index("ページ 3")
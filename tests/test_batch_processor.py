@@ -0,0 +1,98 @@
+"""一括OCR処理のテスト（Gemini APIの代わりに benchmarks/fake_gemini.py を使用）"""
+import io
+import threading
+import zipfile
+
+import model_pool
+from batch_processor import BatchOCRProcessor, expand_uploads
+from config import OCR_ENGINES
+from fake_gemini import FakeGenerativeModel
+from fixtures import make_document_image
+
+
+def _png(seed: int = 0) -> bytes:
+    buffer = io.BytesIO()
+    make_document_image(320, 240, seed=seed).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _zip(entries) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+class _ConcurrencyTrackingModel(FakeGenerativeModel):
+    """同時に処理中のリクエスト数の最大値を記録する"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.active = 0
+        self.max_active = 0
+        self._active_lock = threading.Lock()
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        with self._active_lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            return super().generate_content(contents, stream=stream, **kwargs)
+        finally:
+            with self._active_lock:
+                self.active -= 1
+
+
+def test_expand_uploads_unpacks_zip_and_skips_bad_files():
+    archive = _zip([
+        ("scans/a.png", _png(0)),
+        ("scans/notes.txt", b"text"),
+        ("scans/fake.png", b"not an image"),
+        ("scans/.hidden.png", _png(1)),
+    ])
+
+    images, warnings = expand_uploads([
+        ("batch.zip", archive),
+        ("b.png", _png(2)),
+        ("c.doc", b"data"),
+        ("broken.zip", b"PK not a zip"),
+    ])
+
+    assert [name for name, _ in images] == ["batch.zip/scans/a.png", "b.png"]
+    assert len(warnings) == 4
+    assert any("notes.txt" in warning for warning in warnings)
+    assert any("fake.png" in warning for warning in warnings)
+    assert any("broken.zip" in warning for warning in warnings)
+
+
+def test_expand_uploads_limits_number_of_images(monkeypatch):
+    monkeypatch.setattr("batch_processor.BATCH_MAX_FILES", 2)
+
+    images, warnings = expand_uploads([(f"{number}.png", _png(number)) for number in range(3)])
+
+    assert [name for name, _ in images] == ["0.png", "1.png"]
+    assert len(warnings) == 1
+
+
+def test_process_returns_every_image_within_worker_limit():
+    model = _ConcurrencyTrackingModel(latency=0.05, jitter=0.0, seed=0)
+    model_name = next(iter(OCR_ENGINES.values()))
+    model_pool.register_model(model_name, model)
+    images = [(f"{number}.png", _png(number)) for number in range(6)]
+
+    results = list(BatchOCRProcessor(model_name, max_workers=2).process(images))
+
+    assert sorted(result["index"] for result in results) == list(range(6))
+    assert all(result["error"] is None and result["ocr_result"] for result in results)
+    assert model.max_active == 2
+
+
+def test_process_reports_errors_per_image(fake_model):
+    images = [("good.png", _png(0)), ("bad.png", b"\x89PNG\r\n\x1a\nbroken")]
+
+    results = {result["name"]: result for result in BatchOCRProcessor(max_workers=2).process(images)}
+
+    assert results["good.png"]["error"] is None
+    assert results["bad.png"]["error"]
+    assert results["bad.png"]["ocr_result"] == ""
@@ -0,0 +1,24 @@
+"""ベンチマークの集計のテスト"""
+import pytest
+
+from run import _run_measurement, percentile
+
+
+# 95·20/100 = 19 のように q·n/100 が奇数の整数でも、19番目（最大値ではない）を返す
+@pytest.mark.parametrize("q, expected", [(50, 10), (95, 19), (99, 20), (100, 20), (5, 1), (0, 1)])
+def test_percentile_nearest_rank(q, expected):
+    samples = [float(value) for value in range(20, 0, -1)]
+    assert percentile(samples, q) == expected
+    assert percentile([], q) == 0.0
+
+
+def test_errors_are_counted_across_threads():
+    def func(i):
+        if i % 3 == 0:
+            raise Exception("失敗")
+
+    samples, _, errors, _ = _run_measurement(func, iterations=300, concurrency=8, warmup=0,
+                                             memory_iterations=0)
+
+    assert len(samples) == 300
+    assert errors == 100
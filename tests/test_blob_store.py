@@ -0,0 +1,133 @@
+"""画像のblobストアと履歴ストアの参照数のテスト"""
+import base64
+import os
+
+import pytest
+
+from blob_store import BlobStore, hash_bytes
+from history_store import JournalHistoryStore, JSONHistoryStore, SQLiteHistoryStore
+
+
+def _blob_files(blobs: BlobStore):
+    return sorted(
+        name for entry in os.scandir(blobs.blob_dir) if entry.is_dir()
+        for name in os.listdir(entry.path)
+    )
+
+
+def _item(item_id: str, timestamp: str = "2024-01-01T00:00:00"):
+    return {"id": item_id, "timestamp": timestamp, "image_name": f"{item_id}.png",
+            "ocr_result": "text", "confidence": 0.9}
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+def test_put_stores_same_content_once(blobs):
+    first = blobs.put(b"image")
+    second = blobs.put(b"image")
+
+    assert first == second == hash_bytes(b"image")
+    assert _blob_files(blobs) == [first]
+    assert blobs.stats() == {"blobs": 1, "bytes": 5, "refs": 2}
+    assert blobs.get(first) == b"image"
+
+
+def test_release_deletes_file_when_last_reference_goes(blobs):
+    blob_hash = blobs.put(b"image", refs=2)
+
+    blobs.release(blob_hash)
+    assert blobs.get(blob_hash) == b"image"
+
+    blobs.release(blob_hash)
+    assert blobs.get(blob_hash) is None
+    assert _blob_files(blobs) == []
+    assert blobs.stats()["blobs"] == 0
+    assert not blobs.acquire(blob_hash)
+
+
+def test_release_many_counts_duplicates(blobs):
+    kept = blobs.put(b"kept", refs=3)
+    dropped = blobs.put(b"dropped", refs=2)
+
+    blobs.release_many([kept, dropped, dropped, None])
+
+    assert blobs.get(kept) == b"kept"
+    assert blobs.get(dropped) is None
+    assert blobs.stats()["refs"] == 2
+
+
+def test_collect_garbage_repairs_refs_and_removes_orphans(blobs):
+    referenced = blobs.put(b"referenced", refs=5)
+    orphan = blobs.put(b"orphan")
+    stray_dir = os.path.join(blobs.blob_dir, "ab")
+    os.makedirs(stray_dir)
+    with open(os.path.join(stray_dir, "ab.tmp"), "wb") as f:
+        f.write(b"partial")
+
+    removed = blobs.collect_garbage({referenced: 2}, grace_seconds=0)
+
+    assert removed == 2
+    assert _blob_files(blobs) == [referenced]
+    assert blobs.get(orphan) is None
+    assert blobs.stats()["refs"] == 2
+
+
+def test_collect_garbage_skips_recent_blobs(blobs):
+    recent = blobs.put(b"recent")
+
+    assert blobs.collect_garbage({}, grace_seconds=3600) == 0
+    assert blobs.get(recent) == b"recent"
+
+
+@pytest.fixture(params=["sqlite", "jsonl", "json"])
+def store(request, tmp_path, blobs):
+    if request.param == "sqlite":
+        return SQLiteHistoryStore(str(tmp_path / "history.db"), max_items=2, blob_store=blobs)
+    if request.param == "jsonl":
+        return JournalHistoryStore(str(tmp_path / "history.jsonl"), max_items=2, blob_store=blobs)
+    return JSONHistoryStore(str(tmp_path / "history.json"), max_items=2, blob_store=blobs)
+
+
+def test_history_store_shares_and_releases_images(store, blobs):
+    store.add(_item("a", "2024-01-01T00:00:00"), image=b"same")
+    store.add(_item("b", "2024-01-02T00:00:00"), image=b"same")
+
+    assert blobs.stats()["refs"] == 2
+    assert store.image_references() == {hash_bytes(b"same"): 2}
+
+    store.delete("a")
+    assert store.load_image("b") == b"same"
+
+    store.delete("b")
+    assert blobs.get(hash_bytes(b"same")) is None
+
+
+def test_history_store_trim_and_clear_release_images(store, blobs):
+    for number in range(3):
+        store.add(_item(str(number), f"2024-01-0{number + 1}T00:00:00"), image=f"image{number}".encode())
+    if isinstance(store, JournalHistoryStore):
+        # ジャーナルは上限超過分をコンパクションのときに取り除く
+        assert store.image_references()[hash_bytes(b"image0")] == 1
+        store.compact()
+
+    # 上限（2件）を超えた古い項目の画像は削除される
+    assert store.count() == 2
+    assert blobs.get(hash_bytes(b"image0")) is None
+    assert blobs.stats()["blobs"] == 2
+
+    store.clear()
+    assert blobs.stats() == {"blobs": 0, "bytes": 0, "refs": 0}
+    assert _blob_files(blobs) == []
+
+
+def test_import_moves_inline_images_to_blob_store(store, blobs):
+    encoded = base64.b64encode(b"legacy").decode()
+    store.import_items([dict(_item("a"), image_data=encoded), dict(_item("b"), image_data=encoded)])
+
+    assert _blob_files(blobs) == [hash_bytes(b"legacy")]
+    assert store.image_references() == {hash_bytes(b"legacy"): 2}
+    assert store.load_image("a") == b"legacy"
+    assert "image_data" not in store.load_all()[0]
@@ -0,0 +1,71 @@
+"""複数ページ文書のOCR処理のテスト（Gemini APIの代わりに benchmarks/fake_gemini.py を使用）"""
+import io
+
+from PIL import Image
+
+from document_processor import (DocumentOCRProcessor, count_pages, is_multipage_document, iter_document_pages,
+                                render_first_page, stitch_pages)
+from fixtures import make_document_image
+
+
+def _pages(count: int):
+    return [make_document_image(400, 300, seed=seed).convert("RGB") for seed in range(count)]
+
+
+def _document(count: int, document_format: str) -> bytes:
+    pages = _pages(count)
+    buffer = io.BytesIO()
+    pages[0].save(buffer, format=document_format, save_all=True, append_images=pages[1:])
+    return buffer.getvalue()
+
+
+def test_detects_multipage_documents():
+    tiff = _document(3, "TIFF")
+    pdf = _document(2, "PDF")
+
+    assert is_multipage_document("scan.tiff", tiff) and count_pages(tiff) == 3
+    assert is_multipage_document("scan.pdf", pdf) and count_pages(pdf) == 2
+    # 1ページのTIFFや拡張子が対象外の画像は通常の画像として扱う
+    assert not is_multipage_document("scan.tiff", _document(1, "TIFF"))
+    assert not is_multipage_document("scan.png", tiff)
+
+
+def test_pages_are_read_one_by_one_up_to_limit():
+    pages = list(iter_document_pages(_document(4, "TIFF"), max_pages=2))
+
+    assert [index for index, _ in pages] == [0, 1]
+    assert all(page.size == (400, 300) for _, page in pages)
+
+
+def test_first_page_preview_from_pdf():
+    preview = Image.open(io.BytesIO(render_first_page(_document(2, "PDF"))))
+
+    assert preview.format == "PNG"
+    assert preview.width > 0 and preview.height > 0
+
+
+def test_process_returns_every_page_and_caches_them(fake_model):
+    document = _document(3, "TIFF")
+
+    results = list(DocumentOCRProcessor(max_workers=2).process(document))
+    calls = fake_model.calls
+    cached = list(DocumentOCRProcessor(max_workers=2).process(document))
+
+    assert sorted(result["page"] for result in results) == [1, 2, 3]
+    assert all(result["error"] is None and result["ocr_result"] for result in results)
+    assert all(result["cache_hit"] for result in cached)
+    assert fake_model.calls == calls
+
+
+def test_stitch_pages_orders_pages_and_skips_failed_ones_in_confidence():
+    results = [
+        {"page": 2, "ocr_result": "", "confidence": 0.0, "no_text": True, "error": None},
+        {"page": 3, "ocr_result": "", "confidence": 0.0, "error": "quota"},
+        {"page": 1, "ocr_result": "first", "confidence": 0.8, "error": None},
+    ]
+
+    text, confidence = stitch_pages(results)
+
+    assert text.index("ページ 1") < text.index("ページ 2") < text.index("ページ 3")
+    assert "[エラー: quota]" in text
+    assert confidence == 0.8
@@ -0,0 +1,156 @@
+"""似た画像の検出（知覚ハッシュのインデックス）のテスト"""
+import io
+import random
+
+import numpy as np
+import pytest
+from PIL import Image, ImageFilter
+
+from duplicate_index import (HammingIndex, ImageDuplicateIndex, _popcount_bytes, get_duplicate_index,
+                             hamming_distance, perceptual_hash)
+
+
+def _brute_force(entries, value, max_distance, limit):
+    matched = sorted(
+        ((item_id, hamming_distance(stored, value)) for item_id, stored in entries.items()),
+        key=lambda pair: pair[1]
+    )
+    return [pair for pair in matched if pair[1] <= max_distance][:limit]
+
+
+def _document_image(seed: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    pixels = (rng.random((48, 64)) > 0.5).astype(np.uint8) * 255
+    return Image.fromarray(pixels).resize((640, 480), Image.NEAREST).filter(ImageFilter.GaussianBlur(2))
+
+
+def test_remove_moves_last_item_into_hole():
+    index = HammingIndex(capacity=4)
+    index.add("a", 0b0001)
+    index.add("b", 0b0011)
+    index.add("c", 0b0111)
+
+    index.remove("a")
+
+    assert len(index) == 2
+    # 末尾の c が a の位置に移っても、c のハッシュで見つかる
+    assert index.search(0b0111, max_distance=0, limit=5) == [("c", 0)]
+    assert index.search(0b0011, max_distance=0, limit=5) == [("b", 0)]
+    assert index.search(0b0001, max_distance=0, limit=5) == []
+
+
+def test_remove_last_and_unknown_ids():
+    index = HammingIndex()
+    index.add("a", 1)
+    index.add("b", 2)
+
+    index.remove("b")
+    index.remove("missing")
+    index.remove("b")
+
+    assert len(index) == 1
+    assert index.search(1, max_distance=0, limit=5) == [("a", 0)]
+    index.remove("a")
+    assert index.search(1, max_distance=64, limit=5) == []
+
+
+def test_add_replaces_existing_id_and_grows():
+    index = HammingIndex(capacity=1)
+    for number in range(10):
+        index.add(str(number), number)
+    index.add("3", 2 ** 63)
+
+    assert len(index) == 10
+    assert index.search(2 ** 63, max_distance=0, limit=5) == [("3", 0)]
+    assert index.search(3, max_distance=0, limit=5) == []
+
+
+@pytest.fixture(params=["bitwise_count", "table"])
+def popcount(request, monkeypatch):
+    # NumPy 2.0未満（bitwise_count がない環境）の表引きでも同じ結果になる
+    if request.param == "table":
+        monkeypatch.setattr("duplicate_index._popcount", _popcount_bytes)
+    return request.param
+
+
+def test_popcount_table_matches_bit_count():
+    values = np.random.default_rng(0).integers(0, 2 ** 63, size=1000, dtype=np.uint64) * np.uint64(2)
+    values[:2] = [0, 2 ** 64 - 1]
+
+    assert _popcount_bytes(values).tolist() == [bin(int(value)).count("1") for value in values]
+
+
+def test_matches_brute_force_after_random_updates(popcount):
+    rng = random.Random(0)
+    index = HammingIndex(capacity=2)
+    entries = {}
+    for step in range(500):
+        item_id = str(rng.randrange(60))
+        if entries and rng.random() < 0.4:
+            index.remove(item_id)
+            entries.pop(item_id, None)
+        else:
+            value = rng.getrandbits(64)
+            index.add(item_id, value)
+            entries[item_id] = value
+
+    query = rng.getrandbits(64)
+    results = index.search(query, max_distance=64, limit=len(entries))
+    assert len(index) == len(entries)
+    assert sorted(results) == sorted(_brute_force(entries, query, 64, len(entries)))
+    # 件数の上限を指定した場合は距離の近いものから
+    limited = index.search(query, max_distance=64, limit=3)
+    assert [distance for _, distance in limited] == [distance for _, distance in results[:3]]
+
+
+def test_perceptual_hash_survives_jpeg_and_resize():
+    original = _document_image(0)
+    buffer = io.BytesIO()
+    original.convert("RGB").resize((480, 360)).save(buffer, format="JPEG", quality=40)
+    reencoded = Image.open(io.BytesIO(buffer.getvalue()))
+
+    assert hamming_distance(perceptual_hash(original), perceptual_hash(reencoded)) <= 6
+    assert hamming_distance(perceptual_hash(original), perceptual_hash(_document_image(1))) > 10
+
+
+@pytest.fixture
+def duplicates(tmp_path):
+    return ImageDuplicateIndex(str(tmp_path / "duplicates.db"))
+
+
+def test_index_updates_memory_on_add_and_remove(duplicates):
+    for number in range(4):
+        duplicates.add(str(number), number << 8)
+    assert duplicates.find(0, max_distance=0) == [("0", 0)]
+
+    duplicates.remove_many(["0", "1", "missing"])
+
+    assert duplicates.count() == 2
+    assert duplicates.find(0, max_distance=0) == []
+    assert duplicates.find(3 << 8, max_distance=0) == [("3", 0)]
+
+
+def test_index_follows_history_trim(monkeypatch):
+    from history_store import get_history_store
+    from utils import save_to_history
+
+    monkeypatch.setattr(get_history_store(), "max_items", 2)
+    for seed in range(4):
+        buffer = io.BytesIO()
+        _document_image(seed).save(buffer, format="PNG")
+        assert save_to_history(f"scan{seed}.png", buffer.getvalue(), "text", 0.9)
+
+    assert get_duplicate_index().count() == get_history_store().count() == 2
+
+
+def test_index_reloads_after_update_from_another_connection(tmp_path):
+    first = ImageDuplicateIndex(str(tmp_path / "duplicates.db"))
+    second = ImageDuplicateIndex(str(tmp_path / "duplicates.db"))
+    first.add("a", 1)
+    assert second.find(1, max_distance=0) == [("a", 0)]
+
+    first.remove("a")
+    first.add("b", 2)
+
+    assert second.find(1, max_distance=0) == []
+    assert second.find(2, max_distance=0) == [("b", 0)]
@@ -0,0 +1,215 @@
+"""履歴ストアのテスト"""
+import importlib
+import io
+import json
+import threading
+
+import pytest
+
+import config
+from blob_store import BlobStore, hash_bytes
+from history_store import JournalHistoryStore, JSONHistoryStore, SQLiteHistoryStore
+
+
+def _item(item_id: str, timestamp: str = "2024-01-01T00:00:00"):
+    return {"id": item_id, "timestamp": timestamp, "image_name": f"{item_id}.png",
+            "ocr_result": f"text {item_id}", "confidence": 0.9}
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"))
+
+
+def test_json_store_keeps_all_concurrent_writes(tmp_path, blobs):
+    history_file = str(tmp_path / "history.json")
+    # セッションごとに別のインスタンスから書き込んでも、追加が失われない
+    stores = [JSONHistoryStore(history_file, max_items=1000, blob_store=blobs) for _ in range(4)]
+
+    def add_items(store, worker):
+        for number in range(25):
+            store.add(_item(f"{worker}-{number}", f"2024-01-01T00:{number:02d}:00"))
+
+    threads = [threading.Thread(target=add_items, args=(store, worker)) for worker, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(history_file, encoding="utf-8") as f:
+        assert len(json.load(f)) == 100
+    assert stores[0].count() == 100
+    assert not list(tmp_path.glob("history.json.*.tmp"))
+
+
+def test_json_store_sees_writes_from_other_instances(tmp_path, blobs):
+    history_file = str(tmp_path / "history.json")
+    reader = JSONHistoryStore(history_file, blob_store=blobs)
+    writer = JSONHistoryStore(history_file, blob_store=blobs)
+    assert reader.count() == 0
+
+    writer.add(_item("a"))
+    assert [item["id"] for item in reader.load_all()] == ["a"]
+
+    writer.delete("a")
+    assert reader.count() == 0
+
+
+def test_json_store_results_do_not_share_cached_items(tmp_path, blobs):
+    store = JSONHistoryStore(str(tmp_path / "history.json"), blob_store=blobs)
+    store.add(_item("a"))
+
+    store.load_all()[0]["ocr_result"] = "changed"
+    store.load_page(include_images=False)[0]["ocr_result"] = "changed"
+
+    assert store.load_all()[0]["ocr_result"] == "text a"
+
+
+def test_journal_appends_tombstones_and_compacts(tmp_path, blobs):
+    journal_file = tmp_path / "history.jsonl"
+    store = JournalHistoryStore(str(journal_file), max_items=3, blob_store=blobs, compact_ratio=3)
+    for number in range(4):
+        store.add(_item(str(number), f"2024-01-0{number + 1}T00:00:00"))
+    store.delete("2")
+
+    assert len(journal_file.read_bytes().splitlines()) == 5
+    assert [item["id"] for item in store.load_all()] == ["0", "1", "3"]
+
+    store.compact()
+
+    lines = journal_file.read_bytes().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["0", "1", "3"]
+    assert store.count() == 3
+
+
+def test_journal_compacts_automatically_at_ratio(tmp_path, blobs):
+    journal_file = tmp_path / "history.jsonl"
+    store = JournalHistoryStore(str(journal_file), max_items=2, blob_store=blobs, compact_ratio=2)
+    for number in range(4):
+        store.add(_item(str(number), f"2024-01-0{number + 1}T00:00:00"))
+
+    assert len(journal_file.read_bytes().splitlines()) == 2
+    assert [item["id"] for item in store.load_all()] == ["2", "3"]
+
+
+def test_journal_reader_follows_appends_and_compaction(tmp_path, blobs):
+    journal_file = str(tmp_path / "history.jsonl")
+    reader = JournalHistoryStore(journal_file, max_items=10, blob_store=blobs)
+    writer = JournalHistoryStore(journal_file, max_items=10, blob_store=blobs)
+    writer.add(_item("a"))
+    assert reader.count() == 1
+
+    writer.add(_item("b", "2024-01-02T00:00:00"))
+    writer.delete("a")
+    writer.compact()
+    writer.add(_item("c", "2024-01-03T00:00:00"))
+
+    assert [item["id"] for item in reader.load_all()] == ["b", "c"]
+
+
+def test_journal_skips_broken_and_partial_lines(tmp_path, blobs, caplog):
+    journal_file = tmp_path / "history.jsonl"
+    journal_file.write_bytes(
+        json.dumps(_item("a")).encode() + b"\n{broken\n" + json.dumps(_item("b")).encode()[:10]
+    )
+    store = JournalHistoryStore(str(journal_file), blob_store=blobs)
+
+    assert [item["id"] for item in store.load_all()] == ["a"]
+    assert any("{broken" in record.getMessage() for record in caplog.records if record.name == "history_store")
+
+    # 途中で途切れた行には連結せずに追記する
+    store.add(_item("c", "2024-01-02T00:00:00"))
+    assert [item["id"] for item in store.load_all()] == ["a", "c"]
+
+
+def test_sqlite_store_imports_legacy_json_once(tmp_path, blobs):
+    history_file = str(tmp_path / "history.json")
+    legacy = JSONHistoryStore(history_file, blob_store=blobs)
+    legacy.add(_item("a"), image=b"image")
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"), blob_store=blobs)
+
+    store.import_legacy(history_file)
+    assert [item["id"] for item in store.load_all()] == ["a"]
+    assert store.load_image("a") == b"image"
+
+    # 全削除後に古いJSONファイルの履歴が再び取り込まれない
+    store.clear()
+    store.import_legacy(history_file)
+    assert store.count() == 0
+
+
+def test_sqlite_is_default_backend(monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.delenv("HISTORY_BACKEND")
+        assert importlib.reload(config).HISTORY_BACKEND == "sqlite"
+    importlib.reload(config)
+
+
+@pytest.fixture(params=["sqlite", "jsonl", "json"])
+def store(request, tmp_path, blobs):
+    if request.param == "sqlite":
+        return SQLiteHistoryStore(str(tmp_path / "history.db"), blob_store=blobs)
+    if request.param == "jsonl":
+        return JournalHistoryStore(str(tmp_path / "history.jsonl"), blob_store=blobs)
+    return JSONHistoryStore(str(tmp_path / "history.json"), blob_store=blobs)
+
+
+@pytest.mark.parametrize("newest_first", [True, False])
+def test_pages_after_cursor_match_offset_pages(store, newest_first):
+    # 同じ時刻の項目を含めて、前のページの最後の項目から読んだページが番号指定と一致する
+    store.import_items([_item(f"{number:02d}", f"2024-01-01T00:00:{number // 3:02d}") for number in range(25)])
+
+    pages, after = [], None
+    while True:
+        page = store.load_page(0, 4, newest_first, include_images=False, after=after)
+        if not page:
+            break
+        pages.append([item["id"] for item in page])
+        after = page[-1]
+
+    expected = [[item["id"] for item in store.load_page(offset, 4, newest_first, include_images=False)]
+                for offset in range(0, 25, 4)]
+    assert pages == expected
+    # afterからの相対位置で読み飛ばせる（2ページ目の次の次 = 4ページ目）
+    second = store.load_page(4, 4, newest_first, include_images=False)
+    assert [item["id"] for item in store.load_page(4, 4, newest_first, include_images=False,
+                                                   after=second[-1])] == expected[3]
+
+
+def test_cursor_item_deleted_skips_its_timestamp(store):
+    store.import_items([_item(f"{number}", f"2024-01-0{number + 1}T00:00:00") for number in range(5)])
+    first = store.load_page(0, 2, include_images=False)
+    store.delete(first[-1]["id"])
+
+    page = store.load_page(0, 2, include_images=False, after=first[-1])
+
+    assert [item["id"] for item in page] == ["2", "1"]
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "jsonl", "json"])
+def test_thumbnails_are_removed_with_their_images(monkeypatch, backend):
+    from fixtures import make_document_image
+    from history_store import get_history_store
+    from thumbnails import get_thumbnail_cache
+    from utils import delete_history_item, save_to_history
+
+    monkeypatch.setattr("history_store.HISTORY_BACKEND", backend)
+    monkeypatch.setattr(get_history_store(), "max_items", 2)
+    images = []
+    for seed in range(3):
+        buffer = io.BytesIO()
+        make_document_image(320, 240, seed=seed).save(buffer, format="PNG")
+        images.append(buffer.getvalue())
+        assert save_to_history(f"scan{seed}.png", images[-1], "text", 0.9, item_id=str(seed))
+    store = get_history_store()
+    if isinstance(store, JournalHistoryStore):
+        store.compact()
+    hashes = [hash_bytes(image) for image in images]
+
+    # 上限を超えて削除された項目と、削除した項目のサムネイルが消える
+    assert get_thumbnail_cache().get(hashes[0]) is None
+    delete_history_item("1")
+    if isinstance(store, JournalHistoryStore):
+        store.compact()
+    assert get_thumbnail_cache().get(hashes[1]) is None
+    assert get_thumbnail_cache().get(hashes[2]) is not None
@@ -0,0 +1,63 @@
+"""ホーム画面のOCR結果の保持のテスト（StreamlitのAppTestで画面を実行し、Gemini APIの代わりに fake_gemini を使用）"""
+import io
+import os
+
+import pytest
+from streamlit.testing.v1 import AppTest, element_tree
+
+from fixtures import make_document_image
+
+pytestmark = pytest.mark.skipif(not hasattr(element_tree, "FileUploader"),
+                                reason="このバージョンのStreamlitのAppTestはファイルのアップロードに対応していない")
+
+MAIN_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def _button(app: AppTest, label: str):
+    return next(button for button in app.button if button.label.startswith(label))
+
+
+def _checkbox(app: AppTest, label: str):
+    return next(checkbox for checkbox in app.checkbox if checkbox.label.startswith(label))
+
+
+@pytest.fixture
+def home(monkeypatch, fake_model):
+    # メニュー（カスタムコンポーネント）はAppTestで操作できないため、ホームを選んだものとする
+    monkeypatch.setattr("streamlit_option_menu.option_menu", lambda *args, **kwargs: "🏠 ホーム")
+    buffer = io.BytesIO()
+    make_document_image(640, 480, seed=0).save(buffer, format="PNG")
+    app = AppTest.from_file(MAIN_FILE, default_timeout=60).run()
+    app.file_uploader[0].set_value(("scan.png", buffer.getvalue(), "image/png")).run()
+    _button(app, "🚀 文字起こし開始").click().run()
+    assert not app.exception
+    return app
+
+
+def test_result_survives_reruns_without_calling_api(home, fake_model):
+    calls = fake_model.calls
+    result = home.text_area[0].value
+
+    # 結果と関係のない操作で画面が再実行されても、保持した結果を表示する
+    _checkbox(home, "🔬 処理時間の内訳を表示").check().run()
+
+    assert calls == 1
+    assert fake_model.calls == calls
+    assert home.text_area[0].value == result
+
+
+def test_results_are_kept_per_setting(home, fake_model):
+    _checkbox(home, "📊 テーブル認識").check().run()
+    assert not home.text_area
+
+    _checkbox(home, "📊 テーブル認識").uncheck().run()
+    assert home.text_area
+    assert fake_model.calls == 1
+
+
+def test_reprocess_calls_api_again_without_cache(home, fake_model):
+    _button(home, "🔄 再処理").click().run()
+
+    assert not home.exception
+    assert fake_model.calls == 2
+    assert home.text_area
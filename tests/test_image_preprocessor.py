@@ -0,0 +1,61 @@
+"""画像前処理のテスト"""
+import io
+
+from PIL import Image
+
+from fixtures import make_document_image
+from image_preprocessor import ImagePreprocessor
+
+
+def _encode(image: Image.Image, image_format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def test_small_image_is_sent_as_is():
+    data = _encode(make_document_image(640, 480, seed=0), "PNG")
+
+    blob, stats = ImagePreprocessor(max_side=2048).process(Image.open(io.BytesIO(data)), data)
+
+    assert stats["passthrough"]
+    assert blob == {"mime_type": "image/png", "data": data}
+
+
+def test_large_image_is_shrunk_and_reencoded_as_jpeg_by_default():
+    data = _encode(make_document_image(3000, 2000, seed=0), "PNG")
+
+    blob, stats = ImagePreprocessor(max_side=1500).process(Image.open(io.BytesIO(data)), data)
+
+    assert not stats["passthrough"]
+    assert blob["mime_type"] == "image/jpeg"
+    assert stats["processed_size"] == (1500, 1000)
+    assert Image.open(io.BytesIO(blob["data"])).size == (1500, 1000)
+    assert stats["bytes_after"] < stats["bytes_before"]
+
+
+def test_dpi_limit_shrinks_high_resolution_scans():
+    image = make_document_image(1200, 800, seed=0)
+    data = _encode(image, "PNG", dpi=(600, 600))
+
+    _, stats = ImagePreprocessor(max_side=4096, max_dpi=300).process(Image.open(io.BytesIO(data)), data)
+
+    assert stats["processed_size"] == (600, 400)
+
+
+def test_exif_and_transparency_are_not_passed_through():
+    rgba = make_document_image(320, 240, seed=0).convert("RGBA")
+    rgba.putalpha(0)
+    transparent = _encode(rgba, "PNG")
+    exif = Image.Exif()
+    exif[0x010F] = "camera"
+    with_exif = _encode(make_document_image(320, 240, seed=0).convert("RGB"), "JPEG", exif=exif)
+
+    blob, stats = ImagePreprocessor().process(Image.open(io.BytesIO(transparent)), transparent)
+    # 透過部分は白背景に合成する
+    assert not stats["passthrough"]
+    assert Image.open(io.BytesIO(blob["data"])).convert("L").getextrema() == (255, 255)
+
+    blob, stats = ImagePreprocessor().process(Image.open(io.BytesIO(with_exif)), with_exif)
+    assert not stats["passthrough"]
+    assert not Image.open(io.BytesIO(blob["data"])).getexif()
@@ -0,0 +1,163 @@
+"""バックグラウンドジョブのキューのテスト（Gemini APIの代わりに benchmarks/fake_gemini.py を使用）"""
+import io
+import sqlite3
+import threading
+
+import pytest
+from starlette.testclient import TestClient
+
+from fixtures import make_document_image
+from history_store import get_history_store
+from job_queue import JobQueue, execute_job
+
+
+def _png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    make_document_image(640, 480, seed=1).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), lease_seconds=-1, max_attempts=3)
+
+
+def test_claim_is_exclusive_and_expired_lease_is_reclaimed(queue):
+    job_id = queue.submit("scan.png", b"data", "gemini-2.0-flash", "japanese")
+
+    first = queue.claim()
+    assert first["id"] == job_id and first["attempts"] == 1
+    # リース期限（lease_seconds=-1）が切れているため、別のワーカーが再取得できる
+    second = queue.claim()
+    assert second["id"] == job_id and second["attempts"] == 2
+
+
+def test_concurrent_claims_take_each_job_once(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    job_ids = queue.submit_many([(f"{number}.png", b"data") for number in range(40)],
+                                "gemini-2.0-flash", "japanese")
+    claimed = []
+
+    def worker():
+        # スレッドごとに別の接続から取得する
+        while True:
+            job = queue.claim()
+            if job is None:
+                return
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == sorted(job_ids)
+
+
+def test_job_fails_after_max_attempts(queue):
+    job_id = queue.submit("scan.png", b"data", "gemini-2.0-flash", "japanese")
+    for _ in range(3):
+        assert queue.claim()["id"] == job_id
+
+    assert queue.claim() is None
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_exceptions_count_as_attempts_until_max(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), max_attempts=3)
+    job_id = queue.submit("scan.png", b"data", "gemini-2.0-flash", "japanese")
+
+    for attempt in (1, 2):
+        job = queue.claim()
+        assert job["attempts"] == attempt
+        assert queue.fail_attempt(job_id, job["attempts"], f"error {attempt}")
+        assert queue.get(job_id)["status"] == "queued"
+        assert queue.get(job_id)["error"] == f"error {attempt}"
+
+    job = queue.claim()
+    assert not queue.fail_attempt(job_id, job["attempts"], "error 3")
+    assert queue.get(job_id)["status"] == "failed"
+    assert queue.claim() is None
+
+
+def test_stale_attempt_does_not_touch_reclaimed_job(queue):
+    job_id = queue.submit("scan.png", b"data", "gemini-2.0-flash", "japanese")
+    first = queue.claim()
+    # リース切れで別のワーカーが再取得した後に、最初の実行が例外で終わった
+    queue.claim()
+
+    assert not queue.fail_attempt(job_id, first["attempts"], "late error")
+    assert queue.get(job_id)["status"] == "running"
+    assert queue.get(job_id)["error"] is None
+
+
+def test_retry_clears_previous_result(queue):
+    job_id = queue.submit("scan.png", b"data", "gemini-2.0-flash", "japanese")
+    queue.claim()
+    queue.complete(job_id, "text", 0.9, cache_hit=True, history_id=job_id)
+    with sqlite3.connect(queue.db_file) as conn:
+        conn.execute("UPDATE jobs SET status = 'failed', error = 'boom' WHERE id = ?", (job_id,))
+
+    assert queue.retry(job_id)
+
+    job = queue.get(job_id)
+    assert job["status"] == "queued" and job["attempts"] == 0
+    assert (job["ocr_result"], job["confidence"], job["cache_hit"], job["history_id"], job["error"]) == \
+        (None, None, False, None, None)
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "jsonl", "json"])
+def test_reclaimed_job_does_not_duplicate_history(queue, fake_model, monkeypatch, backend):
+    monkeypatch.setattr("history_store.HISTORY_BACKEND", backend)
+    job_id = queue.submit("scan.png", _png_bytes(), "gemini-2.0-flash", "japanese")
+
+    # 1回目の実行は履歴を保存した後、完了を記録する前に中断したものとする
+    first = queue.claim()
+    execute_job(queue, first)
+    with sqlite3.connect(queue.db_file) as conn:
+        conn.execute("UPDATE jobs SET status = 'running', lease_until = 0 WHERE id = ?", (job_id,))
+
+    execute_job(queue, queue.claim())
+
+    store = get_history_store()
+    assert store.count() == 1
+    assert [item["id"] for item in store.load_all()] == [job_id]
+    assert queue.get(job_id)["status"] == "done"
+    assert queue.get(job_id)["history_id"] == job_id
+
+
+def test_cancelled_job_result_is_discarded(queue, fake_model):
+    job_id = queue.submit("scan.png", _png_bytes(), "gemini-2.0-flash", "japanese")
+    job = queue.claim()
+    queue.cancel(job_id)
+
+    execute_job(queue, job)
+
+    assert queue.get(job_id)["status"] == "cancelled"
+    assert get_history_store().count() == 0
+
+
+def test_job_routes_report_store_errors_as_json(monkeypatch):
+    from api.ocr import app
+
+    class LockedQueue:
+        def __getattr__(self, name):
+            def locked(*args, **kwargs):
+                raise sqlite3.OperationalError("database is locked")
+            return locked
+
+    monkeypatch.setattr("api.ocr.get_job_queue", lambda: LockedQueue())
+    client = TestClient(app)
+    image = {"file": ("scan.png", _png_bytes(), "image/png")}
+
+    responses = [
+        client.post("/api/jobs", files=image),
+        client.get("/api/jobs"),
+        client.get("/api/jobs/unknown"),
+        client.delete("/api/jobs/unknown"),
+    ]
+
+    for response in responses:
+        assert response.status_code == 500
+        assert "database is locked" in response.json()["error"]
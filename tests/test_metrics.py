@@ -0,0 +1,37 @@
+"""メトリクスのテスト"""
+import pytest
+
+from metrics import Counter, Histogram, _Metric
+
+
+def test_incomplete_metric_fails_at_construction():
+    class Incomplete(_Metric):
+        type_name = "counter"
+
+    with pytest.raises(TypeError):
+        Incomplete("test_incomplete_total", "テスト")
+
+
+def test_counter_renders_labels():
+    counter = Counter("test_requests_total", "テスト", ("status",))
+    counter.inc(status="ok")
+    counter.inc(2, status='a"b')
+
+    lines = counter.render().splitlines()
+
+    assert lines[:2] == ["# HELP test_requests_total テスト", "# TYPE test_requests_total counter"]
+    assert 'test_requests_total{status="ok"} 1' in lines
+    assert 'test_requests_total{status="a\\"b"} 2' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "テスト", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    lines = histogram.render().splitlines()
+
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_seconds_count 3" in lines
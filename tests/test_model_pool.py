@@ -0,0 +1,66 @@
+"""Geminiモデルのプールのテスト（実際のAPIには接続しない）"""
+import threading
+
+import pytest
+
+import model_pool
+from model_pool import get_model, warm_up, warm_up_in_background
+
+
+@pytest.fixture
+def sdk(monkeypatch):
+    """SDKのAPIキー設定とクライアント生成の呼び出し回数を数える"""
+    import google.generativeai as genai
+    from google.generativeai import client as genai_client
+
+    calls = {"configure": 0, "client": 0}
+
+    def configure(**kwargs):
+        calls["configure"] += 1
+
+    def get_default_generative_client():
+        calls["client"] += 1
+        return object()
+
+    monkeypatch.setattr(model_pool, "_configured", False)
+    monkeypatch.setattr(genai, "configure", configure)
+    monkeypatch.setattr(genai_client, "get_default_generative_client", get_default_generative_client)
+    return calls
+
+
+def test_models_are_created_once_and_shared(sdk):
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(get_model("gemini-2.0-flash"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(model) for model in models}) == 1
+    assert get_model("gemini-2.0-flash") is models[0]
+    assert get_model("gemini-1.5-pro") is not models[0]
+    assert sdk["configure"] == 1
+
+
+def test_warm_up_creates_models_and_the_shared_client(sdk):
+    warm_up(["gemini-2.0-flash", "gemini-1.5-pro"])
+
+    assert set(model_pool._models) == {"gemini-2.0-flash", "gemini-1.5-pro"}
+    assert sdk["client"] == 1
+
+
+def test_warm_up_skips_client_for_registered_models(sdk, fake_model):
+    warm_up()
+
+    assert sdk["client"] == 0
+
+
+def test_warm_up_in_background_logs_failures(monkeypatch, caplog):
+    def fail(model_name):
+        raise ValueError("Gemini APIキーが設定されていません")
+
+    monkeypatch.setattr(model_pool, "get_model", fail)
+
+    warm_up_in_background(["gemini-2.0-flash"]).join()
+
+    assert any("APIキー" in record.getMessage() for record in caplog.records if record.name == "model_pool")
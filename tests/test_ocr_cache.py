@@ -0,0 +1,105 @@
+"""OCR結果キャッシュのテスト（Gemini APIの代わりに benchmarks/fake_gemini.py を使用）"""
+import io
+
+import pytest
+
+import ocr_cache
+from fixtures import make_document_image
+from ocr_cache import DiskCacheBackend, MemoryCacheBackend, OCRCache, make_cache_key
+from ocr_processor import OCRProcessor
+
+
+@pytest.fixture(params=["memory", "disk"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCacheBackend()
+    return DiskCacheBackend(str(tmp_path / "cache"))
+
+
+def _png(seed: int = 0) -> bytes:
+    buffer = io.BytesIO()
+    make_document_image(800, 600, seed=seed).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_cache_key_depends_on_image_and_options():
+    key = make_cache_key(b"image", "model", "日本語", True, False)
+
+    assert key == make_cache_key(b"image", "model", "日本語", True, False)
+    assert key != make_cache_key(b"other", "model", "日本語", True, False)
+    assert key != make_cache_key(b"image", "model", "英語", True, False)
+    assert key != make_cache_key(b"image", "model", "日本語", True, False, variant="tiled")
+
+
+def test_hit_miss_and_structured_entry(backend):
+    cache = OCRCache(backend, max_items=10, ttl=0)
+
+    assert cache.get("a") is None
+    cache.set("a", "text", 0.9, structured={"blocks": []})
+
+    assert cache.get("a") == ("text", 0.9)
+    assert cache.get_entry("a")["structured"] == {"blocks": []}
+    assert cache.stats() == {"hits": 2, "misses": 1, "entries": 1, "hit_rate": 2 / 3}
+
+
+def test_evicts_least_recently_used(backend):
+    cache = OCRCache(backend, max_items=2, ttl=0)
+    cache.set("a", "a", 0.9)
+    cache.set("b", "b", 0.9)
+    cache.get("a")
+
+    cache.set("c", "c", 0.9)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == ("a", 0.9)
+    assert cache.get("c") == ("c", 0.9)
+    assert backend.read("b") is None
+
+
+def test_expired_entries_are_removed(backend, monkeypatch):
+    cache = OCRCache(backend, max_items=10, ttl=60)
+    cache.set("a", "a", 0.9)
+
+    now = ocr_cache.time.time()
+    monkeypatch.setattr(ocr_cache.time, "time", lambda: now + 61)
+
+    assert cache.get("a") is None
+    assert backend.read("a") is None
+
+
+def test_disk_cache_index_survives_restart(tmp_path):
+    OCRCache(DiskCacheBackend(str(tmp_path / "cache")), ttl=0).set("a", "text", 0.5)
+
+    reopened = OCRCache(DiskCacheBackend(str(tmp_path / "cache")), ttl=0)
+
+    assert reopened.get("a") == ("text", 0.5)
+
+
+def test_processor_skips_api_call_on_cache_hit(fake_model):
+    processor = OCRProcessor()
+    image = _png()
+
+    first = processor.process_image_bytes(image)
+    calls = fake_model.calls
+    second = processor.process_image_bytes(image)
+
+    assert calls >= 1
+    assert second == first
+    assert processor.last_run_info["cache_hit"]
+    assert fake_model.calls == calls
+
+    processor.process_image_bytes(_png(seed=1))
+    assert fake_model.calls > calls
+
+
+def test_write_failure_is_logged_and_not_indexed(backend, monkeypatch, caplog):
+    cache = OCRCache(backend, max_items=10, ttl=0)
+
+    def fail(key, entry):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(backend, "write", fail)
+    cache.set("a", "text", 0.9)
+
+    assert cache.get("a") is None
+    assert any("disk full" in record.getMessage() for record in caplog.records if record.name == "ocr_cache")
@@ -0,0 +1,81 @@
+"""OCRプロンプトのレジストリのテスト"""
+import pytest
+
+import model_pool
+import prompts
+from fake_gemini import FakeCountTokensResponse
+from prompts import count_prompt_tokens, describe_prompts, estimate_tokens, get_prompt, get_prompt_variant
+
+
+@pytest.fixture(autouse=True)
+def _clear_token_counts():
+    # トークン数はモデルごとにキャッシュされるため、テストごとに数え直す
+    count_prompt_tokens.cache_clear()
+    yield
+    count_prompt_tokens.cache_clear()
+
+
+def test_prompt_is_compiled_once_per_option():
+    prompt = get_prompt("japanese", False, "gemini-2.0-flash", "standard")
+
+    assert get_prompt("japanese", False, "gemini-2.0-flash", "standard") is prompt
+    assert "言語: japanese" in prompt and "{" not in prompt
+    assert "テーブル構造" not in prompt
+    assert "テーブル構造" in get_prompt("japanese", True, "gemini-2.0-flash", "standard")
+
+
+def test_variants_keep_confidence_marker_and_compact_is_shorter():
+    standard = get_prompt("japanese", True, "gemini-2.0-flash", "standard")
+    compact = get_prompt("japanese", True, "gemini-2.0-flash", "compact")
+
+    assert "[信頼度: 高/中/低]" in standard and "[信頼度: 高/中/低]" in compact
+    assert estimate_tokens(compact) < estimate_tokens(standard)
+
+
+def test_variant_follows_engine_setting(monkeypatch):
+    monkeypatch.setitem(prompts.MODEL_PROMPT_VARIANTS, "gemini-2.0-flash", "compact")
+
+    assert get_prompt_variant("gemini-2.0-flash") == "compact"
+    assert get_prompt("japanese", False, "gemini-2.0-flash") is \
+        get_prompt("japanese", False, "gemini-2.0-flash", "compact")
+
+
+def test_unknown_variant_is_rejected():
+    with pytest.raises(ValueError, match="サポートされていないプロンプト"):
+        get_prompt("japanese", False, "gemini-2.0-flash", "missing")
+
+
+def test_estimate_tokens_counts_ascii_by_four():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("日本語abc") == 4
+
+
+class _CountingModel:
+    def __init__(self, total_tokens=None):
+        self.total_tokens = total_tokens
+
+    def count_tokens(self, contents):
+        if self.total_tokens is None:
+            raise RuntimeError("quota")
+        return FakeCountTokensResponse(self.total_tokens)
+
+
+def test_token_count_uses_model_and_falls_back_to_estimate(caplog):
+    prompt = get_prompt("japanese", False, "gemini-2.0-flash", "standard")
+    model_pool.register_model("gemini-2.0-flash", _CountingModel(total_tokens=321))
+    assert count_prompt_tokens("standard", "japanese", False, "gemini-2.0-flash", use_api=True) == 321
+
+    model_pool.register_model("gemini-1.5-pro", _CountingModel())
+    assert count_prompt_tokens("standard", "japanese", False, "gemini-1.5-pro", use_api=True) == \
+        estimate_tokens(prompt)
+    assert any("quota" in record.getMessage() for record in caplog.records if record.name == "prompts")
+
+
+def test_describe_prompts_lists_every_variant_with_and_without_tables():
+    rows = describe_prompts("japanese", "gemini-2.0-flash")
+
+    assert [(row["variant"], row["table_recognition"]) for row in rows] == [
+        ("standard", False), ("standard", True), ("compact", False), ("compact", True)
+    ]
+    assert all(row["chars"] > 0 and row["tokens"] > 0 for row in rows)
@@ -0,0 +1,85 @@
+"""Gemini API呼び出しのリトライとレート制限のテスト"""
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import rate_limiter
+from rate_limiter import TokenBucket, call_with_retry, get_retry_after, is_retryable
+
+
+@pytest.fixture(autouse=True)
+def _reset_buckets(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "_buckets", {})
+
+
+def test_bucket_allows_burst_then_waits_for_refill():
+    bucket = TokenBucket(rate_per_minute=6000, burst=2)
+
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == 0.0
+    with pytest.raises(Exception, match="混雑"):
+        bucket.acquire(max_wait=0.0)
+    assert 0.0 < bucket.acquire(max_wait=1.0) < 0.5
+
+
+def test_pause_blocks_all_requests():
+    bucket = TokenBucket(rate_per_minute=6000, burst=5)
+    bucket.pause(60)
+
+    with pytest.raises(Exception, match="混雑"):
+        bucket.acquire(max_wait=1.0)
+
+
+def test_retryable_errors():
+    assert is_retryable(api_exceptions.TooManyRequests("quota"))
+    assert is_retryable(api_exceptions.ServiceUnavailable("busy"))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(api_exceptions.InvalidArgument("bad image"))
+    assert not is_retryable(ValueError("bug"))
+
+
+def test_retry_after_from_message():
+    assert get_retry_after(Exception("Please retry in 12.5s.")) == 12.5
+    assert get_retry_after(Exception("retry_delay { seconds: 34 }")) == 34
+    assert get_retry_after(Exception("quota")) is None
+
+
+def test_call_with_retry_recovers_from_transient_errors(caplog, capsys):
+    errors = [api_exceptions.TooManyRequests("quota"), api_exceptions.InternalServerError("oops")]
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    before = rate_limiter.get_retry_stats()
+    assert call_with_retry(call, "test-model", max_retries=3, base_delay=0.0) == "ok"
+    after = rate_limiter.get_retry_stats()
+    assert after["retries"] - before["retries"] == 2
+    assert after["rate_limited"] - before["rate_limited"] == 1
+    # 再試行は標準出力ではなくログに残す
+    assert [record.levelname for record in caplog.records if record.name == "rate_limiter"] == ["WARNING"] * 2
+    assert capsys.readouterr().out == ""
+
+
+def test_call_with_retry_gives_up():
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise api_exceptions.ServiceUnavailable("busy")
+
+    with pytest.raises(api_exceptions.ServiceUnavailable):
+        call_with_retry(call, "test-model", max_retries=2, base_delay=0.0)
+    assert len(calls) == 3
+
+
+def test_call_with_retry_does_not_retry_client_errors():
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise api_exceptions.InvalidArgument("bad image")
+
+    with pytest.raises(api_exceptions.InvalidArgument):
+        call_with_retry(call, "test-model", max_retries=3, base_delay=0.0)
+    assert len(calls) == 1
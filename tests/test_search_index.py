@@ -0,0 +1,99 @@
+"""履歴の全文検索インデックスのテスト"""
+import pytest
+
+from search_index import HistorySearchIndex, build_match_query, to_bigrams
+
+
+def _item(item_id: str, text: str, timestamp: str = "2024-01-01T00:00:00", name: str = "scan.png"):
+    return {"id": item_id, "timestamp": timestamp, "image_name": name, "ocr_result": text, "confidence": 0.9}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return HistorySearchIndex(str(tmp_path / "search.db"))
+
+
+def test_to_bigrams_adds_trailing_unigram_per_run():
+    assert to_bigrams("合計100円") == "合計 計1 10 00 0円 円"
+    assert to_bigrams("a b") == "a b"
+
+
+def test_single_character_matches_end_of_run(index):
+    index.add(_item("1", "価格は100円です"))
+    index.add(_item("2", "合計100円"))
+
+    total, hits = index.search("円")
+
+    assert total == 2
+    assert {hit["id"] for hit in hits} == {"1", "2"}
+
+
+def test_single_character_matches_single_character_run(index):
+    index.add(_item("1", "A 列"))
+    assert index.search("列")[0] == 1
+
+
+def test_phrase_does_not_match_across_runs(index):
+    index.add(_item("1", "ab bc"))
+    index.add(_item("2", "abc"))
+
+    total, hits = index.search("abc")
+
+    assert total == 1
+    assert hits[0]["id"] == "2"
+
+
+def test_query_is_normalized(index):
+    index.add(_item("1", "ＯＣＲ結果"))
+    assert index.search("ocr")[0] == 1
+    assert build_match_query("  ") is None
+
+
+def test_remove_many(index):
+    for number in range(3):
+        index.add(_item(str(number), f"文書{number}", timestamp=f"2024-01-0{number + 1}T00:00:00"))
+
+    index.remove_many(["0", "missing"])
+    index.remove("2")
+
+    assert index.count() == 1
+    assert [hit["id"] for hit in index.search("文書")[1]] == ["1"]
+
+
+@pytest.mark.parametrize("order", ["rank", "newest", "oldest"])
+def test_pages_after_cursor_match_offset_pages(index, order):
+    # 同じ時刻・同じ関連度の結果を含めて、前のページの最後の結果から読んだページが番号指定と一致する
+    for number in range(23):
+        text = "請求書 " * (number % 4 + 1) + f"明細{number}"
+        index.add(_item(f"{number:02d}", text, timestamp=f"2024-01-01T00:00:{number // 3:02d}"))
+
+    pages, after = [], None
+    while True:
+        total, hits = index.search("請求書", limit=5, order=order, after=after)
+        if not hits:
+            break
+        pages.append([hit["id"] for hit in hits])
+        after = hits[-1]
+
+    assert total == 23
+    assert pages == [[hit["id"] for hit in index.search("請求書", offset, 5, order)[1]]
+                     for offset in range(0, 23, 5)]
+
+
+def test_search_and_history_trim_stay_in_sync(monkeypatch):
+    from history_store import get_history_store
+    from utils import count_history, save_to_history, search_history
+
+    # 履歴ストアの上限だけを下げる（検索インデックスは履歴ストアが削除した項目を取り除く）
+    monkeypatch.setattr(get_history_store(), "max_items", 3)
+    for number in range(5):
+        assert save_to_history(f"scan{number}.png", b"", f"請求書 {number}", 0.9)
+
+    total, hits = search_history("請求書")
+    assert count_history() == total == 3
+
+
+def test_outdated_index_is_detected(index):
+    assert index.is_outdated()
+    index.rebuild([_item("1", "テスト")])
+    assert not index.is_outdated()
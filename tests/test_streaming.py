@@ -0,0 +1,53 @@
+"""ストリーミングOCRのテスト（Gemini APIの代わりに benchmarks/fake_gemini.py を使用）"""
+import io
+
+from PIL import Image
+
+from fixtures import make_document_image
+from ocr_processor import OCRProcessor
+
+
+def _png(seed: int = 0) -> bytes:
+    buffer = io.BytesIO()
+    make_document_image(800, 600, seed=seed).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_stream_yields_chunks_and_matches_full_result(fake_model):
+    image = _png()
+    streamed = OCRProcessor()
+
+    chunks = list(streamed.stream_image_bytes(image, use_cache=False, tiling=False))
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == fake_model.text
+    # 全文を受信した後の結果は、ストリーミングしない場合と同じ
+    assert streamed.last_run_info["result"] == OCRProcessor().process_image_bytes(image, use_cache=False,
+                                                                                  tiling=False)
+
+
+def test_streamed_result_is_cached(fake_model):
+    image = _png()
+    first = OCRProcessor()
+    list(first.stream_image_bytes(image, tiling=False))
+    calls = fake_model.calls
+
+    second = OCRProcessor()
+    chunks = list(second.stream_image_bytes(image, tiling=False))
+
+    assert fake_model.calls == calls
+    assert second.last_run_info["cache_hit"]
+    assert chunks == [first.last_run_info["result"][0]]
+    assert second.last_run_info["result"] == first.last_run_info["result"]
+
+
+def test_blank_page_is_not_sent(fake_model):
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 600), "white").save(buffer, format="PNG")
+    processor = OCRProcessor()
+
+    chunks = list(processor.stream_image_bytes(buffer.getvalue(), use_cache=False, tiling=False, precheck=True))
+
+    assert chunks == []
+    assert processor.last_run_info["result"] == ("", 0.0)
+    assert fake_model.calls == 0
@@ -0,0 +1,100 @@
+"""構造化出力（JSON）モードのテスト（Gemini APIの代わりに benchmarks/fake_gemini.py を使用）"""
+import io
+import json
+
+import pytest
+
+import model_pool
+from config import GEMINI_MODEL
+from document_processor import DocumentOCRProcessor, stitch_pages
+from fake_gemini import FakeGenerativeModel
+from fixtures import make_document_image
+from structured_ocr import merge_page_results, merge_tile_results, parse_structured_response
+
+RESPONSE = {
+    "language": "ja",
+    "blocks": [
+        {"type": "heading", "bbox": [50, 100, 120, 900], "confidence": 0.95,
+         "lines": [{"text": "請求書", "confidence": 0.95}]},
+        {"type": "paragraph", "bbox": [200, 100, 300, 900], "confidence": 0.6,
+         "lines": [{"text": "合計 13,200円", "confidence": 0.9}, {"text": "備考", "confidence": 0.3}]},
+        {"type": "table", "confidence": 0.8, "lines": [],
+         "cells": [["品目", "金額"], ["利用料", "12,000"]]},
+    ]
+}
+
+
+def _block(text: str, bbox, confidence: float = 0.9):
+    return {"type": "paragraph", "text": text, "confidence": confidence, "bbox": bbox,
+            "lines": [{"text": text, "confidence": confidence}], "cells": None}
+
+
+def test_parse_keeps_line_confidence_and_tables():
+    result = parse_structured_response(json.dumps(RESPONSE))
+
+    assert result["language"] == "ja"
+    assert [block["type"] for block in result["blocks"]] == ["heading", "paragraph", "table"]
+    assert [line["confidence"] for line in result["blocks"][1]["lines"]] == [0.9, 0.3]
+    assert result["blocks"][2]["text"].splitlines()[0] == "| 品目 | 金額 |"
+    assert 0.6 < result["confidence"] < 0.95
+
+
+def test_parse_rejects_non_object():
+    with pytest.raises(Exception):
+        parse_structured_response("[]")
+
+
+def test_tile_overlap_keeps_block_once():
+    # 横に2枚のタイル（幅1000の画像を0〜600と400〜1000に分割、重なりは400〜600）
+    left = {"row": 0, "col": 0, "box": (0, 0, 600, 1000)}
+    right = {"row": 0, "col": 1, "box": (400, 0, 1000, 1000)}
+    # 重なり部分（画像のx=450〜550）の同じ行が両方のタイルに現れる
+    left["structured"] = {"language": "ja", "blocks": [
+        _block("左の行", [100, 0, 150, 500]),
+        _block("重なりの行", [300, 750, 350, 917]),
+    ]}
+    right["structured"] = {"language": "ja", "blocks": [
+        _block("重なりの行", [300, 83, 350, 250]),
+        _block("右の行", [500, 500, 550, 1000]),
+    ]}
+
+    merged = merge_tile_results([right, left], (1000, 1000))
+
+    texts = [block["text"] for block in merged["blocks"]]
+    assert texts.count("重なりの行") == 1
+    assert set(texts) == {"左の行", "重なりの行", "右の行"}
+    # 位置は画像全体の座標（0〜1000）に変換される
+    left_block = next(block for block in merged["blocks"] if block["text"] == "左の行")
+    assert left_block["bbox"] == [100, 0, 150, 300]
+
+
+def test_merge_page_results_keeps_pages_and_line_confidence():
+    page = parse_structured_response(json.dumps(RESPONSE))
+    results = [
+        {"page": 2, "structured": page},
+        {"page": 1, "structured": page},
+        {"page": 3, "structured": None, "error": "失敗"},
+    ]
+
+    merged = merge_page_results(results)
+
+    assert [block["page"] for block in merged["blocks"]] == [1, 1, 1, 2, 2, 2]
+    assert merged["blocks"][1]["lines"][1]["confidence"] == 0.3
+    assert merged["language"] == "ja"
+
+
+def test_document_processor_returns_structured_pages(fake_model):
+    model_pool.register_model(GEMINI_MODEL, FakeGenerativeModel(latency=0.0, jitter=0.0,
+                                                                 text=json.dumps(RESPONSE)))
+    frames = [make_document_image(600, 800, seed=seed) for seed in range(3)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format="TIFF", save_all=True, append_images=frames[1:])
+
+    processor = DocumentOCRProcessor(GEMINI_MODEL, max_workers=2, structured=True)
+    results = list(processor.process(buffer.getvalue(), language_hint="japanese"))
+
+    assert all(result["error"] is None for result in results)
+    merged = merge_page_results(results)
+    assert sorted({block["page"] for block in merged["blocks"]}) == [1, 2, 3]
+    text, _ = stitch_pages(results)
+    assert text.count("請求書") == 3
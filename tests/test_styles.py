@@ -0,0 +1,15 @@
+"""画面のスタイルのテスト"""
+from styles import _build_style_html, get_style_html, minify_css
+
+
+def test_unknown_theme_uses_light_style_without_growing_cache():
+    _build_style_html.cache_clear()
+    for theme in ["light", "dark", "x" * 1000, "<script>", "dark"]:
+        get_style_html(theme)
+
+    assert get_style_html("<script>") == get_style_html("light") != get_style_html("dark")
+    assert _build_style_html.cache_info().currsize == 2
+
+
+def test_minify_css_keeps_selectors():
+    assert minify_css("/* c */ .a  .b {\n  color: red;\n}") == ".a .b{color:red;}"
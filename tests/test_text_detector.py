@@ -0,0 +1,88 @@
+"""白紙ページの事前判定のテスト"""
+import io
+import random
+
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+
+from fixtures import make_document_image
+from text_detector import detect_text
+
+
+def _photo(width: int = 1600, height: int = 1200, seed: int = 0) -> Image.Image:
+    """文字のない写真の代わり（空のグラデーション・ぼかした図形・センサーノイズ）"""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height))
+    draw = ImageDraw.Draw(image)
+    for y in range(height):
+        draw.line([(0, y), (width, y)], fill=(90 + y * 100 // height, 140 + y * 60 // height, 220))
+    for _ in range(40):
+        x, y = rng.randrange(width), rng.randrange(height // 2, height)
+        radius = rng.randint(20, 200)
+        color = (rng.randint(20, 120), rng.randint(80, 160), rng.randint(20, 90))
+        draw.ellipse([x - radius, y - radius, x + radius, y + radius], fill=color)
+    image = image.filter(ImageFilter.GaussianBlur(3))
+    noise = Image.effect_noise((width, height), 12).convert("RGB")
+    return Image.blend(image, noise, 0.1)
+
+
+def test_blank_page_is_skipped():
+    assert not detect_text(Image.new("RGB", (2480, 3508), (255, 255, 255)))["has_text"]
+
+
+def test_near_blank_scan_with_dust_is_skipped():
+    rng = random.Random(0)
+    page = Image.new("L", (2480, 3508), 250)
+    draw = ImageDraw.Draw(page)
+    for _ in range(200):
+        draw.point((rng.randrange(2480), rng.randrange(3508)), fill=rng.randint(150, 220))
+
+    result = detect_text(page)
+
+    assert not result["has_text"]
+    assert result["edge_pixels"] < 20
+
+
+def test_document_is_not_skipped():
+    assert detect_text(make_document_image(1240, 1754, seed=3))["has_text"]
+
+
+def test_photo_without_text_is_not_skipped():
+    # 輪郭の量だけで判定するため、文字のない写真は送られる（白紙だけを飛ばす）
+    result = detect_text(_photo())
+
+    assert result["has_text"]
+    assert result["edge_pixels"] > 20
+
+
+def test_single_short_line_on_large_page_is_not_skipped():
+    page = Image.new("L", (2480, 3508), 255)
+    ImageDraw.Draw(page).text((200, 200), "Total: 13,200", fill=0, font_size=48)
+    assert detect_text(page)["has_text"]
+
+
+
+def _transparent_png(mode: str) -> bytes:
+    """透過背景に黒い文字を描いたPNG（透過部分の色も黒）"""
+    if mode == "P":
+        image = Image.new("P", (1200, 800), 0)
+        image.putpalette([0, 0, 0] * 2)
+        fill, options = 1, {"transparency": 0}
+    else:
+        image = Image.new(mode, (1200, 800), (0,) * len(mode))
+        fill, options = (0,) * (len(mode) - 1) + (255,), {}
+    draw = ImageDraw.Draw(image)
+    for row in range(8):
+        draw.text((80, 80 + row * 80), f"Item {row + 1}: 1,200 JPY", fill=fill, font_size=40)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", **options)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "LA", "P"])
+def test_transparent_image_with_text_is_not_skipped(mode):
+    with Image.open(io.BytesIO(_transparent_png(mode))) as image:
+        result = detect_text(image)
+
+    assert result["has_text"]
+    assert result["edge_pixels"] > 100
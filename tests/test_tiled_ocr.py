@@ -0,0 +1,50 @@
+"""大きな画像のタイル分割OCRのテスト"""
+from tiled_ocr import merge_tile_texts, plan_tiles
+
+
+def _tile(row: int, col: int, text: str = "", error: str = ""):
+    return {"row": row, "col": col, "ocr_result": text, "error": error}
+
+
+def test_plan_tiles_covers_image_with_overlap():
+    scale, tiles = plan_tiles(5000, 3000, tile_size=1536, overlap=160, max_tiles=48)
+
+    assert scale == 1.0
+    assert max(tile["box"][2] for tile in tiles) == 5000
+    assert max(tile["box"][3] for tile in tiles) == 3000
+    row = sorted((tile for tile in tiles if tile["row"] == 0), key=lambda tile: tile["col"])
+    for left, right in zip(row, row[1:]):
+        assert left["box"][2] - right["box"][0] >= 160
+
+
+def test_plan_tiles_scales_down_to_tile_limit():
+    scale, tiles = plan_tiles(20000, 20000, tile_size=1000, overlap=100, max_tiles=16)
+
+    assert scale < 1.0
+    assert len(tiles) <= 16
+    assert all(tile["box"][2] - tile["box"][0] <= 1000 for tile in tiles)
+
+
+def test_merge_drops_lines_repeated_in_vertical_overlap():
+    text = merge_tile_texts([
+        _tile(0, 0, "第1条 目的\n本規約は利用条件を定める。"),
+        _tile(1, 0, "本規約は利用条件を定める。\n第2条 定義"),
+    ])
+    assert text == "第1条 目的\n本規約は利用条件を定める。\n第2条 定義"
+
+
+def test_merge_drops_lines_repeated_in_horizontal_overlap():
+    text = merge_tile_texts([
+        _tile(0, 1, "請求書番号 12345\n右側の列"),
+        _tile(0, 0, "請求書番号 12345\n左側の列"),
+    ])
+    assert text == "請求書番号 12345\n左側の列\n右側の列"
+
+
+def test_merge_keeps_short_lines_and_reports_failed_tiles():
+    text = merge_tile_texts([
+        _tile(0, 0, "1\n合計"),
+        _tile(0, 1, "1"),
+        _tile(1, 0, error="timeout"),
+    ])
+    assert text.splitlines() == ["1", "合計", "1", "[タイル 2-1 の読み取りに失敗しました: timeout]"]
@@ -0,0 +1,66 @@
+"""アップロードされたファイルの取り扱いのテスト"""
+import io
+
+import pytest
+from PIL import Image, features
+
+from blob_store import hash_bytes
+from fixtures import make_document_image
+from uploads import UploadedImage, detect_format
+from utils import validate_image_file
+
+
+def _encode(image_format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    make_document_image(64, 48, seed=0).convert("RGB").save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("image_format", [
+    "JPEG", "PNG", "GIF", "BMP", "TIFF", "PDF",
+    pytest.param("WEBP", marks=pytest.mark.skipif(not features.check("webp"), reason="PillowがWebPに非対応")),
+])
+def test_detect_format_from_leading_bytes(image_format):
+    data = _encode(image_format)
+
+    assert detect_format(data) == image_format
+    assert detect_format(memoryview(data)) == image_format
+
+
+def test_detect_format_rejects_unknown_bytes():
+    assert detect_format(b"") is None
+    assert detect_format(b"hello, world") is None
+    assert detect_format(b"RIFF\x00\x00\x00\x00WAVE") is None
+
+
+def test_upload_is_hashed_and_decoded_once(monkeypatch):
+    data = _encode("PNG")
+    upload = UploadedImage("scan.png", data)
+
+    assert upload.content_hash == hash_bytes(data)
+    assert (upload.format, upload.mime_type, upload.size) == ("PNG", "image/png", len(data))
+    opened = []
+    original_open = Image.open
+    monkeypatch.setattr("uploads.Image.open", lambda *args: opened.append(1) or original_open(*args))
+
+    assert upload.image is upload.image
+    assert upload.image.size == (64, 48)
+    assert len(opened) == 1
+
+
+def test_display_source_reuses_bytes_for_browser_formats():
+    png = UploadedImage("scan.png", _encode("PNG"))
+    tiff = UploadedImage("scan.tiff", _encode("TIFF"))
+
+    assert png.display_source is png.data
+    assert isinstance(tiff.display_source, Image.Image)
+    assert not tiff.is_multipage()
+
+
+def test_validation_checks_contents_not_only_extension():
+    assert validate_image_file(UploadedImage("scan.png", _encode("PNG")))[0]
+
+    valid, message = validate_image_file(UploadedImage("scan.png", b"not an image"))
+    assert not valid
+    assert "画像ファイルとして認識できません" in message
+    assert not validate_image_file(UploadedImage("notes.txt", _encode("PNG")))[0]
@@ -0,0 +1,114 @@
+"""
+文字の有無の事前判定
+縮小したグレースケール画像の輪郭（隣接画素の明るさの差）を数え、白紙・ほぼ白紙のページや
+単色の画像をGemini APIへ送る前に見分ける
+
+輪郭の画素数だけで判定するため、文字のない写真（風景・人物など）は輪郭が多く、文字ありとして送られる。
+飛ばすのは輪郭がほとんどない画像だけで、文字の形かどうかは判定しない
+"""
+import threading
+import time
+from typing import Dict
+
+import numpy as np
+from PIL import Image
+
+from config import (
+    TEXT_PRECHECK_EDGE_THRESHOLD,
+    TEXT_PRECHECK_MAX_SIDE,
+    TEXT_PRECHECK_MIN_EDGE_PIXELS,
+)
+from image_preprocessor import flatten_alpha
+from metrics import PRECHECKS
+
+# 事前判定の累計統計（設定ページ表示用）
+_stats_lock = threading.Lock()
+_total_stats = {
+    "checked": 0,
+    "skipped": 0,
+    "elapsed_ms": 0.0
+}
+
+
+def _record_stats(result: Dict):
+    with _stats_lock:
+        _total_stats["checked"] += 1
+        if not result["has_text"]:
+            _total_stats["skipped"] += 1
+        _total_stats["elapsed_ms"] += result["elapsed_ms"]
+    PRECHECKS.inc(result="text" if result["has_text"] else "no_text")
+
+
+def get_precheck_stats() -> Dict:
+    """事前判定の累計統計を取得"""
+    with _stats_lock:
+        return dict(_total_stats)
+
+
+def _to_gray_array(image: Image.Image, max_side: int) -> np.ndarray:
+    """
+    判定用に縮小したグレースケールの配列を作成（縮小は画素の平均なので細かなノイズは消える）
+
+    透過画像は送信時の前処理と同じく白背景に合成してから変換する（そのまま変換すると
+    透過部分が黒になり、黒い文字の輪郭が消える）
+    """
+    gray = flatten_alpha(image).convert("L")
+    factor = -(-max(gray.size) // max_side)
+    if factor > 1:
+        gray = gray.reduce(factor)
+    return np.asarray(gray, dtype=np.int16)
+
+
+def _count_edge_pixels(pixels: np.ndarray, threshold: int) -> int:
+    """
+    文字の線らしい輪郭の画素数を数える
+
+    上下左右で隣り合う画素との明るさの差がthreshold以上の画素を輪郭とし、そのうち
+    2つ以上の輪郭と隣接するもの（線としてつながっているもの）だけを数える。
+    孤立した点（ほこりやノイズ）は文字とみなさない。
+    """
+    edges = np.zeros(pixels.shape, dtype=bool)
+    edges[:, 1:] |= np.abs(np.diff(pixels, axis=1)) >= threshold
+    edges[1:, :] |= np.abs(np.diff(pixels, axis=0)) >= threshold
+
+    neighbors = np.zeros(pixels.shape, dtype=np.uint8)
+    neighbors[:, 1:] += edges[:, :-1]
+    neighbors[:, :-1] += edges[:, 1:]
+    neighbors[1:, :] += edges[:-1, :]
+    neighbors[:-1, :] += edges[1:, :]
+    return int(np.count_nonzero(edges & (neighbors >= 2)))
+
+
+def detect_text(image: Image.Image, min_edge_pixels: int = TEXT_PRECHECK_MIN_EDGE_PIXELS,
+                max_side: int = TEXT_PRECHECK_MAX_SIDE,
+                edge_threshold: int = TEXT_PRECHECK_EDGE_THRESHOLD) -> Dict:
+    """
+    画像が白紙・ほぼ白紙でないか（文字が含まれている可能性があるか）を判定
+
+    誤って文字のある画像を飛ばさないよう、判定は控えめにする（迷う場合は文字ありとする）。
+    文字のない写真も輪郭が多いため文字ありと判定される
+
+    Args:
+        image: PIL画像オブジェクト
+        min_edge_pixels: 文字ありとみなす輪郭の画素数の下限
+        max_side: 判定用に縮小する長辺のピクセル数
+        edge_threshold: 輪郭とみなす隣接画素の明るさの差
+
+    Returns:
+        Dict: has_text（白紙・ほぼ白紙でないか）・edge_pixels（輪郭の画素数）・
+              contrast（明るさの標準偏差）・elapsed_ms（判定時間）
+    """
+    started = time.perf_counter()
+    pixels = _to_gray_array(image, max_side)
+    contrast = float(pixels.std()) if pixels.size else 0.0
+    # 単色の画像は輪郭を数えるまでもない
+    edge_pixels = _count_edge_pixels(pixels, edge_threshold) if contrast >= 1.0 else 0
+
+    result = {
+        "has_text": edge_pixels >= min_edge_pixels,
+        "edge_pixels": edge_pixels,
+        "contrast": contrast,
+        "elapsed_ms": (time.perf_counter() - started) * 1000
+    }
+    _record_stats(result)
+    return result
@@ -0,0 +1,108 @@
+"""
+履歴ページ用サムネイル
+保存時に小さなWebP/JPEGを一度だけ生成してディスクにキャッシュする
+"""
+import io
+import logging
+import os
+import shutil
+import threading
+from typing import Callable, Optional
+
+from PIL import Image, features
+
+from config import THUMBNAIL_DIR, THUMBNAIL_FORMAT, THUMBNAIL_MAX_SIDE, THUMBNAIL_QUALITY
+
+logger = logging.getLogger(__name__)
+
+
+def _thumbnail_format() -> str:
+    """利用可能なサムネイル形式を取得（WebP非対応のPillowではJPEG）"""
+    if THUMBNAIL_FORMAT.upper() == "WEBP" and not features.check("webp"):
+        return "JPEG"
+    return THUMBNAIL_FORMAT.upper()
+
+
+def create_thumbnail(image_bytes: bytes, max_side: int = THUMBNAIL_MAX_SIDE) -> bytes:
+    """画像バイト列から長辺max_sideピクセルのサムネイルを生成"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # JPEGは縮小デコードで読み込み時間とメモリを削減
+        image.draft("RGB", (max_side, max_side))
+        image.thumbnail((max_side, max_side))
+        
+        thumbnail_format = _thumbnail_format()
+        if thumbnail_format == "JPEG" or image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        
+        buffered = io.BytesIO()
+        image.save(buffered, format=thumbnail_format, quality=THUMBNAIL_QUALITY)
+        return buffered.getvalue()
+
+
+class ThumbnailCache:
+    """サムネイルをキー（画像の内容ハッシュ）ごとのファイルとして保存するキャッシュ"""
+    
+    def __init__(self, cache_dir: str = THUMBNAIL_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{_thumbnail_format().lower()}")
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """サムネイルを取得（存在しない場合はNone）"""
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+    
+    def put(self, key: str, image_bytes: bytes) -> Optional[bytes]:
+        """画像からサムネイルを生成して保存"""
+        try:
+            thumbnail = create_thumbnail(image_bytes)
+        except Exception as e:
+            logger.warning("サムネイルの生成に失敗しました: %s", e)
+            return None
+        
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(thumbnail)
+        os.replace(tmp_path, path)
+        return thumbnail
+    
+    def get_or_create(self, key: str, load_image: Callable[[], Optional[bytes]]) -> Optional[bytes]:
+        """サムネイルを取得し、なければ元画像を読み込んで生成"""
+        thumbnail = self.get(key)
+        if thumbnail is None:
+            image_bytes = load_image()
+            if image_bytes:
+                thumbnail = self.put(key, image_bytes)
+        return thumbnail
+    
+    def remove(self, key: str):
+        """サムネイルを削除（存在しない場合は何もしない）"""
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+    
+    def clear(self):
+        """全サムネイルを削除"""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+
+_cache: Optional[ThumbnailCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """プロセス共通のサムネイルキャッシュを取得"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ThumbnailCache()
+    return _cache
@@ -0,0 +1,235 @@
+"""
+大きな画像のタイル分割OCR
+ポスター・図面・縦長のスクリーンショットなどを、文字が読める縮尺のまま重なりのあるタイルに分割し、
+タイルごとに並列でOCR処理した後、読み順に結合して重なり部分の重複を取り除く
+"""
+import contextvars
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from config import (
+    TILE_ENABLED,
+    TILE_MAX_TILES,
+    TILE_MAX_WORKERS,
+    TILE_OVERLAP,
+    TILE_SIZE,
+    TILE_TRIGGER_SIDE,
+)
+from metrics import stage
+from structured_ocr import merge_tile_results
+
+# 重なり部分で同じ行とみなす類似度と、比較する最大行数
+_DEDUPE_RATIO = 0.8
+_DEDUPE_MAX_LINES = 12
+_WHITESPACE = re.compile(r"\s+")
+
+
+def should_tile(image: Image.Image, trigger_side: int = TILE_TRIGGER_SIDE) -> bool:
+    """タイル分割して処理すべき大きさの画像か判定"""
+    return TILE_ENABLED and max(image.size) > trigger_side
+
+
+def _tile_starts(length: int, tile_size: int, overlap: int) -> List[int]:
+    """1辺に並べるタイルの開始位置（重なりがoverlap以上になるよう均等に配置）"""
+    if length <= tile_size:
+        return [0]
+    count = math.ceil((length - overlap) / (tile_size - overlap))
+    step = (length - tile_size) / (count - 1)
+    return [round(i * step) for i in range(count)]
+
+
+def plan_tiles(width: int, height: int, tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP,
+               max_tiles: int = TILE_MAX_TILES) -> Tuple[float, List[Dict]]:
+    """
+    タイルの配置を決める
+
+    タイル数がmax_tilesを超える場合は、収まるまで画像全体を縮小する
+
+    Returns:
+        Tuple[float, List[Dict]]: (縮小率, row・col・box（縮小後の座標）を含むタイルのリスト)
+    """
+    overlap = min(overlap, tile_size // 2)
+    scale = 1.0
+    while True:
+        scaled_width, scaled_height = max(1, round(width * scale)), max(1, round(height * scale))
+        xs = _tile_starts(scaled_width, tile_size, overlap)
+        ys = _tile_starts(scaled_height, tile_size, overlap)
+        if len(xs) * len(ys) <= max_tiles or scale < 0.05:
+            break
+        scale *= 0.9
+
+    tiles = []
+    for row, top in enumerate(ys):
+        for col, left in enumerate(xs):
+            tiles.append({
+                "row": row,
+                "col": col,
+                "box": (left, top, min(left + tile_size, scaled_width), min(top + tile_size, scaled_height))
+            })
+    return scale, tiles
+
+
+def _normalize(line: str) -> str:
+    return _WHITESPACE.sub("", line)
+
+
+def _same_line(a: str, b: str) -> bool:
+    a, b = _normalize(a), _normalize(b)
+    if not a or not b:
+        return a == b
+    return a == b or SequenceMatcher(None, a, b).ratio() >= _DEDUPE_RATIO
+
+
+def _drop_vertical_overlap(upper: List[str], lines: List[str]) -> List[str]:
+    """上のタイルの末尾と一致する先頭の行（縦方向の重なり部分）を取り除く"""
+    for count in range(min(len(upper), len(lines), _DEDUPE_MAX_LINES), 0, -1):
+        if all(_same_line(a, b) for a, b in zip(upper[-count:], lines[:count])):
+            return lines[count:]
+    return lines
+
+
+def _drop_horizontal_overlap(left: List[str], lines: List[str]) -> List[str]:
+    """左のタイルにも含まれる行（横方向の重なり部分に収まった行）を取り除く"""
+    candidates = [line for line in left if len(_normalize(line)) >= 4]
+    return [line for line in lines
+            if len(_normalize(line)) < 4 or not any(_same_line(line, other) for other in candidates)]
+
+
+def merge_tile_texts(results: List[Dict]) -> str:
+    """
+    タイルごとの文字列を読み順（上の行から、同じ行は左から）に結合し、重なり部分の重複を取り除く
+
+    Args:
+        results: row・col・ocr_result・error を含むタイルごとの結果
+    """
+    raw_lines: Dict[Tuple[int, int], List[str]] = {}
+    rows: Dict[int, List[str]] = {}
+    for result in sorted(results, key=lambda result: (result["row"], result["col"])):
+        position = (result["row"], result["col"])
+        if result["error"]:
+            raw_lines[position] = []
+            lines = [f"[タイル {position[0] + 1}-{position[1] + 1} の読み取りに失敗しました: {result['error']}]"]
+        else:
+            # 隣のタイルとの比較には重複を取り除く前の行を使う
+            lines = raw_lines[position] = [line.rstrip() for line in result["ocr_result"].strip().splitlines()]
+            upper = raw_lines.get((position[0] - 1, position[1]))
+            if upper:
+                lines = _drop_vertical_overlap(upper, lines)
+            left = raw_lines.get((position[0], position[1] - 1))
+            if left:
+                lines = _drop_horizontal_overlap(left, lines)
+        text = "\n".join(lines).strip()
+        if text:
+            rows.setdefault(position[0], []).append(text)
+    return "\n".join("\n".join(rows[row]) for row in sorted(rows))
+
+
+class TiledOCRProcessor:
+    """大きな画像をタイルに分割して並列にOCR処理するクラス"""
+
+    def __init__(self, model_name: str = None, max_workers: int = TILE_MAX_WORKERS,
+                 tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP, max_tiles: int = TILE_MAX_TILES,
+                 prompt_variant: str = None, structured: bool = False):
+        self.model_name = model_name
+        self.prompt_variant = prompt_variant
+        self.structured = structured
+        self.max_workers = max(1, max_workers)
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.max_tiles = max_tiles
+        self._local = threading.local()
+        # 直近の処理に関する情報（タイル数・失敗したタイル数など）
+        self.last_run_info: Dict = {}
+
+    def _get_processor(self):
+        # ocr_processor からタイル分割を呼び出すため、循環importを避けてここで読み込む
+        from ocr_processor import OCRProcessor
+
+        processor = getattr(self._local, "processor", None)
+        if processor is None:
+            processor = OCRProcessor(self.model_name, prompt_variant=self.prompt_variant,
+                                     structured=self.structured)
+            self._local.processor = processor
+        return processor
+
+    def _process_tile(self, tile: Dict, tile_image: Image.Image, language_hint: str,
+                      table_recognition: bool, precheck: Optional[bool]) -> Dict:
+        """1タイルを処理して結果を辞書で返す（例外は結果に格納）"""
+        result = {"row": tile["row"], "col": tile["col"], "box": tile["box"], "ocr_result": "",
+                  "confidence": 0.0, "error": None, "no_text": False, "structured": None}
+        try:
+            processor = self._get_processor()
+            result["ocr_result"], result["confidence"] = processor.process_image(
+                tile_image,
+                language_hint=language_hint,
+                auto_rotate=False,
+                table_recognition=table_recognition,
+                precheck=precheck
+            )
+            result["no_text"] = processor.last_run_info.get("no_text", False)
+            result["structured"] = processor.last_run_info.get("structured")
+        except Exception as e:
+            result["error"] = str(e)
+        finally:
+            tile_image.close()
+        return result
+
+    def process(self, image: Image.Image, language_hint: str = "日本語",
+                table_recognition: bool = False, precheck: Optional[bool] = None) -> Tuple[str, float]:
+        """
+        画像をタイルに分割して並列にOCR処理し、結合した結果を返す
+
+        向きの補正は分割前に済ませておくこと（タイルごとには補正しない）。
+        文字がなさそうなタイルはGemini APIを呼び出さずに空として扱う
+
+        Returns:
+            Tuple[str, float]: (結合した文字列, 文字数で重み付けした平均信頼度)
+        """
+        with stage("tile_split"):
+            scale, tiles = plan_tiles(image.width, image.height, self.tile_size, self.overlap, self.max_tiles)
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            if scale < 1.0:
+                image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                                     Image.LANCZOS)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tile-ocr") as executor:
+            # 処理段階の内訳（collect_trace）がワーカースレッドにも引き継がれるようにする
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._process_tile, tile,
+                                image.crop(tile["box"]), language_hint, table_recognition, precheck)
+                for tile in tiles
+            ]
+            results = [future.result() for future in futures]
+
+        failed = [result for result in results if result["error"]]
+        skipped = [result for result in results if result["no_text"]]
+        self.last_run_info = {"tiles": len(tiles), "tile_errors": len(failed), "tile_skipped": len(skipped),
+                              "tile_scale": scale}
+        if len(failed) == len(results):
+            raise Exception(f"すべてのタイルの読み取りに失敗しました: {failed[0]['error']}")
+        if len(skipped) == len(results):
+            return "", 0.0
+
+        if self.structured:
+            # 構造化出力はブロックの位置を画像全体の座標に直し、重なり部分の重複を位置で取り除く
+            with stage("tile_merge"):
+                structured = merge_tile_results(results, image.size)
+            self.last_run_info["structured"] = structured
+            return structured["text"], structured["confidence"]
+
+        with stage("tile_merge"):
+            text = merge_tile_texts(results)
+        # 文字がないと判定したタイルは信頼度の平均に含めない
+        weights = [(max(1, len(result["ocr_result"])), result["confidence"])
+                   for result in results if not result["error"] and not result["no_text"]]
+        if not weights:
+            return text, 0.0
+        confidence = sum(weight * value for weight, value in weights) / sum(weight for weight, _ in weights)
+        return text, confidence
@@ -0,0 +1,103 @@
+"""
+アップロードされたファイルの取り扱い
+バイト列の取得・内容ハッシュの計算・形式の判定を1回だけ行い、表示・OCR処理・履歴保存で
+同じバッファを共有する（画像のデコードも最初に必要になった1回だけ行う）
+"""
+import io
+from typing import Optional
+
+from PIL import Image
+
+from blob_store import hash_bytes
+from document_processor import is_multipage_document
+
+# 先頭のバイト列（マジックナンバー）と形式の対応
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+    (b"%PDF-", "PDF"),
+)
+
+_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "BMP": "image/bmp",
+    "TIFF": "image/tiff",
+    "WEBP": "image/webp",
+    "PDF": "application/pdf",
+}
+
+# ブラウザでそのまま表示できる形式（それ以外はデコードした画像を表示用に変換する）
+_BROWSER_FORMATS = ("JPEG", "PNG", "GIF", "WEBP")
+
+
+def detect_format(data) -> Optional[str]:
+    """
+    先頭のバイト列から形式を判定
+
+    Args:
+        data: ファイルのバイト列（bytes / memoryview、先頭16バイトがあればよい）
+
+    Returns:
+        Optional[str]: "JPEG" / "PNG" / "GIF" / "BMP" / "TIFF" / "WEBP" / "PDF"（判定できない場合はNone）
+    """
+    head = bytes(data[:16])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    for signature, image_format in _SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+
+class UploadedImage:
+    """
+    アップロードされた画像のハンドル
+
+    バイト列は1回だけ取得してmemoryviewで参照し、内容ハッシュと形式もこのときに求める。
+    PIL画像は最初に必要になったときに同じバッファから開き、以降は使い回す。
+    """
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self.data = data
+        self.view = memoryview(data)
+        self.size = len(data)
+        self.content_hash = hash_bytes(self.view)
+        self.format = detect_format(self.view)
+        self._image: Optional[Image.Image] = None
+        self._multipage: Optional[bool] = None
+
+    @classmethod
+    def from_upload(cls, uploaded_file) -> "UploadedImage":
+        """StreamlitのUploadedFileから作成（getvalueは内部のバッファを複製せずに返す）"""
+        return cls(uploaded_file.name, uploaded_file.getvalue())
+
+    @property
+    def mime_type(self) -> str:
+        """判定した形式のMIMEタイプ"""
+        return _MIME_TYPES.get(self.format, "application/octet-stream")
+
+    @property
+    def image(self) -> Image.Image:
+        """デコードしたPIL画像（同じバッファを読み込み、2回目以降は同じ画像を返す）"""
+        if self._image is None:
+            self._image = Image.open(io.BytesIO(self.data))
+        return self._image
+
+    @property
+    def display_source(self):
+        """st.image に渡す表示用のデータ（ブラウザで表示できる形式は再エンコードせずにバイト列のまま）"""
+        return self.data if self.format in _BROWSER_FORMATS else self.image
+
+    def is_multipage(self) -> bool:
+        """ページ単位で処理すべき文書（PDF・複数フレームの画像）か判定"""
+        if self._multipage is None:
+            self._multipage = is_multipage_document(self.name, self.data)
+        return self._multipage
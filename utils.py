@@ -1,14 +1,32 @@
 import json
+import logging
 import os
 from datetime import datetime
-from typing import Dict, List, Optional
-import streamlit as st
+from typing import Dict, List, Optional, Tuple, Union
 from PIL import Image
 import io
 import base64
 
-def validate_image_file(file) -> tuple[bool, str]:
-    """画像ファイルの検証を行う"""
+from blob_store import hash_bytes
+from config import DUPLICATE_DETECTION_ENABLED, DUPLICATE_MAX_DISTANCE
+from duplicate_index import get_duplicate_index, perceptual_hash_bytes
+from history_store import get_history_store
+from search_index import get_search_index
+from thumbnails import get_thumbnail_cache
+from uploads import UploadedImage
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+
+def _show_error(message: str):
+    """画面にエラーを表示（HTTP APIから使う場合にStreamlitを読み込まないよう、表示するときに読み込む）"""
+    import streamlit as st
+    st.error(message)
+
+
+def validate_image_file(file: Optional[UploadedImage]) -> tuple[bool, str]:
+    """画像ファイルの検証を行う（形式は拡張子だけでなく先頭のバイト列でも確認する）"""
     if file is None:
         return False, "ファイルが選択されていません"
     
@@ -17,12 +35,16 @@ def validate_image_file(file) -> tuple[bool, str]:
         return False, "ファイルサイズが10MBを超えています"
     
     # ファイル形式の検証
-    allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff']
+    allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.pdf']
     file_extension = os.path.splitext(file.name)[1].lower()
     
     if file_extension not in allowed_extensions:
         return False, f"サポートされていないファイル形式です: {file_extension}"
     
+    # 拡張子が正しくても中身が画像・PDFでなければ受け付けない
+    if file.format is None:
+        return False, "画像ファイルとして認識できません（ファイルの内容が壊れているか、形式が異なります）"
+    
     return True, "ファイルが正常です"
 
 def image_to_base64(image: Image.Image) -> str:
@@ -32,73 +54,182 @@ def image_to_base64(image: Image.Image) -> str:
     img_str = base64.b64encode(buffered.getvalue()).decode()
     return img_str
 
-def save_to_history(image_name: str, image_data: str, ocr_result: str, confidence: float = 0.0):
-    """OCR結果を履歴に保存"""
-    history_file = "ocr_history.json"
+def save_to_history(image_name: str, image_data: Union[bytes, str], ocr_result: str, confidence: float = 0.0,
+                    item_id: Optional[str] = None, perceptual_hash: Optional[int] = None):
+    """
+    OCR結果を履歴に保存（item_idを省略した場合は新しいIDを割り当てる）
     
-    # 既存の履歴を読み込み
-    history = []
-    if os.path.exists(history_file):
-        try:
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        except:
-            history = []
+    画像はblobストアに内容ハッシュごとに1回だけ保存され、履歴には内容ハッシュだけが記録される
     
-    # 新しい履歴項目を追加
+    Args:
+        image_data: 画像のバイト列（base64文字列も可）
+        perceptual_hash: 計算済みの知覚ハッシュ（省略時は画像から計算）
+    """
+    # 新しい履歴項目を作成
     import uuid
     new_item = {
-        "id": str(uuid.uuid4()),
+        "id": item_id or str(uuid.uuid4()),
         "timestamp": datetime.now().isoformat(),
         "image_name": image_name,
-        "image_data": image_data,
         "ocr_result": ocr_result,
         "confidence": confidence
     }
+    image_bytes = base64.b64decode(image_data) if isinstance(image_data, str) else bytes(image_data)
     
-    history.append(new_item)
+    # 履歴ページ用のサムネイルを保存時に一度だけ生成
+    if image_bytes:
+        with stage("history_thumbnail"):
+            new_item["image_hash"] = hash_bytes(image_bytes)
+            thumbnails = get_thumbnail_cache()
+            if thumbnails.get(new_item["image_hash"]) is None:
+                thumbnails.put(new_item["image_hash"], image_bytes)
     
-    # 履歴の最大数を制限
-    if len(history) > 100:
-        history = history[-100:]
-    
-    # 履歴を保存
+    # 履歴を保存（上限を超えて削除された項目は各インデックスからも取り除く）
     try:
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        with stage("history_write"):
+            removed_ids = get_history_store().add(new_item, image_bytes or None)
         print(f"履歴を保存しました: {new_item['id']}")  # デバッグ用
-        return True
     except Exception as e:
         print(f"履歴の保存に失敗しました: {e}")  # デバッグ用
         return False
+    
+    # 検索インデックスを更新（失敗しても保存自体は成功扱い）
+    try:
+        with stage("search_index_update"):
+            index = get_search_index()
+            index.add(new_item)
+            index.remove_many(removed_ids)
+    except Exception as e:
+        logger.warning("検索インデックスの更新に失敗しました: %s", e)
+    
+    # 似た画像の検出用に知覚ハッシュを登録（失敗しても保存自体は成功扱い）
+    if DUPLICATE_DETECTION_ENABLED and (image_bytes or removed_ids):
+        try:
+            with stage("duplicate_index_update"):
+                index = get_duplicate_index()
+                if perceptual_hash is None and image_bytes:
+                    perceptual_hash = perceptual_hash_bytes(image_bytes)
+                if perceptual_hash is not None:
+                    index.add(new_item["id"], perceptual_hash)
+                index.remove_many(removed_ids)
+        except Exception as e:
+            logger.warning("似た画像のインデックスの更新に失敗しました: %s", e)
+    return True
+
+def find_similar_history(perceptual_hash: Optional[int], max_distance: int = DUPLICATE_MAX_DISTANCE,
+                         limit: int = 1) -> List[Dict]:
+    """
+    知覚ハッシュが近い（同じ文書を再スキャン・再撮影したとみられる）履歴項目を距離の近い順に取得
+    
+    結果の各項目には distance（64ビット中の異なるビット数）を含む
+    """
+    if not DUPLICATE_DETECTION_ENABLED or perceptual_hash is None:
+        return []
+    try:
+        with stage("duplicate_lookup"):
+            matches = get_duplicate_index().find(perceptual_hash, max_distance, limit)
+        if not matches:
+            return []
+        items = {item["id"]: item for item in get_history_store().get_items(
+            [item_id for item_id, _ in matches], include_images=False)}
+        return [dict(items[item_id], distance=distance) for item_id, distance in matches if item_id in items]
+    except Exception as e:
+        logger.warning("似た画像の検索に失敗しました: %s", e)
+        return []
 
 def load_history() -> List[Dict]:
     """履歴を読み込み"""
-    history_file = "ocr_history.json"
-    
-    if not os.path.exists(history_file):
+    try:
+        return get_history_store().load_all()
+    except Exception as e:
+        _show_error(f"履歴の読み込みに失敗しました: {e}")
         return []
-    
+
+def load_history_page(offset: int = 0, limit: int = 20, newest_first: bool = True,
+                      include_images: bool = True, after: Optional[Dict] = None) -> List[Dict]:
+    """履歴を1ページ分読み込み（afterは前のページの最後の項目。指定するとその次から読み込む）"""
     try:
-        with open(history_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return get_history_store().load_page(offset, limit, newest_first, include_images, after)
     except Exception as e:
-        st.error(f"履歴の読み込みに失敗しました: {e}")
+        _show_error(f"履歴の読み込みに失敗しました: {e}")
         return []
 
-def delete_history_item(item_id: int) -> bool:
+def get_history_items(item_ids: List[str], include_images: bool = True) -> List[Dict]:
+    """指定したIDの履歴項目を読み込み"""
+    try:
+        return get_history_store().get_items(item_ids, include_images)
+    except Exception as e:
+        _show_error(f"履歴の読み込みに失敗しました: {e}")
+        return []
+
+def load_history_image(item_id: str) -> Optional[bytes]:
+    """履歴項目の元画像を読み込み"""
+    try:
+        return get_history_store().load_image(item_id)
+    except Exception as e:
+        _show_error(f"画像の読み込みに失敗しました: {e}")
+        return None
+
+def get_history_thumbnail(item: Dict) -> Optional[bytes]:
+    """履歴項目のサムネイルを取得（旧形式の履歴は初回表示時に生成）"""
+    key = item.get("image_hash") or item["id"]
+    return get_thumbnail_cache().get_or_create(key, lambda: get_history_store().load_image(item["id"]))
+
+def search_history(query: str, offset: int = 0, limit: int = 20, order: str = "rank",
+                   after: Optional[Dict] = None) -> Tuple[int, List[Dict]]:
+    """履歴を全文検索（ヒット件数と結果を返す。afterは前のページの最後の結果）"""
+    try:
+        return get_search_index().search(query, offset, limit, order, after)
+    except Exception as e:
+        _show_error(f"履歴の検索に失敗しました: {e}")
+        return 0, []
+
+def count_history() -> int:
+    """履歴の件数を取得"""
+    try:
+        return get_history_store().count()
+    except Exception:
+        return 0
+
+def delete_history_item(item_id: str) -> bool:
     """履歴項目を削除"""
-    history = load_history()
-    history = [item for item in history if item["id"] != item_id]
-    
     try:
-        with open("ocr_history.json", 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        get_history_store().delete(item_id)
+        get_search_index().remove(item_id)
+        get_duplicate_index().remove(item_id)
+        return True
+    except Exception as e:
+        _show_error(f"履歴の削除に失敗しました: {e}")
+        return False
+
+def clear_history() -> bool:
+    """全履歴を削除"""
+    try:
+        get_history_store().clear()
+        get_search_index().clear()
+        get_duplicate_index().clear()
+        get_thumbnail_cache().clear()
         return True
     except Exception as e:
-        st.error(f"履歴の削除に失敗しました: {e}")
+        _show_error(f"履歴の削除に失敗しました: {e}")
         return False
 
+def get_image_store_stats() -> Dict:
+    """履歴画像のblobストアの使用状況（画像数・合計サイズ・参照数）"""
+    try:
+        return get_history_store().blobs.stats()
+    except Exception:
+        return {"blobs": 0, "bytes": 0, "refs": 0}
+
+def collect_image_garbage() -> Optional[int]:
+    """どの履歴からも参照されていない画像をblobストアから削除（削除した件数を返す）"""
+    try:
+        store = get_history_store()
+        return store.blobs.collect_garbage(store.image_references())
+    except Exception as e:
+        _show_error(f"画像の整理に失敗しました: {e}")
+        return None
+
 def format_timestamp(timestamp_str: str) -> str:
     """タイムスタンプを読みやすい形式に変換"""
     try: